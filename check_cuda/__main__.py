@@ -1,3 +1,5 @@
-from .main import main
+import sys
 
-main()
\ No newline at end of file
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,664 @@
+import ctypes
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Environment variables selecting the device backend
+BACKEND_ENV = "CHECK_CUDA_BACKEND"    # "nvml" (default) or "sim"
+SIM_GPUS_ENV = "CHECK_CUDA_SIM_GPUS"
+SIM_HISTORY_ENV = "CHECK_CUDA_SIM_HISTORY"    # folder written by recorder.BinaryRecorder to replay
+
+
+_NOT_LOADED = object()
+
+
+class BackendProxy:
+    """
+    Stand-in for a backend module. Attribute access is forwarded to the backend, which is created on first use
+    by ``factory`` unless one was installed with set(). A factory result of None, e.g. no libcuda, is kept too:
+    the library is looked up once per process.
+    """
+
+    def __init__(self, factory: Callable[[], Any]) -> None:
+        self.__factory = factory
+        self.__backend = _NOT_LOADED
+        self.__lock = threading.Lock()
+
+    def get(self) -> Any:
+        if self.__backend is _NOT_LOADED:
+            with self.__lock:
+                if self.__backend is _NOT_LOADED:
+                    self.__backend = self.__factory()
+        return self.__backend
+
+    def set(self, backend: Any) -> None:
+        self.__backend = backend
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# Simulated devices
+
+
+class SimulatedNVMLError(Exception):
+    def __init__(self, value: int) -> None:
+        self.value = value
+        super().__init__(value)
+
+    def __str__(self) -> str:
+        return {
+            SimulatedNvml.NVML_ERROR_NOT_SUPPORTED: "Not Supported",
+            SimulatedNvml.NVML_ERROR_NOT_FOUND: "Not Found",
+            SimulatedNvml.NVML_ERROR_GPU_IS_LOST: "GPU is lost",
+            SimulatedNvml.NVML_ERROR_TIMEOUT: "Timeout",
+        }.get(self.value, "Unknown Error")
+
+
+class _Record:
+    """
+    Plain attribute holder mimicking the pynvml result structures
+    """
+
+    def __init__(self, **kwargs) -> None:
+        self.__dict__.update(kwargs)
+
+
+class SimulatedGpu:
+    """
+    Counters of one simulated GPU. They follow a bounded random walk, or replay recorded values when ``replay``
+    holds arrays per GpuStatus metric.
+    """
+
+    def __init__(self, index: int, rng: random.Random, memory_total_mib: int = 16384,
+                 replay: Optional[Dict[str, Any]] = None) -> None:
+        self.index = index
+        self.name = "Simulated GPU"
+        self.uuid = "GPU-%08x-0000-0000-0000-%012x" % (index, rng.getrandbits(48))
+        self.memory_total = memory_total_mib * MB
+        self.compute_capability = (8, 6)
+        self.multiprocessor_count = 80
+        self.clock_rate_khz = 1_700_000
+        self.memory_clock_rate_khz = 9_501_000
+        self.utilization_gpu = rng.uniform(0, 60)
+        self.utilization_memory = rng.uniform(0, 40)
+        self.utilization_enc = rng.uniform(0, 20)
+        self.utilization_dec = rng.uniform(0, 60)
+        self.memory_used = rng.uniform(0.1, 0.5) * self.memory_total
+        self.temperature = rng.uniform(35, 70)
+        self.fan_speed = rng.uniform(30, 60)
+        self.power_limit_mw = 250_000
+        self.power_draw_mw = rng.uniform(0.2, 0.8) * self.power_limit_mw
+        self.performance_state = 2
+        self.throttle_reasons = 0
+        # sampling type -> driver sample buffer of (timestamp in us, value), see get_samples()
+        self.sample_buffers: Dict[int, List[Tuple[int, float]]] = {}
+        # (event type, event data) not yet delivered to an event set
+        self.pending_events: List[Tuple[int, int]] = []
+        self.processes: List[_Record] = []
+        self.replay = replay
+        self.replay_position = 0
+
+    def step(self, rng: random.Random) -> None:
+        if self.replay:
+            self.__replay_step()
+            return
+
+        def walk(value, low, high, scale):
+            return min(max(value + rng.gauss(0, scale), low), high)
+
+        self.utilization_gpu = walk(self.utilization_gpu, 0, 100, 5)
+        self.utilization_memory = walk(self.utilization_memory, 0, 100, 3)
+        self.utilization_enc = walk(self.utilization_enc, 0, 100, 2)
+        self.utilization_dec = walk(self.utilization_dec, 0, 100, 5)
+        self.memory_used = walk(self.memory_used, 0, self.memory_total, self.memory_total * 0.01)
+        self.temperature = walk(self.temperature, 25, 95, 0.5)
+        self.fan_speed = walk(self.fan_speed, 0, 100, 1)
+        self.power_draw_mw = walk(self.power_draw_mw, 20_000, self.power_limit_mw, 5_000)
+        self.update_clock_state()
+
+    # The driver keeps about this many samples per type, one every SAMPLE_PERIOD_US
+    SAMPLE_BUFFER_SIZE = 120
+    SAMPLE_PERIOD_US = 166_667
+
+    def get_sample_value(self, sampling_type: int) -> float:
+        return {
+            SimulatedNvml.NVML_TOTAL_POWER_SAMPLES: self.power_draw_mw,
+            SimulatedNvml.NVML_GPU_UTILIZATION_SAMPLES: self.utilization_gpu,
+            SimulatedNvml.NVML_MEMORY_UTILIZATION_SAMPLES: self.utilization_memory,
+            SimulatedNvml.NVML_ENC_UTILIZATION_SAMPLES: self.utilization_enc,
+            SimulatedNvml.NVML_DEC_UTILIZATION_SAMPLES: self.utilization_dec,
+            SimulatedNvml.NVML_PROCESSOR_CLK_SAMPLES: self.clock_rate_khz / 1000,
+            SimulatedNvml.NVML_MEMORY_CLK_SAMPLES: self.memory_clock_rate_khz / 1000,
+        }[sampling_type]
+
+    def get_samples(self, sampling_type: int, rng: random.Random) -> List[Tuple[int, float]]:
+        """
+        Fill the sample buffer of ``sampling_type`` up to now with noisy copies of the current value
+        """
+        buffer = self.sample_buffers.setdefault(sampling_type, [])
+        now_us = int(time.time() * 1_000_000)
+        next_us = buffer[-1][0] + self.SAMPLE_PERIOD_US if buffer else now_us - self.SAMPLE_PERIOD_US
+        value = self.get_sample_value(sampling_type)
+        while next_us <= now_us:
+            buffer.append((next_us, max(value * rng.uniform(0.8, 1.2), 0.0)))
+            next_us += self.SAMPLE_PERIOD_US
+        del buffer[:-self.SAMPLE_BUFFER_SIZE]
+        return buffer
+
+    def update_clock_state(self) -> None:
+        """
+        Performance state and throttle reasons following utilization, power and temperature
+        """
+        self.performance_state = 0 if self.utilization_gpu >= 50 else (2 if self.utilization_gpu >= 5 else 8)
+        reasons = 0
+        if self.utilization_gpu < 5:
+            reasons |= SimulatedNvml.nvmlClocksThrottleReasonGpuIdle
+        if self.power_draw_mw >= 0.97 * self.power_limit_mw:
+            reasons |= SimulatedNvml.nvmlClocksThrottleReasonSwPowerCap
+        if self.temperature >= 85:
+            reasons |= SimulatedNvml.nvmlClocksThrottleReasonSwThermalSlowdown
+        self.throttle_reasons = reasons
+
+    def __replay_step(self) -> None:
+        timestamps = self.replay.get("timestamp")
+        if timestamps is None or not len(timestamps):
+            return
+        position = self.replay_position % len(timestamps)
+        self.replay_position += 1
+
+        def value(metric, default):
+            values = self.replay.get(f"gpu{self.index}.{metric}")
+            if values is None or values[position] != values[position]:    # missing or NaN
+                return default
+            return float(values[position])
+
+        self.utilization_gpu = value("utilization_gpu", self.utilization_gpu)
+        self.utilization_enc = value("utilization_enc", self.utilization_enc)
+        self.utilization_dec = value("utilization_dec", self.utilization_dec)
+        self.memory_used = value("memory_used", self.memory_used / MB) * MB
+        self.temperature = value("temperature", self.temperature)
+        self.power_draw_mw = value("power_draw", self.power_draw_mw / 1000) * 1000
+        self.update_clock_state()
+
+
+class Simulation:
+    """
+    A set of simulated GPUs shared by SimulatedNvml and SimulatedCuda.
+
+    Faults: every device call fails with probability ``error_rate``, takes ``latency_sec``, and hangs for
+    ``hang_sec`` on the GPUs listed in ``hung_gpus``. Queries named in ``unsupported`` (e.g. "fan_speed") fail with
+    NVML_ERROR_NOT_SUPPORTED. GPU processes are taken from the real process table so that psutil can resolve them,
+    every step replaces a process with probability ``churn_rate``. Every step raises an XID or ECC event on a GPU
+    with probability ``event_rate``, inject_event() raises one on demand.
+    """
+
+    def __init__(self,
+                 number_of_gpus: int = 4,
+                 seed: Optional[int] = None,
+                 step_sec: float = 0.1,
+                 processes_per_gpu: int = 2,
+                 churn_rate: float = 0.05,
+                 error_rate: float = 0.0,
+                 latency_sec: float = 0.0,
+                 hung_gpus: Optional[Set[int]] = None,
+                 hang_sec: float = 30.0,
+                 unsupported: Optional[Set[str]] = None,
+                 history: Optional[Dict[str, Any]] = None,
+                 event_rate: float = 0.0) -> None:
+        self.rng = random.Random(seed)
+        self.step_sec = step_sec
+        self.processes_per_gpu = processes_per_gpu
+        self.churn_rate = churn_rate
+        self.error_rate = error_rate
+        self.latency_sec = latency_sec
+        self.hung_gpus = hung_gpus or set()
+        self.hang_sec = hang_sec
+        self.unsupported = unsupported or set()
+        self.event_rate = event_rate
+        self.lock = threading.Lock()
+        self.gpus = [SimulatedGpu(i, self.rng, replay=history) for i in range(number_of_gpus)]
+        self.__last_step = 0.0
+        self.calls = 0
+
+    def __get_pids(self) -> List[int]:
+        try:
+            import psutil
+            return psutil.pids()
+        except ImportError:
+            return [os.getpid()]
+
+    def __churn_processes(self, gpu: SimulatedGpu, pids: List[int]) -> None:
+        if len(gpu.processes) < self.processes_per_gpu or (gpu.processes and self.rng.random() < self.churn_rate):
+            if len(gpu.processes) >= self.processes_per_gpu:
+                gpu.processes.pop(self.rng.randrange(len(gpu.processes)))
+            gpu.processes.append(
+                _Record(pid=self.rng.choice(pids), usedGpuMemory=int(self.rng.uniform(0.01, 0.1) * gpu.memory_total)))
+
+    def step(self) -> None:
+        """
+        Advance the counters when ``step_sec`` has passed since the last step
+        """
+        now = time.monotonic()
+        with self.lock:
+            if now - self.__last_step < self.step_sec:
+                return
+            self.__last_step = now
+            pids = self.__get_pids() if self.processes_per_gpu else []
+            for gpu in self.gpus:
+                gpu.step(self.rng)
+                if pids:
+                    self.__churn_processes(gpu, pids)
+                if self.event_rate and self.rng.random() < self.event_rate:
+                    gpu.pending_events.append(
+                        self.rng.choice(((SimulatedNvml.nvmlEventTypeXidCriticalError, self.rng.choice((13, 31, 43))),
+                                         (SimulatedNvml.nvmlEventTypeSingleBitEccError, 0),
+                                         (SimulatedNvml.nvmlEventTypeDoubleBitEccError, 0))))
+
+    def inject_event(self, index: int, event_type: int, event_data: int = 0) -> None:
+        with self.lock:
+            self.gpus[index].pending_events.append((event_type, event_data))
+
+    def call(self, gpu: Optional[SimulatedGpu], name: str) -> None:
+        """
+        Apply the configured faults to one device call
+        """
+        self.calls += 1
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        if gpu is not None and gpu.index in self.hung_gpus:
+            time.sleep(self.hang_sec)
+            raise SimulatedNVMLError(SimulatedNvml.NVML_ERROR_GPU_IS_LOST)
+        if name in self.unsupported:
+            raise SimulatedNVMLError(SimulatedNvml.NVML_ERROR_NOT_SUPPORTED)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise SimulatedNVMLError(SimulatedNvml.NVML_ERROR_UNKNOWN)
+        self.step()
+
+
+class SimulatedNvml:
+    """
+    The subset of the pynvml API used by check_cuda, backed by a Simulation
+    """
+    NVMLError = SimulatedNVMLError
+    NVML_SUCCESS = 0
+    NVML_ERROR_NOT_SUPPORTED = 3
+    NVML_ERROR_NOT_FOUND = 6
+    NVML_ERROR_TIMEOUT = 10
+    NVML_ERROR_GPU_IS_LOST = 15
+    NVML_ERROR_UNKNOWN = 999
+    NVML_TEMPERATURE_GPU = 0
+    NVML_VALUE_TYPE_DOUBLE = 0
+    NVML_VALUE_TYPE_UNSIGNED_INT = 1
+    NVML_VALUE_TYPE_UNSIGNED_LONG = 2
+    NVML_VALUE_TYPE_UNSIGNED_LONG_LONG = 3
+    NVML_VALUE_TYPE_SIGNED_LONG_LONG = 4
+    NVML_FI_DEV_POWER_INSTANT = 186
+    NVML_FI_DEV_POWER_CURRENT_LIMIT = 189
+    NVML_TOTAL_POWER_SAMPLES = 0
+    NVML_GPU_UTILIZATION_SAMPLES = 1
+    NVML_MEMORY_UTILIZATION_SAMPLES = 2
+    NVML_ENC_UTILIZATION_SAMPLES = 3
+    NVML_DEC_UTILIZATION_SAMPLES = 4
+    NVML_PROCESSOR_CLK_SAMPLES = 5
+    NVML_MEMORY_CLK_SAMPLES = 6
+    nvmlEventTypeSingleBitEccError = 0x0001
+    nvmlEventTypeDoubleBitEccError = 0x0002
+    nvmlEventTypePState = 0x0004
+    nvmlEventTypeXidCriticalError = 0x0008
+    nvmlEventTypeClock = 0x0010
+    nvmlEventTypePowerSourceChange = 0x0080
+    nvmlClocksThrottleReasonGpuIdle = 0x0001
+    nvmlClocksThrottleReasonApplicationsClocksSetting = 0x0002
+    nvmlClocksThrottleReasonSwPowerCap = 0x0004
+    nvmlClocksThrottleReasonHwSlowdown = 0x0008
+    nvmlClocksThrottleReasonSyncBoost = 0x0010
+    nvmlClocksThrottleReasonSwThermalSlowdown = 0x0020
+    nvmlClocksThrottleReasonHwThermalSlowdown = 0x0040
+    nvmlClocksThrottleReasonHwPowerBrakeSlowdown = 0x0080
+    nvmlClocksThrottleReasonDisplayClockSetting = 0x0100
+    # How often nvmlEventSetWait_v2 looks for pending events
+    EVENT_POLL_SEC = 0.01
+
+    def __init__(self, simulation: Simulation) -> None:
+        self.simulation = simulation
+
+    def nvmlInit(self) -> None:
+        self.simulation.call(None, "init")
+
+    def nvmlShutdown(self) -> None:
+        pass
+
+    def nvmlSystemGetDriverVersion(self) -> str:
+        return "535.104.05"
+
+    def nvmlDeviceGetCount(self) -> int:
+        return len(self.simulation.gpus)
+
+    def nvmlDeviceGetHandleByIndex(self, index: int) -> SimulatedGpu:
+        if index >= len(self.simulation.gpus):
+            raise SimulatedNVMLError(self.NVML_ERROR_UNKNOWN)
+        return self.simulation.gpus[index]
+
+    def nvmlDeviceGetName(self, handle: SimulatedGpu) -> str:
+        self.simulation.call(handle, "name")
+        return handle.name
+
+    def nvmlDeviceGetUUID(self, handle: SimulatedGpu) -> str:
+        self.simulation.call(handle, "uuid")
+        return handle.uuid
+
+    def nvmlDeviceGetMemoryInfo(self, handle: SimulatedGpu) -> _Record:
+        self.simulation.call(handle, "memory")
+        used = int(handle.memory_used)
+        return _Record(total=handle.memory_total, used=used, free=handle.memory_total - used)
+
+    def nvmlDeviceGetTemperature(self, handle: SimulatedGpu, sensor: int) -> int:
+        self.simulation.call(handle, "temperature")
+        return int(handle.temperature)
+
+    def nvmlDeviceGetFanSpeed(self, handle: SimulatedGpu) -> int:
+        self.simulation.call(handle, "fan_speed")
+        return int(handle.fan_speed)
+
+    def nvmlDeviceGetUtilizationRates(self, handle: SimulatedGpu) -> _Record:
+        self.simulation.call(handle, "utilization")
+        return _Record(gpu=int(handle.utilization_gpu), memory=int(handle.utilization_memory))
+
+    def nvmlDeviceGetEncoderUtilization(self, handle: SimulatedGpu) -> List[int]:
+        self.simulation.call(handle, "utilization_enc")
+        return [int(handle.utilization_enc), 167000]
+
+    def nvmlDeviceGetDecoderUtilization(self, handle: SimulatedGpu) -> List[int]:
+        self.simulation.call(handle, "utilization_dec")
+        return [int(handle.utilization_dec), 167000]
+
+    def nvmlDeviceGetPowerUsage(self, handle: SimulatedGpu) -> int:
+        self.simulation.call(handle, "power_usage")
+        return int(handle.power_draw_mw)
+
+    def nvmlDeviceGetEnforcedPowerLimit(self, handle: SimulatedGpu) -> int:
+        self.simulation.call(handle, "enforced_power_limit")
+        return int(handle.power_limit_mw)
+
+    def nvmlDeviceGetFieldValues(self, handle: SimulatedGpu, field_ids: List[int]) -> List[_Record]:
+        self.simulation.call(handle, "field_values")
+        values = []
+        for field_id in field_ids:
+            value = {
+                self.NVML_FI_DEV_POWER_INSTANT: handle.power_draw_mw,
+                self.NVML_FI_DEV_POWER_CURRENT_LIMIT: handle.power_limit_mw,
+            }.get(field_id)
+            values.append(
+                _Record(fieldId=field_id,
+                        nvmlReturn=self.NVML_SUCCESS if value is not None else self.NVML_ERROR_NOT_SUPPORTED,
+                        valueType=self.NVML_VALUE_TYPE_UNSIGNED_INT,
+                        value=_Record(uiVal=int(value or 0))))
+        return values
+
+    def nvmlDeviceGetComputeRunningProcesses(self, handle: SimulatedGpu) -> List[_Record]:
+        self.simulation.call(handle, "compute_processes")
+        return list(handle.processes)
+
+    def nvmlDeviceGetGraphicsRunningProcesses(self, handle: SimulatedGpu) -> List[_Record]:
+        self.simulation.call(handle, "graphics_processes")
+        return []
+
+    def nvmlDeviceGetSamples(self, handle: SimulatedGpu, sampling_type: int,
+                             last_seen_timestamp: int) -> Tuple[int, List[_Record]]:
+        self.simulation.call(handle, "samples")
+        with self.simulation.lock:
+            samples = [(t, v) for t, v in handle.get_samples(sampling_type, self.simulation.rng)
+                       if t > last_seen_timestamp]
+        if not samples:
+            raise SimulatedNVMLError(self.NVML_ERROR_NOT_FOUND)
+        return self.NVML_VALUE_TYPE_UNSIGNED_INT, [
+            _Record(timeStamp=t, sampleValue=_Record(uiVal=int(v))) for t, v in samples
+        ]
+
+    def nvmlDeviceGetProcessUtilization(self, handle: SimulatedGpu, last_seen_timestamp: int) -> List[_Record]:
+        """
+        One sample per GPU process, the device utilization split in proportion to their memory use
+        """
+        self.simulation.call(handle, "process_utilization")
+        now_us = int(time.time() * 1_000_000)
+        total = sum(p.usedGpuMemory for p in handle.processes)
+        if not total or now_us <= last_seen_timestamp:
+            raise SimulatedNVMLError(self.NVML_ERROR_NOT_FOUND)
+        samples = []
+        for process in handle.processes:
+            share = process.usedGpuMemory / total
+            samples.append(
+                _Record(pid=process.pid,
+                        timeStamp=now_us,
+                        smUtil=int(handle.utilization_gpu * share),
+                        memUtil=int(handle.utilization_memory * share),
+                        encUtil=int(handle.utilization_enc * share),
+                        decUtil=int(handle.utilization_dec * share)))
+        return samples
+
+    def nvmlDeviceGetIndex(self, handle: SimulatedGpu) -> int:
+        return handle.index
+
+    def nvmlDeviceGetPerformanceState(self, handle: SimulatedGpu) -> int:
+        self.simulation.call(handle, "performance_state")
+        return handle.performance_state
+
+    def nvmlDeviceGetCurrentClocksThrottleReasons(self, handle: SimulatedGpu) -> int:
+        self.simulation.call(handle, "throttle_reasons")
+        return handle.throttle_reasons
+
+    def nvmlDeviceGetSupportedEventTypes(self, handle: SimulatedGpu) -> int:
+        self.simulation.call(handle, "supported_event_types")
+        return (self.nvmlEventTypeSingleBitEccError | self.nvmlEventTypeDoubleBitEccError
+                | self.nvmlEventTypeXidCriticalError | self.nvmlEventTypePState | self.nvmlEventTypeClock)
+
+    def nvmlEventSetCreate(self) -> Dict[int, int]:
+        # GPU index -> registered event type mask
+        return {}
+
+    def nvmlDeviceRegisterEvents(self, handle: SimulatedGpu, event_types: int, event_set: Dict[int, int]) -> None:
+        self.simulation.call(handle, "register_events")
+        event_set[handle.index] = event_set.get(handle.index, 0) | event_types
+
+    def nvmlEventSetWait_v2(self, event_set: Dict[int, int], timeout_ms: int) -> _Record:
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        while True:
+            self.simulation.step()
+            with self.simulation.lock:
+                for index, mask in event_set.items():
+                    gpu = self.simulation.gpus[index]
+                    while gpu.pending_events:
+                        event_type, event_data = gpu.pending_events.pop(0)
+                        if event_type & mask:
+                            return _Record(device=gpu, eventType=event_type, eventData=event_data,
+                                           gpuInstanceId=0xFFFFFFFF, computeInstanceId=0xFFFFFFFF)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SimulatedNVMLError(self.NVML_ERROR_TIMEOUT)
+            time.sleep(min(self.EVENT_POLL_SEC, remaining))
+
+    def nvmlEventSetFree(self, event_set: Dict[int, int]) -> None:
+        event_set.clear()
+
+
+def _set_ref(ref, value) -> None:
+    ref._obj.value = value
+
+
+class SimulatedCuda:
+    """
+    The subset of the CUDA driver API used by GpuInfoFromCudaLib, with ctypes compatible arguments
+    """
+    CUDA_SUCCESS = 0
+    CUDA_ERROR_INVALID_VALUE = 1
+    CUDA_ERROR_INVALID_DEVICE = 101
+
+    def __init__(self, simulation: Simulation) -> None:
+        self.simulation = simulation
+        self.__context_device: Optional[int] = None
+        self.contexts_created = 0
+
+    def __get_gpu(self, device) -> Optional[SimulatedGpu]:
+        index = device.value if hasattr(device, "value") else int(device)
+        if 0 <= index < len(self.simulation.gpus):
+            return self.simulation.gpus[index]
+        return None
+
+    def cuInit(self, flags) -> int:
+        return self.CUDA_SUCCESS
+
+    def cuGetErrorString(self, result, error_str_ref) -> int:
+        _set_ref(error_str_ref, b"simulated error %d" % int(result))
+        return self.CUDA_SUCCESS
+
+    def cuDeviceGetCount(self, count_ref) -> int:
+        _set_ref(count_ref, len(self.simulation.gpus))
+        return self.CUDA_SUCCESS
+
+    def cuDeviceGet(self, device_ref, ordinal) -> int:
+        if self.__get_gpu(ordinal) is None:
+            return self.CUDA_ERROR_INVALID_DEVICE
+        _set_ref(device_ref, int(ordinal))
+        return self.CUDA_SUCCESS
+
+    def cuDeviceGetName(self, buffer, length, device) -> int:
+        gpu = self.__get_gpu(device)
+        if gpu is None:
+            return self.CUDA_ERROR_INVALID_DEVICE
+        name = gpu.name.encode()[:int(length) - 1] + b"\0"
+        ctypes.memmove(buffer, name, len(name))
+        return self.CUDA_SUCCESS
+
+    def cuDeviceComputeCapability(self, major_ref, minor_ref, device) -> int:
+        gpu = self.__get_gpu(device)
+        if gpu is None:
+            return self.CUDA_ERROR_INVALID_DEVICE
+        _set_ref(major_ref, gpu.compute_capability[0])
+        _set_ref(minor_ref, gpu.compute_capability[1])
+        return self.CUDA_SUCCESS
+
+    def cuDeviceGetAttribute(self, value_ref, attribute, device) -> int:
+        gpu = self.__get_gpu(device)
+        if gpu is None:
+            return self.CUDA_ERROR_INVALID_DEVICE
+        value = {
+            13: gpu.clock_rate_khz,    # CU_DEVICE_ATTRIBUTE_CLOCK_RATE
+            16: gpu.multiprocessor_count,    # CU_DEVICE_ATTRIBUTE_MULTIPROCESSOR_COUNT
+            36: gpu.memory_clock_rate_khz,    # CU_DEVICE_ATTRIBUTE_MEMORY_CLOCK_RATE
+            39: 1536,    # CU_DEVICE_ATTRIBUTE_MAX_THREADS_PER_MULTIPROCESSOR
+            75: gpu.compute_capability[0],    # CU_DEVICE_ATTRIBUTE_COMPUTE_CAPABILITY_MAJOR
+            76: gpu.compute_capability[1],    # CU_DEVICE_ATTRIBUTE_COMPUTE_CAPABILITY_MINOR
+        }.get(int(attribute))
+        if value is None:
+            return self.CUDA_ERROR_INVALID_VALUE
+        _set_ref(value_ref, value)
+        return self.CUDA_SUCCESS
+
+    def cuDeviceTotalMem_v2(self, bytes_ref, device) -> int:
+        gpu = self.__get_gpu(device)
+        if gpu is None:
+            return self.CUDA_ERROR_INVALID_DEVICE
+        _set_ref(bytes_ref, gpu.memory_total)
+        return self.CUDA_SUCCESS
+
+    cuDeviceTotalMem = cuDeviceTotalMem_v2
+
+    def cuDeviceGetUuid(self, uuid_buffer, device) -> int:
+        gpu = self.__get_gpu(device)
+        if gpu is None:
+            return self.CUDA_ERROR_INVALID_DEVICE
+        ctypes.memmove(uuid_buffer, bytes.fromhex(gpu.uuid[len("GPU-"):].replace("-", "")), 16)
+        return self.CUDA_SUCCESS
+
+    cuDeviceGetUuid_v2 = cuDeviceGetUuid
+
+    def cuCtxCreate(self, context_ref, flags, device) -> int:
+        gpu = self.__get_gpu(device)
+        if gpu is None:
+            return self.CUDA_ERROR_INVALID_DEVICE
+        self.__context_device = gpu.index
+        self.contexts_created += 1
+        return self.CUDA_SUCCESS
+
+    def cuCtxDetach(self, context) -> int:
+        self.__context_device = None
+        return self.CUDA_SUCCESS
+
+    def cuMemGetInfo(self, free_ref, total_ref) -> int:
+        if self.__context_device is None:
+            return self.CUDA_ERROR_INVALID_VALUE
+        gpu = self.simulation.gpus[self.__context_device]
+        _set_ref(free_ref, int(gpu.memory_total - gpu.memory_used))
+        _set_ref(total_ref, gpu.memory_total)
+        return self.CUDA_SUCCESS
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# Backend selection
+
+__simulation: Optional[Simulation] = None
+
+
+def get_simulation() -> Simulation:
+    """
+    Simulation used when CHECK_CUDA_BACKEND=sim, CHECK_CUDA_SIM_GPUS sets the number of GPUs and
+    CHECK_CUDA_SIM_HISTORY a recorded samples folder to replay
+    """
+    global __simulation
+    if __simulation is None:
+        history = None
+        history_folder = os.getenv(SIM_HISTORY_ENV)
+        if history_folder:
+            from .recorder import load_history
+            history = load_history(history_folder)
+        number_of_gpus = int(os.getenv(SIM_GPUS_ENV, "4"))
+        __simulation = Simulation(number_of_gpus=number_of_gpus, history=history)
+    return __simulation
+
+
+def is_simulated() -> bool:
+    return os.getenv(BACKEND_ENV, "nvml").lower() in ("sim", "simulated")
+
+
+def _load_nvml() -> Any:
+    if is_simulated():
+        LOGGER.info("Using simulated NVML backend")
+        return SimulatedNvml(get_simulation())
+    import pynvml
+    return pynvml
+
+
+def _load_cuda() -> Any:
+    if is_simulated():
+        LOGGER.info("Using simulated CUDA backend")
+        return SimulatedCuda(get_simulation())
+    libnames = ('libcuda.so', 'libcuda.dylib', 'cuda.dll')
+    for libname in libnames:
+        try:
+            cuda = ctypes.CDLL(libname)
+            LOGGER.info('Loading cuda libraries')
+            return cuda
+        except OSError:
+            continue
+    return None
+
+
+nvml = BackendProxy(_load_nvml)
+cuda = BackendProxy(_load_cuda)
+
+
+def use_simulation(simulation: Simulation) -> None:
+    """
+    Install simulated NVML and CUDA backends. Must be called before GpuInfoFromNvml / GpuInfoFromCudaLib are created.
+    """
+    nvml.set(SimulatedNvml(simulation))
+    cuda.set(SimulatedCuda(simulation))
@@ -0,0 +1,240 @@
+"""
+Benchmarks of the monitoring and placement hot paths on the simulated device backend.
+
+    python -m check_cuda.benchmark --gpus 1,4,16 --output results.json
+    python -m check_cuda.benchmark --compare results_old.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import psutil
+
+from . import backends, class_object_flattener, codec, controllers
+from .log_cpu_gpu_usage import format_system_status
+from .models import ChannelAndNnModel, NnModelInfo, SystemStatus
+from .process_table import ProcessTable
+
+
+def measure(fn: Callable[[], Any], repeat: int, warmup: int = 3, items: int = 1) -> Dict[str, float]:
+    """
+    Run ``fn`` ``warmup + repeat`` times. Times are per call in microseconds, ``items`` is the number of
+    operations done by one call and scales ops_per_sec.
+    """
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    mean = statistics.fmean(durations)
+    return {
+        "min_us": durations[0] * 1e6,
+        "median_us": statistics.median(durations) * 1e6,
+        "mean_us": mean * 1e6,
+        "p95_us": durations[min(int(len(durations) * 0.95), len(durations) - 1)] * 1e6,
+        "ops_per_sec": items / mean if mean else 0.0,
+        "repeat": repeat,
+    }
+
+
+def use_simulated_gpus(number_of_gpus: int, processes_per_gpu: int = 2) -> controllers.GpuInfoFromNvml:
+    """
+    A fresh (non singleton) GpuInfoFromNvml on ``number_of_gpus`` simulated devices
+    """
+    simulation = backends.Simulation(number_of_gpus=number_of_gpus, seed=number_of_gpus, step_sec=0.0,
+                                     processes_per_gpu=processes_per_gpu)
+    backends.use_simulation(simulation)
+    return controllers.GpuInfoFromNvml.__wrapped__()
+
+
+def get_simulated_system_status(gpu_info: controllers.GpuInfoFromNvml) -> SystemStatus:
+    gpus = gpu_info.get_gpu_status()
+    return SystemStatus(cpu=controllers.get_cpu_status(),
+                        gpus=gpus,
+                        processes=list(gpu_info.get_process_status_running_on_gpus()))
+
+
+def bench_system_status(gpu_counts: List[int], repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for number_of_gpus in gpu_counts:
+        gpu_info = use_simulated_gpus(number_of_gpus)
+        results.append({
+            "name": "get_system_status",
+            "params": {"gpus": number_of_gpus},
+            **measure(lambda: get_simulated_system_status(gpu_info), repeat)
+        })
+    return results
+
+
+def bench_extract_process_info(repeat: int) -> List[Dict[str, Any]]:
+    processes = list(psutil.process_iter())
+    process_table = ProcessTable()
+
+    def extract_all():
+        for ps_process in processes:
+            try:
+                process_table.extract(ps_process)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+
+    result = measure(extract_all, repeat, items=len(processes))
+    result["per_process_us"] = result["mean_us"] / max(len(processes), 1)
+    return [{"name": "extract_process_info", "params": {"processes": len(processes)}, **result}]
+
+
+def bench_format_line(gpu_counts: List[int], repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for number_of_gpus in gpu_counts:
+        system_status = get_simulated_system_status(use_simulated_gpus(number_of_gpus))
+        results.append({
+            "name": "format_system_status",
+            "params": {"gpus": number_of_gpus, "processes": len(system_status.processes)},
+            **measure(lambda: format_system_status(system_status), repeat * 10)
+        })
+    return results
+
+
+def bench_flatten(gpu_counts: List[int], repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for number_of_gpus in gpu_counts:
+        system_status = get_simulated_system_status(use_simulated_gpus(number_of_gpus))
+        keys = class_object_flattener.get_flatten_keys(system_status)
+        params = {"gpus": number_of_gpus, "keys": len(keys)}
+        results.append({
+            "name": "get_flatten_dict",
+            "params": params,
+            **measure(lambda: class_object_flattener.get_flatten_keys(system_status), repeat)
+        })
+        results.append({
+            "name": "get_flatten_values_list",
+            "params": params,
+            **measure(lambda: class_object_flattener.get_flatten_values_list(system_status, keys), repeat)
+        })
+        results.append({
+            "name": "get_flatten_values_list_fast",
+            "params": params,
+            **measure(lambda: class_object_flattener.get_flatten_values_list_fast(system_status), repeat)
+        })
+    return results
+
+
+def bench_codec(gpu_counts: List[int], repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for number_of_gpus in gpu_counts:
+        system_status = get_simulated_system_status(use_simulated_gpus(number_of_gpus))
+        params = {"gpus": number_of_gpus, "processes": len(system_status.processes)}
+        for name, fn in (("to_json", system_status.to_json), ("codec.to_json", lambda: codec.to_json(system_status)),
+                         ("codec.to_binary", lambda: codec.to_binary(system_status))):
+            results.append({"name": name, "params": params, **measure(fn, repeat)})
+    return results
+
+
+def bench_placement(gpu_counts: List[int], channels: int, repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        # ChannelGpuManager keeps its configuration in the working directory
+        os.chdir(folder)
+        try:
+            for number_of_gpus in gpu_counts:
+                gpu_info = use_simulated_gpus(number_of_gpus, processes_per_gpu=0)
+                # ChannelGpuManager sizes itself from the module level get_gpu_status()
+                controllers_get_gpu_status = controllers.get_gpu_status
+                controllers.get_gpu_status = gpu_info.get_gpu_status
+                try:
+                    candidates = [ChannelAndNnModel(i, NnModelInfo(75 + i % 2, 416, 416)) for i in range(channels)]
+
+                    def assign_all():
+                        manager = controllers.ChannelGpuManager.__wrapped__()
+                        for candidate in candidates:
+                            manager.assign(candidate)
+
+                    results.append({
+                        "name": "get_gpu_id_for_the_channel",
+                        "params": {"gpus": number_of_gpus, "channels": channels},
+                        **measure(assign_all, repeat, warmup=1, items=channels)
+                    })
+                finally:
+                    controllers.get_gpu_status = controllers_get_gpu_status
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def get_version() -> str:
+    with open(os.path.join(os.path.dirname(__file__), "VERSION"), "r") as infile:
+        return infile.read().strip()
+
+
+def run(gpu_counts: List[int], repeat: int, channels: int) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = []
+    results += bench_system_status(gpu_counts, repeat)
+    results += bench_extract_process_info(max(repeat // 10, 3))
+    results += bench_format_line(gpu_counts, repeat)
+    results += bench_flatten(gpu_counts, repeat)
+    results += bench_codec(gpu_counts, repeat)
+    results += bench_placement(gpu_counts, channels, max(repeat // 20, 3))
+    return {
+        "version": get_version(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "results": results,
+    }
+
+
+def get_key(result: Dict[str, Any]) -> str:
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """
+    One line per benchmark present in both runs, ratio > 1.0 means the new run is slower
+    """
+    old_results = {get_key(r): r for r in old["results"]}
+    lines = []
+    for result in new["results"]:
+        previous = old_results.get(get_key(result))
+        if previous and previous["median_us"]:
+            ratio = result["median_us"] / previous["median_us"]
+            lines.append(f"{ratio:6.2f}x  {result['name']} {result['params']}  "
+                         f"{previous['median_us']:.1f} us -> {result['median_us']:.1f} us")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gpus", default="1,4,16", help="comma separated simulated GPU counts")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=10000)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="results JSON of a previous run to compare with")
+    args = parser.parse_args(argv)
+    # Overcommitting GPUs is expected once 10k channels exceed the configured budgets
+    logging.getLogger("check_cuda.placement").setLevel(logging.ERROR)
+
+    report = run([int(g) for g in args.gpus.split(",")], args.repeat, args.channels)
+    for result in report["results"]:
+        print(f"{result['name']:28s} {str(result['params']):40s} median {result['median_us']:12.1f} us "
+              f"{result['ops_per_sec']:14.1f} ops/s")
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump(report, outfile, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as infile:
+            for line in compare(json.load(infile), report):
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
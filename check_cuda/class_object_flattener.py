@@ -1,6 +1,11 @@
 import collections
+import collections.abc
+import dataclasses
+import threading
 from pprint import pprint
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+import numpy as np
 
 
 def get_dict_or_list(in_dict1: Any) -> Any:
@@ -19,10 +24,10 @@ def get_flatten_dict(in_dict1: Union[Dict[str, Any], List[Any]], in_key: str = N
     ret = dict()
     in_key = get_str(in_key)
     in_dict_or_list = get_dict_or_list(in_dict1)
-    if isinstance(in_dict_or_list, collections.Mapping):
+    if isinstance(in_dict_or_list, collections.abc.Mapping):
         for k, v in in_dict_or_list.items():
             v1 = get_dict_or_list(v)
-            if isinstance(v1, collections.Mapping) or isinstance(v1, list):
+            if isinstance(v1, collections.abc.Mapping) or isinstance(v1, list):
                 # is_empty_dict = True  # special care for empty dictionary as values
                 for k_i, v_i in get_flatten_dict(v1, k).items():
                     key_i = k_i if in_key is None else in_key + '.' + k_i
@@ -41,7 +46,7 @@ def get_flatten_dict(in_dict1: Union[Dict[str, Any], List[Any]], in_key: str = N
         for v in in_dict_or_list:            
             k = '#' + str(i)
             v1 = get_dict_or_list(v)
-            if isinstance(v1, collections.Mapping) or isinstance(v1, list):
+            if isinstance(v1, collections.abc.Mapping) or isinstance(v1, list):
                 is_empty_dict = True  # special care for empty dictionary as values
                 for k_i, v_i in get_flatten_dict(v1, k).items():
                     key_i = k_i if in_key is None else in_key + '.' + k_i
@@ -102,3 +107,162 @@ def get_flatten_values_list(obj: Any, in_dict: Dict[str, str], ignore_list=[]) -
         if k not in ignore_list:
             ret.append(get_value_for_key(obj, k))
     return ret
+
+
+class FlattenPlan:
+    """
+    Accessors for every key of get_flatten_dict, compiled once for one object type and list length shape.
+
+    ``getters[i](obj)`` returns the value of ``keys[i]`` and get_values() evaluates all of them in one generated
+    expression, so no ``vars()`` walk or key splitting happens per row.
+    """
+
+    def __init__(self, keys: Tuple[str, ...], labels: Tuple[str, ...], expressions: Tuple[str, ...]) -> None:
+        self.keys = keys
+        self.labels = labels
+        self.getters: Tuple[Callable[[Any], Any], ...] = tuple(
+            eval("lambda o: " + expression) for expression in expressions)    # nosec - expressions are generated
+        self.__get_values = eval("lambda o: [" + ", ".join(expressions) + "]")    # nosec
+
+    def get_values(self, obj: Any) -> List[Any]:
+        return self.__get_values(obj)
+
+
+# (type, shape, ignored keys) -> FlattenPlan, least recently used first. Shapes change with e.g. the number of
+# processes, at most MAX_PLANS plans are kept.
+MAX_PLANS = 256
+_PLANS: "collections.OrderedDict[Tuple, FlattenPlan]" = collections.OrderedDict()
+_PLANS_LOCK = threading.Lock()
+_SCALAR_TYPES = frozenset((str, int, float, bool, bytes, type(None)))
+
+
+def _get_value_shape(value: Any) -> Any:
+    """
+    What decides the keys get_flatten_dict produces for ``value``. None for a scalar: one key as the value of a
+    mapping, no key as an item of a list.
+    """
+    if type(value) in _SCALAR_TYPES:
+        return None
+    if dataclasses.is_dataclass(value):
+        return get_shape(value)
+    value = get_dict_or_list(value)
+    if isinstance(value, collections.abc.Mapping):
+        return ("m", ) + tuple((k, _get_value_shape(v)) for k, v in value.items())
+    if isinstance(value, list):
+        shape: List[Any] = ["l"]
+        for i, item in enumerate(value):
+            if type(item) not in _SCALAR_TYPES:
+                item_shape = _get_value_shape(item)
+                if item_shape is not None:
+                    shape.append((i, item_shape))
+        return tuple(shape)
+    return None
+
+
+def get_shape(obj: Any) -> Tuple:
+    """
+    The part of the layout of a dataclass object which changes at runtime: every attribute which does not hold a
+    scalar or None, with the lengths of its lists and the keys of its mappings. E.g. a full_command of None is
+    one key and a list of strings is none, so the two have different shapes.
+    """
+    shape: List[Any] = []
+    for name, value in vars(obj).items():
+        if type(value) not in _SCALAR_TYPES:
+            value_shape = _get_value_shape(value)
+            if value_shape is not None:
+                shape.append((name, value_shape))
+    return tuple(shape)
+
+
+def _get_expression(obj: Any, key: str) -> Union[str, None]:
+    """
+    Python expression over ``o`` returning the same value as get_value_for_key(obj, key), None when the key
+    goes through something other than attributes, mappings and lists
+    """
+    expression = "o"
+    current = obj
+    for k in key.split('.'):
+        if k.startswith('#'):
+            index = int(k[1:])
+            expression += f"[{index}]"
+            current = current[index]
+            continue
+        try:
+            k = int(k)    # to take care of dictionary having integer as key
+        except ValueError:
+            pass
+        if isinstance(current, collections.abc.Mapping):
+            expression += f".get({k!r})"
+            current = current.get(k)
+        elif isinstance(k, str) and k.isidentifier() and hasattr(current, k):
+            expression += f".{k}"
+            current = getattr(current, k)
+        else:
+            return None
+    return expression
+
+
+def compile_flatten_plan(obj: Any, ignore_list=()) -> FlattenPlan:
+    """
+    Cached FlattenPlan for ``obj``. Plans of dataclass objects are shared by all objects of the same type and
+    shape, other objects get a plan of their own.
+    """
+    cache_key = None
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        cache_key = (type(obj), get_shape(obj), tuple(ignore_list))
+        with _PLANS_LOCK:
+            plan = _PLANS.get(cache_key)
+            if plan is not None:
+                _PLANS.move_to_end(cache_key)
+                return plan
+    keys, labels, expressions = [], [], []
+    for k, v in get_flatten_keys(obj).items():
+        if k in ignore_list:
+            continue
+        expression = _get_expression(obj, k)
+        if expression is None:
+            expression = f"get_value_for_key(o, {k!r})"
+        keys.append(k)
+        labels.append(v)
+        expressions.append(expression)
+    plan = FlattenPlan(tuple(keys), tuple(labels), tuple(expressions))
+    if cache_key is not None:
+        with _PLANS_LOCK:
+            _PLANS[cache_key] = plan
+            while len(_PLANS) > MAX_PLANS:
+                _PLANS.popitem(last=False)
+    return plan
+
+
+def get_flatten_values_list_fast(obj: Any, ignore_list=()) -> List[Any]:
+    """
+    Same values as get_flatten_values_list(obj, get_flatten_keys(obj), ignore_list), through a cached plan
+    """
+    return compile_flatten_plan(obj, ignore_list).get_values(obj)
+
+
+def get_flatten_columns(objs: List[Any], ignore_list=()) -> Dict[str, np.ndarray]:
+    """
+    Flatten a list of snapshots into one array per key. Numeric columns are float64 with NaN for missing values,
+    the others are object arrays with None.
+    """
+    columns: Dict[str, List[Any]] = {}
+    for row, obj in enumerate(objs):
+        plan = compile_flatten_plan(obj, ignore_list)
+        for key, value in zip(plan.keys, plan.get_values(obj)):
+            column = columns.get(key)
+            if column is None:
+                column = [None] * row
+                columns[key] = column
+            column.append(value)
+        for column in columns.values():
+            if len(column) <= row:
+                column.append(None)
+    ret: Dict[str, np.ndarray] = {}
+    for key, column in columns.items():
+        if all(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+               for value in column):
+            ret[key] = np.array([np.nan if value is None else value for value in column], dtype=np.float64)
+        else:
+            ret[key] = np.array(column, dtype=object)
+    return ret
@@ -0,0 +1,73 @@
+"""
+check_cuda command line.
+
+    check_cuda [run]              sample and log until SIGINT / SIGTERM, see main.main
+    check_cuda info [--json]      static system info, cached in the session folder
+    check_cuda status [--json]    one sample of CPU, GPU and process usage
+
+info and status are meant for health checks: they set up no logging, start no sampler and import only
+controllers and its dependencies. status exits with 2 when a GPU did not answer in time.
+"""
+import argparse
+import contextlib
+import sys
+import time
+from typing import List, Optional
+
+# CPU percentages are measured between two readings, status waits this long after the first one
+CPU_SAMPLE_SEC = 0.5
+
+
+def print_info(as_json: bool) -> int:
+    from . import system_info_cache
+    # NVML and the session folder print progress on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        system_info = system_info_cache.get_system_info()
+    if as_json:
+        print(system_info.to_json())
+        return 0
+    print(f"{system_info.host_name} {system_info.os}")
+    print(f"CPU {system_info.cpu.name} x{system_info.cpu.count} {system_info.cpu.frequency}")
+    for gpu in system_info.gpus:
+        print(f"GPU{gpu.gpu_id} {gpu.name} {gpu.uuid} {gpu.total_memory_mib} MiB")
+    return 0
+
+
+def print_status(as_json: bool) -> int:
+    from . import controllers
+    with contextlib.redirect_stdout(sys.stderr):
+        # The first readings only start the CPU counters of the system and the processes, they report 0.0 / None
+        controllers.get_cpu_status()
+        controllers.get_process_status()
+        time.sleep(CPU_SAMPLE_SEC)
+        system_status = controllers.get_system_status()
+    if as_json:
+        print(system_status.to_json())
+    else:
+        print(f"CPU {system_status.cpu.cpu_percent}% memory {system_status.cpu.cpu_memory_usage_percent}%")
+        for gpu in system_status.gpus:
+            state = " stale" if gpu.is_stale else ""
+            print(f"GPU{gpu.index} {gpu.name} gpu {gpu.utilization_gpu}% enc {gpu.utilization_enc}% "
+                  f"dec {gpu.utilization_dec}% memory {gpu.memory_used}/{gpu.memory_total} MiB{state}")
+        for process in system_status.processes:
+            print(f"PID {process.pid} {process.command} GPU{process.gpu_id} {process.gpu_memory_usage_mib} MiB")
+    return 2 if any(gpu.is_stale for gpu in system_status.gpus) else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="check_cuda", description="Get NVIDIA GPU devices")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("run", help="sample and log until stopped (default)")
+    info_parser = subparsers.add_parser("info", help="print static system info")
+    info_parser.add_argument("--json", action="store_true", help="print JSON")
+    status_parser = subparsers.add_parser("status", help="print one sample")
+    status_parser.add_argument("--json", action="store_true", help="print JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        return print_info(args.json)
+    if args.command == "status":
+        return print_status(args.json)
+    from .main import main as run
+    run()
+    return 0
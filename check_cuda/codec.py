@@ -0,0 +1,415 @@
+"""
+Fast encoders for the per sample status models.
+
+dataclasses_json walks type hints on every to_dict() call. The codecs here generate one encoder and one decoder
+function per model class from its fields, once, and produce the same camelCase JSON as ``to_json()`` byte for byte.
+The compact binary form is a msgpack document of positional arrays, field values in declaration order without keys.
+Decoders keep values as they are, they do not coerce them to the annotated field type.
+
+CpuStatusRecord, GpuStatusRecord, ProcessStatusRecord and SystemStatusRecord are ``__slots__`` variants of the hot
+models for snapshots which are kept around, e.g. the latest status of every fleet node. They have the same fields,
+encode with the codec of their model and are built with ``to_record()`` or ``record_from_dict()``.
+"""
+import dataclasses
+import json
+import struct
+import typing
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from .models import CpuStatus, GpuStatus, ProcessStatus, SystemStatus
+
+
+class FieldSpec(typing.NamedTuple):
+    name: str
+    key: str
+    # Codec of a nested model, for a model or a list of models
+    codec: Optional["ModelCodec"]
+    is_list: bool
+    default: Any
+    default_factory: Any
+    is_required: bool
+
+
+def get_field_keys(cls: type) -> Dict[str, str]:
+    """
+    attribute name -> JSON key as dataclasses_json names it: the letter case of the field's config() overrides
+    the one of the @dataclass_json decorator
+    """
+    cls_config = getattr(cls, "dataclass_json_config", None) or {}
+    keys = {}
+    for f in dataclasses.fields(cls):
+        letter_case = f.metadata.get("dataclasses_json", {}).get("letter_case", cls_config.get("letter_case"))
+        keys[f.name] = letter_case(f.name) if letter_case is not None else f.name
+    return keys
+
+
+def _get_nested_model(hint: Any) -> Tuple[Optional[type], bool]:
+    """
+    The model class inside ``hint`` and whether it is a list of them, (None, False) for plain values
+    """
+    args = [a for a in typing.get_args(hint) if a is not type(None)]
+    if typing.get_origin(hint) is list and args and dataclasses.is_dataclass(args[0]):
+        return args[0], True
+    if typing.get_origin(hint) is typing.Union and len(args) == 1:
+        hint = args[0]
+    if dataclasses.is_dataclass(hint):
+        return hint, False
+    return None, False
+
+
+def _optional(decode: Callable[[Any], Any], value: Any) -> Any:
+    return None if value is None else decode(value)
+
+
+def _compile(source: str, namespace: Dict[str, Any]) -> Callable:
+    exec(source, namespace)    # nosec - source is generated from dataclass fields
+    return namespace["fn"]
+
+
+class ModelCodec:
+    """
+    Generated encoders and decoders of one dataclass model, see get_codec()
+    """
+
+    def __init__(self, cls: type) -> None:
+        self.cls = cls
+        self.fields: Tuple[FieldSpec, ...] = ()
+        self.record_class: Optional[type] = None
+        self.__to_dict: Optional[Callable[[Any], Dict[str, Any]]] = None
+        self.__from_dict: Optional[Callable[[Dict[str, Any]], Any]] = None
+        self.__to_list: Optional[Callable[[Any], List[Any]]] = None
+        self.__from_list: Optional[Callable[[List[Any]], Any]] = None
+        self.__to_record: Optional[Callable[[Any], Any]] = None
+        self.__record_from_dict: Optional[Callable[[Dict[str, Any]], Any]] = None
+
+    def build(self) -> None:
+        hints = typing.get_type_hints(self.cls)
+        keys = get_field_keys(self.cls)
+        specs = []
+        for f in dataclasses.fields(self.cls):
+            model, is_list = _get_nested_model(hints.get(f.name))
+            specs.append(
+                FieldSpec(f.name, keys[f.name],
+                          get_codec(model) if model is not None else None, is_list, f.default, f.default_factory,
+                          f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING))
+        self.fields = tuple(specs)
+        namespace: Dict[str, Any] = {"cls": self.cls, "_optional": _optional}
+        to_dict, from_dict, to_list, from_list, to_record, record_from_dict = [], [], [], [], [], []
+        for i, spec in enumerate(self.fields):
+            value = f"o.{spec.name}"
+            item = f"d[{spec.key!r}]" if spec.is_required else f"d.get({spec.key!r}, _default_{i})"
+            entry = f"l[{i}]"
+            if spec.default_factory is not dataclasses.MISSING:
+                item = f"d[{spec.key!r}] if {spec.key!r} in d else _factory_{i}()"
+                namespace[f"_factory_{i}"] = spec.default_factory
+            namespace[f"_default_{i}"] = spec.default
+            if spec.codec is not None:
+                namespace[f"_codec_{i}"] = spec.codec
+                if spec.is_list:
+                    to_dict.append(f"{spec.key!r}: [_codec_{i}.to_dict(x) for x in {value}]")
+                    to_list.append(f"[_codec_{i}.to_list(x) for x in {value}]")
+                    from_dict.append(f"{spec.name}=[_codec_{i}.from_dict(x) for x in ({item})]")
+                    from_list.append(f"[_codec_{i}.from_list(x) for x in {entry}]")
+                    to_record.append(f"[_codec_{i}.to_record(x) for x in {value}]")
+                    record_from_dict.append(f"{spec.name}=[_codec_{i}.record_from_dict(x) for x in ({item})]")
+                else:
+                    to_dict.append(f"{spec.key!r}: None if {value} is None else _codec_{i}.to_dict({value})")
+                    to_list.append(f"None if {value} is None else _codec_{i}.to_list({value})")
+                    from_dict.append(f"{spec.name}=_optional(_codec_{i}.from_dict, {item})")
+                    from_list.append(f"_optional(_codec_{i}.from_list, {entry})")
+                    to_record.append(f"_optional(_codec_{i}.to_record, {value})")
+                    record_from_dict.append(f"{spec.name}=_optional(_codec_{i}.record_from_dict, {item})")
+            else:
+                to_dict.append(f"{spec.key!r}: {value}")
+                to_list.append(value)
+                from_dict.append(f"{spec.name}={item}")
+                from_list.append(entry)
+                to_record.append(value)
+                record_from_dict.append(f"{spec.name}={item}")
+        self.__to_dict = _compile("def fn(o): return {" + ", ".join(to_dict) + "}", dict(namespace))
+        self.__to_list = _compile("def fn(o): return [" + ", ".join(to_list) + "]", dict(namespace))
+        self.__from_dict = _compile("def fn(d): return cls(" + ", ".join(from_dict) + ")", dict(namespace))
+        self.__from_list = _compile("def fn(l): return cls(" + ", ".join(from_list) + ")", dict(namespace))
+        self.record_class = make_record_class(self.cls)
+        record_namespace = dict(namespace, cls=self.record_class)
+        self.__to_record = _compile("def fn(o): return cls(" + ", ".join(to_record) + ")", dict(record_namespace))
+        self.__record_from_dict = _compile("def fn(d): return cls(" + ", ".join(record_from_dict) + ")",
+                                           dict(record_namespace))
+
+    def to_dict(self, obj: Any) -> Dict[str, Any]:
+        """
+        Same as ``obj.to_dict()``, works for the model and its record class
+        """
+        return self.__to_dict(obj)
+
+    def from_dict(self, kvs: Dict[str, Any]) -> Any:
+        return self.__from_dict(kvs)
+
+    def to_json(self, obj: Any) -> str:
+        """
+        Same as ``obj.to_json()``
+        """
+        return json.dumps(self.__to_dict(obj))
+
+    def from_json(self, s: str) -> Any:
+        return self.__from_dict(json.loads(s))
+
+    def to_list(self, obj: Any) -> List[Any]:
+        """
+        Field values in declaration order, nested models as lists too
+        """
+        return self.__to_list(obj)
+
+    def from_list(self, values: List[Any]) -> Any:
+        return self.__from_list(values)
+
+    def to_binary(self, obj: Any) -> bytes:
+        return pack(self.__to_list(obj))
+
+    def from_binary(self, data: bytes) -> Any:
+        return self.__from_list(unpack(data))
+
+    def to_record(self, obj: Any) -> Any:
+        """
+        Copy of ``obj`` as an instance of the ``__slots__`` record class
+        """
+        return self.__to_record(obj)
+
+    def record_from_dict(self, kvs: Dict[str, Any]) -> Any:
+        """
+        Same as from_dict(), nested models included as records
+        """
+        return self.__record_from_dict(kvs)
+
+
+def make_record_class(cls: type) -> type:
+    """
+    ``__slots__`` counterpart of a dataclass model with the same fields, defaults, __eq__ and __repr__
+    """
+    fields = dataclasses.fields(cls)
+    namespace: Dict[str, Any] = {}
+    params, body = [], []
+    for i, f in enumerate(fields):
+        if f.default is not dataclasses.MISSING:
+            namespace[f"_default_{i}"] = f.default
+            params.append(f"{f.name}=_default_{i}")
+            body.append(f"self.{f.name} = {f.name}")
+        elif f.default_factory is not dataclasses.MISSING:
+            namespace[f"_factory_{i}"] = f.default_factory
+            params.append(f"{f.name}=None")
+            body.append(f"self.{f.name} = _factory_{i}() if {f.name} is None else {f.name}")
+        else:
+            params.append(f.name)
+            body.append(f"self.{f.name} = {f.name}")
+    names = tuple(f.name for f in fields)
+    init = _compile(f"def fn(self, {', '.join(params)}):\n    " + "\n    ".join(body or ["pass"]), namespace)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in names)
+
+    def __repr__(self):
+        return f"{self.__class__.__qualname__}(" + ", ".join(f"{name}={getattr(self, name)!r}"
+                                                            for name in names) + ")"
+
+    return type(cls.__name__ + "Record", (), {
+        "__slots__": names,
+        "__init__": init,
+        "__eq__": __eq__,
+        "__repr__": __repr__,
+        "__hash__": None,
+        "__dataclass_fields__": cls.__dataclass_fields__,
+        "__module__": __name__,
+    })
+
+
+
+_CODECS: Dict[type, ModelCodec] = {}
+
+
+def get_codec(cls: Type) -> ModelCodec:
+    """
+    The ModelCodec of a dataclass model, generated on first use
+    """
+    codec = _CODECS.get(cls)
+    if codec is None:
+        codec = ModelCodec(cls)
+        # Registered before build() so that recursive models find it
+        _CODECS[cls] = codec
+        codec.build()
+    return codec
+
+
+def to_dict(obj: Any) -> Dict[str, Any]:
+    return get_codec(type(obj)).to_dict(obj)
+
+
+def to_json(obj: Any) -> str:
+    return get_codec(type(obj)).to_json(obj)
+
+
+def to_binary(obj: Any) -> bytes:
+    return get_codec(type(obj)).to_binary(obj)
+
+
+def from_binary(cls: Type, data: bytes) -> Any:
+    return get_codec(cls).from_binary(data)
+
+
+def to_record(obj: Any) -> Any:
+    return get_codec(type(obj)).to_record(obj)
+
+
+CpuStatusRecord = get_codec(CpuStatus).record_class
+GpuStatusRecord = get_codec(GpuStatus).record_class
+ProcessStatusRecord = get_codec(ProcessStatus).record_class
+SystemStatusRecord = get_codec(SystemStatus).record_class
+# Records encode with the codec of the model they mirror
+for _model in (CpuStatus, GpuStatus, ProcessStatus, SystemStatus):
+    _CODECS[get_codec(_model).record_class] = get_codec(_model)
+
+
+def pack(value: Any) -> bytes:
+    """
+    msgpack encoding of None, bool, int, float, str, bytes, lists, tuples and dicts
+    """
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+def _pack_length(length: int, out: bytearray, fix_tag: int, fix_max: int, tag16: int, tag32: int) -> None:
+    if length <= fix_max:
+        out.append(fix_tag | length)
+    elif length <= 0xffff:
+        out.append(tag16)
+        out += struct.pack(">H", length)
+    else:
+        out.append(tag32)
+        out += struct.pack(">I", length)
+
+
+def _pack(value: Any, out: bytearray) -> None:
+    if value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif isinstance(value, int):
+        if 0 <= value <= 0x7f:
+            out.append(value)
+        elif -32 <= value < 0:
+            out.append(value & 0xff)
+        elif 0 <= value <= 0xffffffff:
+            out.append(0xce)
+            out += struct.pack(">I", value)
+        elif -0x80000000 <= value < 0:
+            out.append(0xd2)
+            out += struct.pack(">i", value)
+        elif value > 0:
+            out.append(0xcf)
+            out += struct.pack(">Q", value)
+        else:
+            out.append(0xd3)
+            out += struct.pack(">q", value)
+    elif isinstance(value, float):
+        out.append(0xcb)
+        out += struct.pack(">d", value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        if len(data) <= 31:
+            out.append(0xa0 | len(data))
+        elif len(data) <= 0xff:
+            out += bytes((0xd9, len(data)))
+        else:
+            _pack_length(len(data), out, 0, -1, 0xda, 0xdb)
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        if len(value) <= 0xff:
+            out += bytes((0xc4, len(value)))
+        else:
+            _pack_length(len(value), out, 0, -1, 0xc5, 0xc6)
+        out += value
+    elif isinstance(value, (list, tuple)):
+        _pack_length(len(value), out, 0x90, 15, 0xdc, 0xdd)
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        _pack_length(len(value), out, 0x80, 15, 0xde, 0xdf)
+        for k, v in value.items():
+            _pack(k, out)
+            _pack(v, out)
+    else:
+        raise TypeError(f"Can not pack {type(value).__name__}")
+
+
+_FIXED = {
+    0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q", 0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q", 0xca: ">f",
+    0xcb: ">d"
+}
+_LENGTHS = {0xc4: ">B", 0xc5: ">H", 0xc6: ">I", 0xd9: ">B", 0xda: ">H", 0xdb: ">I"}
+_CONTAINERS = {0xdc: ">H", 0xdd: ">I", 0xde: ">H", 0xdf: ">I"}
+
+
+def unpack(data: bytes) -> Any:
+    """
+    Inverse of pack()
+    """
+    value, offset = _unpack(memoryview(data), 0)
+    if offset != len(data):
+        raise ValueError(f"{len(data) - offset} trailing bytes")
+    return value
+
+
+def _unpack(data: memoryview, offset: int) -> Tuple[Any, int]:
+    tag = data[offset]
+    offset += 1
+    if tag <= 0x7f:
+        return tag, offset
+    if tag >= 0xe0:
+        return tag - 0x100, offset
+    if 0xa0 <= tag <= 0xbf:
+        end = offset + (tag & 0x1f)
+        return str(data[offset:end], "utf-8"), end
+    if 0x90 <= tag <= 0x9f:
+        return _unpack_array(data, offset, tag & 0x0f)
+    if 0x80 <= tag <= 0x8f:
+        return _unpack_map(data, offset, tag & 0x0f)
+    if tag == 0xc0:
+        return None, offset
+    if tag in (0xc2, 0xc3):
+        return tag == 0xc3, offset
+    fmt = _FIXED.get(tag)
+    if fmt is not None:
+        return struct.unpack_from(fmt, data, offset)[0], offset + struct.calcsize(fmt)
+    fmt = _LENGTHS.get(tag)
+    if fmt is not None:
+        length = struct.unpack_from(fmt, data, offset)[0]
+        offset += struct.calcsize(fmt)
+        raw = data[offset:offset + length]
+        return (str(raw, "utf-8") if tag >= 0xd9 else bytes(raw)), offset + length
+    fmt = _CONTAINERS.get(tag)
+    if fmt is not None:
+        length = struct.unpack_from(fmt, data, offset)[0]
+        offset += struct.calcsize(fmt)
+        return _unpack_array(data, offset, length) if tag <= 0xdd else _unpack_map(data, offset, length)
+    raise ValueError(f"Unsupported msgpack type 0x{tag:02x}")
+
+
+def _unpack_array(data: memoryview, offset: int, length: int) -> Tuple[List[Any], int]:
+    items = []
+    for _ in range(length):
+        item, offset = _unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def _unpack_map(data: memoryview, offset: int, length: int) -> Tuple[Dict[Any, Any], int]:
+    ret = {}
+    for _ in range(length):
+        k, offset = _unpack(data, offset)
+        v, offset = _unpack(data, offset)
+        ret[k] = v
+    return ret, offset
@@ -0,0 +1,40 @@
+import logging
+
+import yaml
+from singleton_decorator.decorator import singleton
+
+from .models import CheckCudaConfig
+from .utils import get_config_folder
+
+LOGGER = logging.getLogger(__name__)
+
+
+@singleton
+class ConfigManager:
+    """
+    Session configuration, read from check_cuda.yml in the config folder
+    """
+    def __init__(self) -> None:
+        self.configuration_file_name = get_config_folder() + "check_cuda.yml"
+        self.config = self.__read_config()
+
+    def __write_default_config(self) -> CheckCudaConfig:
+        config = CheckCudaConfig()
+        with open(self.configuration_file_name, 'w') as outfile:
+            yaml.dump(config.to_dict(), outfile)
+        return config
+
+    def __read_config(self) -> CheckCudaConfig:
+        config = None
+        try:
+            with open(self.configuration_file_name, 'r') as infile:
+                config = CheckCudaConfig.from_dict(yaml.safe_load(infile) or {})
+        except FileNotFoundError:
+            pass
+        if not config:
+            config = self.__write_default_config()
+        return config
+
+
+def get_config() -> CheckCudaConfig:
+    return ConfigManager().config
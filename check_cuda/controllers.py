@@ -1,17 +1,22 @@
 import ctypes
+import dataclasses
 import logging
 import os
 import platform
-from typing import Dict, List, Union
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import psutil
-import pynvml as N
-from cpuinfo import get_cpu_info
 from singleton_decorator.decorator import singleton
-import yaml
 
-from .models import (ChannelAndNnModel, CpuInfo, CpuStatus, GpuInfo, GpuStatus, ModelCount, NnModelInfo, NnModelMaxChannelInfo, NnModelMaxChannelInfoList, ProcessStatus,
+from .backends import cuda as CUDA
+from .backends import nvml as N
+from .models import (ChannelAndNnModel, CpuInfo, CpuStatus, GpuEvent, GpuInfo, GpuStatus, ModelCost, ModelCount, NnModelInfo, NnModelMaxChannelInfo, NnModelMaxChannelInfoList, ProcessStatus,
                      SystemInfo, SystemStatus)
+from .placement import PlacementEngine, PlacementPolicy, get_limit_key
+from .process_table import ProcessTable, WindowStats
+from .rebalancer import ChannelRebalancer
 
 # Some constants taken from cuda.h
 CUDA_SUCCESS = 0
@@ -19,8 +24,11 @@ CU_DEVICE_ATTRIBUTE_MULTIPROCESSOR_COUNT = 16
 CU_DEVICE_ATTRIBUTE_MAX_THREADS_PER_MULTIPROCESSOR = 39
 CU_DEVICE_ATTRIBUTE_CLOCK_RATE = 13
 CU_DEVICE_ATTRIBUTE_MEMORY_CLOCK_RATE = 36
+CU_DEVICE_ATTRIBUTE_COMPUTE_CAPABILITY_MAJOR = 75
+CU_DEVICE_ATTRIBUTE_COMPUTE_CAPABILITY_MINOR = 76
 NOT_SUPPORTED = 'Not Supported'
 MB = 1024 * 1024
+CHANNEL_GPU_MANAGER_FILE_NAME = "ChannelGpuManager.yml"
 
 
 def ConvertSMVer2Cores(major, minor):
@@ -48,6 +56,14 @@ def ConvertSMVer2Cores(major, minor):
         (7, 0): 64,    # Volta
         (7, 2): 64,
         (7, 5): 64,    # Turing
+        (8, 0): 64,    # Ampere
+        (8, 6): 128,
+        (8, 7): 128,
+        (8, 9): 128,    # Ada Lovelace
+        (9, 0): 128,    # Hopper
+        (10, 0): 128,    # Blackwell
+        (10, 1): 128,
+        (12, 0): 128,
     }.get((major, minor), 0)
 
 
@@ -57,20 +73,85 @@ LOGGER = logging.getLogger(__name__)
 #     'https://api.ipify.org?format=json'
 
 
+class NvmlDevice:
+    """
+    Handle and static attributes of one NVML device, read once at init
+    """
+    __slots__ = ("index", "handle", "name", "uuid", "memory_total", "unsupported", "use_field_values",
+                 "process_utilization_timestamp")
+
+    def __init__(self, index, handle, name=None, uuid=None, memory_total=None):
+        self.index = index
+        self.handle = handle
+        self.name = name
+        self.uuid = uuid
+        self.memory_total = memory_total
+        # Queries which returned NVML_ERROR_NOT_SUPPORTED once are never retried
+        self.unsupported = set()
+        self.use_field_values = None not in get_power_field_ids()
+        # Newest nvmlDeviceGetProcessUtilization sample seen, in microseconds
+        self.process_utilization_timestamp = 0
+
+
+def get_power_field_ids() -> Tuple:
+    """
+    Dynamic counters fetched with one nvmlDeviceGetFieldValues call per device, None on bindings without them
+    """
+    return (getattr(N, "NVML_FI_DEV_POWER_INSTANT", None), getattr(N, "NVML_FI_DEV_POWER_CURRENT_LIMIT", None))
+
+
+def get_typed_value(value_type: int, value) -> Union[int, float, None]:
+    """
+    The member of an nvmlValue_t union selected by ``value_type``
+    """
+    if value_type == N.NVML_VALUE_TYPE_DOUBLE:
+        return value.dVal
+    if value_type == N.NVML_VALUE_TYPE_UNSIGNED_INT:
+        return value.uiVal
+    if value_type == N.NVML_VALUE_TYPE_UNSIGNED_LONG:
+        return value.ulVal
+    if value_type == N.NVML_VALUE_TYPE_UNSIGNED_LONG_LONG:
+        return value.ullVal
+    if value_type == N.NVML_VALUE_TYPE_SIGNED_LONG_LONG:
+        return value.sllVal
+    return None
+
+
+def _get_field_value(field_value) -> Union[int, float, None]:
+    if field_value.nvmlReturn != N.NVML_SUCCESS:
+        return None
+    return get_typed_value(field_value.valueType, field_value.value)
+
+
 @singleton
 class GpuInfoFromNvml(object):
+    POLL_TIMEOUT_SEC = 0.5
+    MAX_POLL_WORKERS = 8
+
     def __init__(self):
         self.__is_nvml_loaded = False
         self.__gpu_processes: List[ProcessStatus] = []
+        self.__devices: List[NvmlDevice] = []
+        self.__in_flight: Dict[int, Future] = {}
+        self.__sample_id = 0
+        # Guards the poll state above, see get_gpu_status
+        self.__poll_lock = Lock()
+        self.__executor: Optional[ThreadPoolExecutor] = None
         print("Starting NVML")
         try:
             N.nvmlInit()
             self.__is_nvml_loaded = True
         except Exception as e:
             print(e)
+        if self.__is_nvml_loaded:
+            self.__devices = self.__get_devices()
+            self.__executor = ThreadPoolExecutor(max_workers=min(max(len(self.__devices), 1), self.MAX_POLL_WORKERS),
+                                                 thread_name_prefix="nvml_poll")
 
     def __del__(self):
         print("Shutting down NVML")
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
         if self.__is_nvml_loaded:
             if N:
                 N.nvmlShutdown()
@@ -80,68 +161,120 @@ class GpuInfoFromNvml(object):
             return b.decode('utf-8')    # for python3, to unicode
         return b
 
-    def get_gpu_status_by_gpu_id(self, index) -> Union[GpuStatus, None]:
-        gpu_status = None
-        if self.__is_nvml_loaded:
-            gpu_status = GpuStatus(index=index)
-            """Get one GPU information specified by nvml handle"""
+    def __get_devices(self) -> List[NvmlDevice]:
+        devices = []
+        for index in range(N.nvmlDeviceGetCount()):
             handle = N.nvmlDeviceGetHandleByIndex(index)
-            gpu_status.name = self._decode(N.nvmlDeviceGetName(handle))
-            gpu_status.uuid = self._decode(N.nvmlDeviceGetUUID(handle))
+            device = NvmlDevice(index, handle)
+            device.name = self._decode(N.nvmlDeviceGetName(handle))
+            device.uuid = self._decode(N.nvmlDeviceGetUUID(handle))
             try:
-                gpu_status.temperature = N.nvmlDeviceGetTemperature(handle, N.NVML_TEMPERATURE_GPU)
+                device.memory_total = N.nvmlDeviceGetMemoryInfo(handle).total // MB
             except N.NVMLError:
-                gpu_status.temperature = None    # Not supported
-            try:
-                gpu_status.fan_speed = N.nvmlDeviceGetFanSpeed(handle)
-            except N.NVMLError:
-                gpu_status.fan_speed = None    # Not supported
-            try:
-                memory = N.nvmlDeviceGetMemoryInfo(handle)   # in Bytes
-                gpu_status.memory_used = memory.used // MB
-                gpu_status.memory_total = memory.total // MB
-            except N.NVMLError:
-                gpu_status.memory_used = None    # Not supported
-                gpu_status.memory_total = None
+                device.memory_total = None
+            devices.append(device)
+        return devices
 
-            try:
-                utilization = N.nvmlDeviceGetUtilizationRates(handle)
-                if utilization:
-                    gpu_status.utilization_gpu = utilization.gpu
-                else:
-                    gpu_status.utilization_gpu = None
-            except N.NVMLError:
-                gpu_status.utilization_gpu = None    # Not supported
-
-            try:
-                utilization_enc = N.nvmlDeviceGetEncoderUtilization(handle)
-                if utilization_enc:
-                    gpu_status.utilization_enc = utilization_enc[0]
-                else:
-                    gpu_status.utilization_enc = None
-            except N.NVMLError:
-                gpu_status.utilization_enc = None    # Not supported
+    def get_devices(self) -> List[NvmlDevice]:
+        return self.__devices
 
+    def get_driver_version(self) -> Optional[str]:
+        if not self.__is_nvml_loaded:
+            return None
+        try:
+            return self._decode(N.nvmlSystemGetDriverVersion())
+        except N.NVMLError as e:
+            LOGGER.error(e)
+            return None
+
+    def _query(self, device: NvmlDevice, name: str, fn, *args):
+        """
+        Call ``fn(handle, *args)``, None when the query fails. Unsupported queries are remembered per device.
+        """
+        if name in device.unsupported:
+            return None
+        try:
+            return fn(device.handle, *args)
+        except N.NVMLError as e:
+            if getattr(e, "value", None) == N.NVML_ERROR_NOT_SUPPORTED:
+                device.unsupported.add(name)
+            return None
+
+    def __get_power(self, device: NvmlDevice, gpu_status: GpuStatus) -> None:
+        if device.use_field_values:
             try:
-                utilization_dec = N.nvmlDeviceGetDecoderUtilization(handle)
-                if utilization_dec:
-                    gpu_status.utilization_dec = utilization_dec[0]
-                else:
-                    gpu_status.utilization_dec = None
-            except N.NVMLError:
-                gpu_status.utilization_dec = None    # Not supported
+                field_values = N.nvmlDeviceGetFieldValues(device.handle, get_power_field_ids())
+                power_draw, power_limit = [_get_field_value(v) for v in field_values]
+                gpu_status.power_draw = power_draw // 1000 if power_draw is not None else None    # mW to W
+                gpu_status.enforced_power_limit = power_limit // 1000 if power_limit is not None else None
+                return
+            except (N.NVMLError, AttributeError):
+                # Older drivers / bindings without field value support
+                device.use_field_values = False
+        power_draw = self._query(device, "power_usage", N.nvmlDeviceGetPowerUsage)
+        power_limit = self._query(device, "enforced_power_limit", N.nvmlDeviceGetEnforcedPowerLimit)
+        gpu_status.power_draw = power_draw // 1000 if power_draw is not None else None
+        gpu_status.enforced_power_limit = power_limit // 1000 if power_limit is not None else None
+
+    def __get_process_utilization(self, device: NvmlDevice) -> Dict[int, Tuple[float, float, float, float]]:
+        """
+        pid -> mean (sm, memory, encoder, decoder) utilization over the samples since the previous call
+        """
+        if "process_utilization" in device.unsupported:
+            return {}
+        try:
+            samples = N.nvmlDeviceGetProcessUtilization(device.handle, device.process_utilization_timestamp)
+        except N.NVMLError as e:
+            if getattr(e, "value", None) == N.NVML_ERROR_NOT_SUPPORTED:
+                device.unsupported.add("process_utilization")
+            return {}    # NVML_ERROR_NOT_FOUND when no process used the GPU since the last call
+        sums: Dict[int, List[float]] = {}
+        for sample in samples:
+            device.process_utilization_timestamp = max(device.process_utilization_timestamp, sample.timeStamp)
+            total = sums.setdefault(sample.pid, [0.0, 0.0, 0.0, 0.0, 0])
+            total[0] += sample.smUtil
+            total[1] += sample.memUtil
+            total[2] += sample.encUtil
+            total[3] += sample.decUtil
+            total[4] += 1
+        return {pid: (t[0] / t[4], t[1] / t[4], t[2] / t[4], t[3] / t[4]) for pid, t in sums.items()}
+
+    def get_gpu_status_by_gpu_id(self,
+                                 index,
+                                 processes: Optional[List[ProcessStatus]] = None,
+                                 with_processes: bool = True,
+                                 sample_id: Optional[int] = None) -> Union[GpuStatus, None]:
+        if processes is None:
+            processes = self.__gpu_processes
+        gpu_status = None
+        if self.__is_nvml_loaded and index < len(self.__devices):
+            device = self.__devices[index]
+            gpu_status = GpuStatus(index=index, uuid=device.uuid, name=device.name, memory_total=device.memory_total)
+            gpu_status.temperature = self._query(device, "temperature", N.nvmlDeviceGetTemperature,
+                                                 N.NVML_TEMPERATURE_GPU)
+            gpu_status.fan_speed = self._query(device, "fan_speed", N.nvmlDeviceGetFanSpeed)
+            memory = self._query(device, "memory", N.nvmlDeviceGetMemoryInfo)    # in Bytes
+            if memory:
+                gpu_status.memory_used = memory.used // MB
 
-            try:
-                nv_comp_processes = N.nvmlDeviceGetComputeRunningProcesses(handle)
-            except N.NVMLError:
-                nv_comp_processes = None    # Not supported
-            try:
-                nv_graphics_processes = N.nvmlDeviceGetGraphicsRunningProcesses(handle)
-            except N.NVMLError:
-                nv_graphics_processes = None    # Not supported
-            if nv_comp_processes is None and nv_graphics_processes is None:
-                processes = None
-            else:
+            utilization = self._query(device, "utilization", N.nvmlDeviceGetUtilizationRates)
+            if utilization:
+                gpu_status.utilization_gpu = utilization.gpu
+            utilization_enc = self._query(device, "utilization_enc", N.nvmlDeviceGetEncoderUtilization)
+            if utilization_enc:
+                gpu_status.utilization_enc = utilization_enc[0]
+            utilization_dec = self._query(device, "utilization_dec", N.nvmlDeviceGetDecoderUtilization)
+            if utilization_dec:
+                gpu_status.utilization_dec = utilization_dec[0]
+            self.__get_power(device, gpu_status)
+            if not with_processes:
+                return gpu_status
+
+            nv_comp_processes = self._query(device, "compute_processes", N.nvmlDeviceGetComputeRunningProcesses)
+            nv_graphics_processes = self._query(device, "graphics_processes",
+                                                N.nvmlDeviceGetGraphicsRunningProcesses)
+            if nv_comp_processes is not None or nv_graphics_processes is not None:
+                utilization = self.__get_process_utilization(device)
                 nv_comp_processes = nv_comp_processes or []
                 nv_graphics_processes = nv_graphics_processes or []
                 # A single process might run in both of graphics and compute mode,
@@ -152,61 +285,125 @@ class GpuInfoFromNvml(object):
                         continue
                     seen_pids.add(nv_process.pid)
                     try:
-                        process = get_process_status_by_pid(nv_process.pid)
+                        process = get_process_status_by_pid(nv_process.pid, sample_id)
                         # Bytes to MBytes
                         # if drivers are not TTC this will be None.
                         usedmem = nv_process.usedGpuMemory // MB if \
                             nv_process.usedGpuMemory else None
                         process.gpu_memory_usage_mib = usedmem
                         process.gpu_id = index
-                        self.__gpu_processes.append(process)
+                        process_utilization = utilization.get(nv_process.pid)
+                        if process_utilization is not None:
+                            (process.gpu_sm_percent, process.gpu_memory_percent, process.gpu_encoder_percent,
+                             process.gpu_decoder_percent) = process_utilization
+                        processes.append(process)
                     except psutil.NoSuchProcess:
                         # TODO: add some reminder for NVML broken context
                         # e.g. nvidia-smi reset  or  reboot the system
                         pass
         return gpu_status
 
-
     def get_gpu_info_by_gpu_id(self, index) -> Union[GpuInfo, None]:
         gpu_info = None
-        if self.__is_nvml_loaded:
-            gpu_info = GpuInfo(gpu_id=index)
-            """Get one GPU information specified by nvml handle"""
-            handle = N.nvmlDeviceGetHandleByIndex(index)
-            gpu_info.name = self._decode(N.nvmlDeviceGetName(handle))
-            gpu_info.uuid = self._decode(N.nvmlDeviceGetUUID(handle))
-
-            try:
-                memory = N.nvmlDeviceGetMemoryInfo(handle)   # in Bytes                
+        if self.__is_nvml_loaded and index < len(self.__devices):
+            device = self.__devices[index]
+            gpu_info = GpuInfo(gpu_id=index, name=device.name, uuid=device.uuid, total_memory_mib=device.memory_total)
+            memory = self._query(device, "memory", N.nvmlDeviceGetMemoryInfo)    # in Bytes
+            if memory:
                 gpu_info.free_memory_mib = (memory.total - memory.used) // MB
-                gpu_info.total_memory_mib = memory.total // MB
-            except N.NVMLError:
-                gpu_info.free_memory_mib = None    # Not supported
-                gpu_info.total_memory_mib = None
-
-
         return gpu_info
 
-
     def get_process_status_running_on_gpus(self) -> List[ProcessStatus]:
         return self.__gpu_processes
 
-    def get_gpu_status(self) -> List[GpuStatus]:
-        gpu_list = []        
-        if self.__is_nvml_loaded:
-            device_count = N.nvmlDeviceGetCount()
-            self.__gpu_processes.clear()
-            for index in range(device_count):
-                gpu_status = self.get_gpu_status_by_gpu_id(index)
-                if gpu_status:
-                    gpu_list.append(gpu_status)
+    def get_gpu_status(self, with_processes: bool = True) -> List[GpuStatus]:
+        """
+        Poll all devices in parallel. A device whose query does not finish within POLL_TIMEOUT_SEC, or which is
+        still stuck in the previous poll, is returned with its static fields only and is_stale set.
+        Without ``with_processes`` only the device counters are read and the GPU process list is left as it was.
+        Polls of several threads, e.g. the sampler and the rebalancer, take turns.
+        """
+        gpu_list = []
+        if not self.__is_nvml_loaded:
+            return gpu_list
+        with self.__poll_lock:
+            gpu_processes: List[ProcessStatus] = []
+            if with_processes:
+                # Processes on several GPUs are read once per poll, see ProcessTable.extract
+                self.__sample_id += 1
+            pending: List[Tuple[int, Future, List[ProcessStatus]]] = []
+            for device in self.__devices:
+                in_flight = self.__in_flight.get(device.index)
+                if in_flight is not None and not in_flight.done():
+                    # Whatever it returns belongs to an earlier poll, the device is stale in this one
+                    continue
+                processes: List[ProcessStatus] = []
+                future = self.__executor.submit(self.get_gpu_status_by_gpu_id, device.index, processes,
+                                                with_processes, self.__sample_id)
+                self.__in_flight[device.index] = future
+                pending.append((device.index, future, processes))
+            wait([future for _, future, _ in pending], timeout=self.POLL_TIMEOUT_SEC)
+            results = {index: (future, processes) for index, future, processes in pending}
+            for index in range(len(self.__devices)):
+                gpu_status = None
+                future, processes = results.get(index, (None, None))
+                if future is None:
+                    LOGGER.warning("GPU %d is still busy with an earlier poll", index)
+                elif future.done():
+                    try:
+                        gpu_status = future.result()
+                    except Exception as e:
+                        LOGGER.error("Polling GPU %d failed: %s", index, e)
+                    else:
+                        gpu_processes.extend(processes)
+                else:
+                    LOGGER.warning("Polling GPU %d did not finish within %.2f s", index, self.POLL_TIMEOUT_SEC)
+                if gpu_status is None:
+                    device = self.__devices[index]
+                    gpu_status = GpuStatus(index=index,
+                                           uuid=device.uuid,
+                                           name=device.name,
+                                           memory_total=device.memory_total,
+                                           is_stale=True)
+                gpu_list.append(gpu_status)
+            if with_processes:
+                self.__gpu_processes = gpu_processes
         return gpu_list
 
+    def run_per_device(self,
+                       fn: Callable[[NvmlDevice], Any],
+                       devices: Optional[List[NvmlDevice]] = None) -> Dict[int, Any]:
+        """
+        ``fn(device)`` of every device on the poll pool, by GPU index. As in get_gpu_status, a device still stuck
+        in an earlier call gets no new one, and a call which does not finish within POLL_TIMEOUT_SEC is left out.
+        """
+        ret: Dict[int, Any] = {}
+        if not self.__is_nvml_loaded:
+            return ret
+        pending: List[Tuple[int, Future]] = []
+        with self.__poll_lock:
+            for device in (self.__devices if devices is None else devices):
+                in_flight = self.__in_flight.get(device.index)
+                if in_flight is not None and not in_flight.done():
+                    continue
+                future = self.__executor.submit(fn, device)
+                self.__in_flight[device.index] = future
+                pending.append((device.index, future))
+            wait([future for _, future in pending], timeout=self.POLL_TIMEOUT_SEC)
+        for index, future in pending:
+            if not future.done():
+                LOGGER.warning("GPU %d did not answer within %.2f s", index, self.POLL_TIMEOUT_SEC)
+                continue
+            try:
+                ret[index] = future.result()
+            except Exception as e:
+                LOGGER.error("GPU %d failed: %s", index, e)
+        return ret
+
     def get_gpu_info(self) -> List[GpuInfo]:
         gpu_list = []
         if self.__is_nvml_loaded:
-            device_count = N.nvmlDeviceGetCount()
-            for index in range(device_count):
+            for index in range(len(self.__devices)):
                 gpu_status = self.get_gpu_info_by_gpu_id(index)
                 if gpu_status:
                     gpu_list.append(gpu_status)
@@ -214,158 +411,143 @@ class GpuInfoFromNvml(object):
 
 @singleton
 class GpuInfoFromCudaLib:
+    """
+    Static device attributes from the CUDA driver API, probed once.
+
+    Only cuDeviceGetAttribute, cuDeviceTotalMem and cuDeviceGetUuid are used: they need no context, so the probe
+    allocates no GPU memory and does not stall on busy devices. Free memory needs a context and is left to NVML.
+    """
     def __init__(self):
         self.__cuda = None
-        self.__nvidia_device_list: List[GpuInfo] = []
+        self.__lock = Lock()
+        self.__nvidia_device_list: Optional[List[GpuInfo]] = None
+
+    def __check(self, result: int, name: str) -> bool:
+        if result == CUDA_SUCCESS:
+            return True
+        error_str = ctypes.c_char_p()
+        self.__cuda.cuGetErrorString(result, ctypes.byref(error_str))
+        LOGGER.error("%s failed with error code %d: %s", name, result,
+                     error_str.value.decode() if error_str.value else "")
+        return False
+
+    def __get_attribute(self, device: ctypes.c_int, attribute: int) -> Optional[int]:
+        value = ctypes.c_int()
+        if self.__cuda.cuDeviceGetAttribute(ctypes.byref(value), attribute, device) != CUDA_SUCCESS:
+            return None
+        return value.value
+
+    def __get_uuid(self, device: ctypes.c_int) -> Optional[str]:
+        get_uuid = getattr(self.__cuda, "cuDeviceGetUuid_v2", None) or getattr(self.__cuda, "cuDeviceGetUuid", None)
+        if get_uuid is None:
+            return None
+        uuid = ctypes.create_string_buffer(16)
+        if get_uuid(uuid, device) != CUDA_SUCCESS:
+            return None
+        # Same format as nvmlDeviceGetUUID
+        h = uuid.raw.hex()
+        return f"GPU-{h[0:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}"
+
+    def __get_total_memory_mib(self, device: ctypes.c_int) -> Optional[int]:
+        get_total_memory = getattr(self.__cuda, "cuDeviceTotalMem_v2", None) or self.__cuda.cuDeviceTotalMem
+        total_memory = ctypes.c_size_t()
+        if get_total_memory(ctypes.byref(total_memory), device) != CUDA_SUCCESS:
+            return None
+        return total_memory.value // MB
+
+    def __probe(self, index: int) -> Optional[GpuInfo]:
+        device = ctypes.c_int()
+        if not self.__check(self.__cuda.cuDeviceGet(ctypes.byref(device), index), "cuDeviceGet"):
+            return None
+        gpu_info = GpuInfo(gpu_id=index,
+                           uuid=self.__get_uuid(device),
+                           total_memory_mib=self.__get_total_memory_mib(device))
+        name = ctypes.create_string_buffer(100)
+        if self.__cuda.cuDeviceGetName(name, len(name), device) == CUDA_SUCCESS:
+            gpu_info.name = name.value.decode()
+        gpu_info.compute_capability_major = self.__get_attribute(device, CU_DEVICE_ATTRIBUTE_COMPUTE_CAPABILITY_MAJOR)
+        gpu_info.compute_capability_minor = self.__get_attribute(device, CU_DEVICE_ATTRIBUTE_COMPUTE_CAPABILITY_MINOR)
+        multiprocessors = self.__get_attribute(device, CU_DEVICE_ATTRIBUTE_MULTIPROCESSOR_COUNT)
+        if multiprocessors is not None:
+            if gpu_info.compute_capability_major is not None and gpu_info.compute_capability_minor is not None:
+                gpu_info.cores = multiprocessors * ConvertSMVer2Cores(gpu_info.compute_capability_major,
+                                                                      gpu_info.compute_capability_minor) or None
+            threads = self.__get_attribute(device, CU_DEVICE_ATTRIBUTE_MAX_THREADS_PER_MULTIPROCESSOR)
+            if threads is not None:
+                gpu_info.concurrent_threads = multiprocessors * threads
+        clock_rate_khz = self.__get_attribute(device, CU_DEVICE_ATTRIBUTE_CLOCK_RATE)
+        if clock_rate_khz is not None:
+            gpu_info.gpu_clock_mhz = clock_rate_khz // 1000
+        memory_clock_rate_khz = self.__get_attribute(device, CU_DEVICE_ATTRIBUTE_MEMORY_CLOCK_RATE)
+        if memory_clock_rate_khz is not None:
+            gpu_info.memory_clock_mhz = memory_clock_rate_khz // 1000
+        LOGGER.debug("CUDA device %d: %s", index, gpu_info)
+        return gpu_info
 
     def get_gpu_info(self) -> List[GpuInfo]:
-        if self.__cuda is None:
-            libnames = ('libcuda.so', 'libcuda.dylib', 'cuda.dll')
-            for libname in libnames:
-                try:
-                    self.__cuda = ctypes.CDLL(libname)
-                    LOGGER.info('Loading cuda libraries')
-                except OSError:
-                    continue
-                else:
-                    break
-            if self.__cuda is not None:
-
-                nGpus = ctypes.c_int()
-                name = b' ' * 100
-                cc_major = ctypes.c_int()
-                cc_minor = ctypes.c_int()
-                cores = ctypes.c_int()
-                threads_per_core = ctypes.c_int()
-                clockrate = ctypes.c_int()
-                freeMem = ctypes.c_size_t()
-                totalMem = ctypes.c_size_t()
-
-                result = ctypes.c_int()
-                device = ctypes.c_int()
-                context = ctypes.c_void_p()
-                error_str = ctypes.c_char_p()
-                is_continue = True
-                while is_continue:
-                    is_continue = False
-                    result = self.__cuda.cuInit(0)
-                    if result != CUDA_SUCCESS:
-                        self.__cuda.cuGetErrorString(result, ctypes.byref(error_str))
-                        LOGGER.error("cuInit failed with error code %d: %s" % (result, error_str.value.decode()))
-                        break
-                    result = self.__cuda.cuDeviceGetCount(ctypes.byref(nGpus))
-                    if result != CUDA_SUCCESS:
-                        self.__cuda.cuGetErrorString(result, ctypes.byref(error_str))
-                        LOGGER.error("cuDeviceGetCount failed with error code %d: %s" %
-                                     (result, error_str.value.decode()))
-                        break
-                    LOGGER.debug("Found %d device(s)." % nGpus.value)
-                    for i in range(nGpus.value):
-                        cuda_device_name = ''
-                        cuda_compute_capability_major = 0
-                        cuda_compute_capability_minor = 0
-                        cuda_cores = 0
-                        cuda_concurrent_threads = 0
-                        cuda_gpu_clock_mhz = 0
-                        cuda_memory_clock_mhz = 0
-                        cuda_total_memory_mib = 0
-                        cuda_free_memory_mib = 0
-
-                        result = self.__cuda.cuDeviceGet(ctypes.byref(device), i)
-                        if result != CUDA_SUCCESS:
-                            self.__cuda.cuGetErrorString(result, ctypes.byref(error_str))
-                            LOGGER.error("cuDeviceGet failed with error code %d: %s" %
-                                         (result, error_str.value.decode()))
-                            break
-                        LOGGER.debug("Nvidia Device: %d" % i)
-
-                        if self.__cuda.cuDeviceGetName(ctypes.c_char_p(name), len(name), device) == CUDA_SUCCESS:
-                            cuda_device_name = (name.split(b'\0', 1)[0].decode())
-
-                            LOGGER.debug("  Name: %s" % cuda_device_name)
-                        if self.__cuda.cuDeviceComputeCapability(ctypes.byref(cc_major), ctypes.byref(cc_minor),
-                                                                 device) == CUDA_SUCCESS:
-                            cuda_compute_capability_major = cc_major.value
-                            cuda_compute_capability_minor = cc_minor.value
-
-                            LOGGER.debug("  Compute Capability: %d.%d" %
-                                         (cuda_compute_capability_major, cuda_compute_capability_minor))
-                        if self.__cuda.cuDeviceGetAttribute(ctypes.byref(cores),
-                                                            CU_DEVICE_ATTRIBUTE_MULTIPROCESSOR_COUNT,
-                                                            device) == CUDA_SUCCESS:
-                            LOGGER.debug("  Multiprocessors: %d" % cores.value)
-                            cuda_cores = cores.value * ConvertSMVer2Cores(cc_major.value, cc_minor.value)
-                            LOGGER.debug("  CUDA Cores: %s" % (cuda_cores or "unknown"))
-                            if self.__cuda.cuDeviceGetAttribute(ctypes.byref(threads_per_core),
-                                                                CU_DEVICE_ATTRIBUTE_MAX_THREADS_PER_MULTIPROCESSOR,
-                                                                device) == CUDA_SUCCESS:
-                                cuda_concurrent_threads = cores.value * threads_per_core.value
-                                LOGGER.debug("  Concurrent threads: %d" % (cuda_concurrent_threads))
-                        if self.__cuda.cuDeviceGetAttribute(ctypes.byref(clockrate), CU_DEVICE_ATTRIBUTE_CLOCK_RATE,
-                                                            device) == CUDA_SUCCESS:
-                            cuda_gpu_clock_mhz = clockrate.value / 1000.
-                            LOGGER.debug("  GPU clock: %g MHz" % (cuda_gpu_clock_mhz))
-                        if self.__cuda.cuDeviceGetAttribute(ctypes.byref(clockrate),
-                                                            CU_DEVICE_ATTRIBUTE_MEMORY_CLOCK_RATE,
-                                                            device) == CUDA_SUCCESS:
-                            cuda_memory_clock_mhz = clockrate.value / 1000.
-                            LOGGER.debug("  Memory clock: %g MHz" % (cuda_memory_clock_mhz))
-                        result = self.__cuda.cuCtxCreate(ctypes.byref(context), 0, device)
-                        if result != CUDA_SUCCESS:
-                            self.__cuda.cuGetErrorString(result, ctypes.byref(error_str))
-                            LOGGER.error("cuCtxCreate failed with error code %d: %s" %
-                                         (result, error_str.value.decode()))
-                        else:
-                            result = self.__cuda.cuMemGetInfo(ctypes.byref(freeMem), ctypes.byref(totalMem))
-                            if result == CUDA_SUCCESS:
-                                cuda_total_memory_mib = totalMem.value / 1024**2
-                                LOGGER.debug("  Total Memory: %ld MiB" % (cuda_total_memory_mib))
-
-                                cuda_free_memory_mib = freeMem.value / 1024**2
-
-                                LOGGER.debug("  Free Memory: %ld MiB" % (cuda_free_memory_mib))
-                            else:
-                                self.__cuda.cuGetErrorString(result, ctypes.byref(error_str))
-                                LOGGER.error("cuMemGetInfo failed with error code %d: %s" %
-                                             (result, error_str.value.decode()))
-                            self.__cuda.cuCtxDetach(context)
-                        self.__nvidia_device_list.append(GpuInfo(
-                            i,
-                            cuda_device_name,
-                            cuda_compute_capability_major,
-                            cuda_compute_capability_minor,
-                            cuda_cores,
-                            cuda_concurrent_threads,
-                            cuda_gpu_clock_mhz,
-                            cuda_memory_clock_mhz,
-                            cuda_total_memory_mib,
-                            cuda_free_memory_mib,
-                        ))
-
-        return self.__nvidia_device_list
-
-
-def get_process_status_by_pid(pid) -> ProcessStatus:
-    ps_process = psutil.Process(pid=pid)
-    process = _extract_process_info(ps_process)
-    return process
+        with self.__lock:
+            if self.__nvidia_device_list is not None:
+                return self.__nvidia_device_list
+            self.__nvidia_device_list = []
+            self.__cuda = CUDA.get()
+            if self.__cuda is None:
+                return self.__nvidia_device_list
+            if not self.__check(self.__cuda.cuInit(0), "cuInit"):
+                return self.__nvidia_device_list
+            count = ctypes.c_int()
+            if not self.__check(self.__cuda.cuDeviceGetCount(ctypes.byref(count)), "cuDeviceGetCount"):
+                return self.__nvidia_device_list
+            LOGGER.debug("Found %d device(s).", count.value)
+            for index in range(count.value):
+                gpu_info = self.__probe(index)
+                if gpu_info is not None:
+                    self.__nvidia_device_list.append(gpu_info)
+            return self.__nvidia_device_list
+
+
+def merge_gpu_info(nvml_gpus: List[GpuInfo], cuda_gpus: List[GpuInfo]) -> List[GpuInfo]:
+    """
+    NVML devices completed with the attributes only CUDA knows (compute capability, cores, clocks), matched by
+    UUID since the CUDA device order need not be the NVML one. Without NVML the CUDA devices are returned.
+    """
+    if not nvml_gpus:
+        return list(cuda_gpus)
+    by_uuid = {gpu.uuid: gpu for gpu in cuda_gpus if gpu.uuid}
+    ret = []
+    for gpu in nvml_gpus:
+        cuda_gpu = by_uuid.get(gpu.uuid)
+        if cuda_gpu is not None:
+            gpu = dataclasses.replace(gpu)
+            for field in dataclasses.fields(GpuInfo):
+                if getattr(gpu, field.name) is None:
+                    setattr(gpu, field.name, getattr(cuda_gpu, field.name))
+        ret.append(gpu)
+    return ret
+
+
+def get_process_status_by_pid(pid, sample_id: Optional[int] = None) -> ProcessStatus:
+    process_table = ProcessTable()
+    return process_table.extract(process_table.get_process(pid), sample_id)
+
+
+def get_process_cpu_stats(pid) -> Optional[WindowStats]:
+    """
+    min / avg / max CPU percent of ``pid`` over the last ProcessTable.WINDOW_SIZE samples
+    """
+    return ProcessTable().get_cpu_stats(pid)
 
 
 def get_process_status_by_name(name='python3') -> List[ProcessStatus]:
+    """
+    Processes started, or PIDs reused, after the last ProcessTable scan show up with the next one
+    """
     process_list = []
-    for ps_process in psutil.process_iter():
-        name_, exe, cmdline = "", "", []
+    process_table = ProcessTable()
+    for ps_process in process_table.find(name):
         try:
-            name_ = ps_process.name()
-            cmdline = ps_process.cmdline()
-            exe = ps_process.exe()
-        except (psutil.AccessDenied, psutil.ZombieProcess):
-            pass
-        except psutil.NoSuchProcess:
+            process_list.append(process_table.extract(ps_process))
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
             continue
-        if len(cmdline):
-            if name == name_ or cmdline[0] == name or os.path.basename(exe) == name:
-                process_list.append(_extract_process_info(ps_process))
     return process_list
 
 
@@ -374,40 +556,16 @@ def get_process_status_running_on_gpus() -> List[ProcessStatus]:
 
 
 def _extract_process_info(ps_process) -> ProcessStatus:
-    process = ProcessStatus()
-    try:
-        process.username = ps_process.username()
-    except psutil.AccessDenied:
-        pass
-
-    # cmdline returns full path;,        # as in `ps -o comm`, get short cmdnames.
-    _cmdline = None
-    try:
-        _cmdline = ps_process.cmdline()
-    except psutil.AccessDenied:
-        pass
-
-    if not _cmdline:
-        # sometimes, zombie or unknown (e.g. [kworker/8:2H])
-        process.command = '?'
-        process.full_command = ['?']
-    else:
-        process.command = os.path.basename(_cmdline[0])
-        process.full_command = _cmdline
-    try:
-        process.cpu_percent = ps_process.cpu_percent() / psutil.cpu_count()
-        process.cpu_memory_usage_mib = round((ps_process.memory_percent() / 100.0) *
-                                         psutil.virtual_memory().total // MB)
-    except psutil.AccessDenied:
-        pass
-    process.pid = ps_process.pid
-    return process
+    return ProcessTable().extract(ps_process)
 
 
 def get_process_status() -> List[ProcessStatus]:
     ret = get_process_status_running_on_gpus()
     if not len(ret):
         ret = get_process_status_by_name()
+    else:
+        # get_process_status_by_name evicts with its scans
+        ProcessTable().evict_dead_if_due()
     return ret
 
 
@@ -416,21 +574,30 @@ def get_cpu_status() -> CpuStatus:
                      cpu_memory_usage_percent=psutil.virtual_memory().percent)
 
 
-def get_gpu_status() -> List[GpuStatus]:
-    return GpuInfoFromNvml().get_gpu_status()
+def get_gpu_status(with_processes: bool = True) -> List[GpuStatus]:
+    return GpuInfoFromNvml().get_gpu_status(with_processes)
 
 
 def get_gpu_info() -> List[GpuInfo]:
-    return GpuInfoFromNvml().get_gpu_info()
+    return merge_gpu_info(GpuInfoFromNvml().get_gpu_info(), GpuInfoFromCudaLib().get_gpu_info())
 
 
 def get_system_status() -> SystemStatus:
     return SystemStatus(cpu=get_cpu_status(), gpus=get_gpu_status(), processes=get_process_status())
 
 
+def get_fast_system_status(processes: List[ProcessStatus]) -> SystemStatus:
+    """
+    CPU and GPU counters only, ``processes`` (usually those of the last full sample) are passed through
+    """
+    return SystemStatus(cpu=get_cpu_status(), gpus=get_gpu_status(with_processes=False), processes=processes)
+
+
 def get_cpu() -> CpuInfo:
     cpu = CpuInfo()
     try:
+        # cpuinfo spawns subprocesses on import and call, see system_info_cache
+        from cpuinfo import get_cpu_info
         cpu_info = get_cpu_info()
         cpu.name = cpu_info["brand_raw"]
         cpu.frequency = cpu_info["hz_advertised_friendly"]
@@ -447,6 +614,47 @@ def get_system_info() -> SystemInfo:
     return SystemInfo(host_name=platform.uname().node, os=platform.platform(), cpu=get_cpu(), gpus=get_gpu_info())
 
 
+def get_default_model_list() -> NnModelMaxChannelInfoList:
+    model_list = NnModelMaxChannelInfoList()
+    model_list.models.append(NnModelMaxChannelInfo(key=NnModelInfo(75, 416, 416), max_channel=2))
+    model_list.models.append(NnModelMaxChannelInfo(key=NnModelInfo(76, 416, 416), max_channel=3))
+    return model_list
+
+
+def read_model_list(file_name: str = CHANNEL_GPU_MANAGER_FILE_NAME) -> Optional[NnModelMaxChannelInfoList]:
+    """
+    The model list of a ChannelGpuManager configuration file, None without one or without any models in it
+    """
+    import yaml
+    try:
+        with open(file_name, 'r') as infile:
+            model_list = NnModelMaxChannelInfoList.from_dict(yaml.safe_load(infile))
+    except FileNotFoundError:
+        return None
+    if not model_list or not len(model_list.models):
+        return None
+    return model_list
+
+
+def get_model_list() -> NnModelMaxChannelInfoList:
+    """
+    The model list of the ChannelGpuManager when it exists, else the one it would start with. Unlike creating the
+    manager this neither polls the GPUs nor writes the configuration file.
+    """
+    if ChannelGpuManager._instance is not None:
+        return ChannelGpuManager().model_list
+    return read_model_list() or get_default_model_list()
+
+
+def get_placement_policy(model_list: NnModelMaxChannelInfoList) -> PlacementPolicy:
+    try:
+        return PlacementPolicy(model_list.placement_policy)
+    except ValueError:
+        LOGGER.error("Unknown placement policy %s, using %s", model_list.placement_policy,
+                     PlacementPolicy.LEAST_LOADED.value)
+        return PlacementPolicy.LEAST_LOADED
+
+
 @singleton
 class ChannelGpuManager:
     """
@@ -455,30 +663,26 @@ class ChannelGpuManager:
     def __init__(self) -> None:
         self.channel_to_gpu_map: Dict[ChannelAndNnModel, ModelCount] = {}
         self.gpu_id_generator = 0
-        self.configuration_file_name = self.__class__.__name__ + ".yml"
+        self.configuration_file_name = CHANNEL_GPU_MANAGER_FILE_NAME
         self.model_list = self.__read_default_models()
-        self.number_of_gpus = len(get_gpu_status())
+        gpus = get_gpu_status()
+        self.number_of_gpus = len(gpus)
+        self.placement_engine = PlacementEngine(gpus, self.model_list.models, get_placement_policy(self.model_list))
+        self.rebalancer: Optional[ChannelRebalancer] = None
 
     def __write_default_models(self) -> NnModelMaxChannelInfoList:
-        model_list = NnModelMaxChannelInfoList()
-        model_list.models.append(NnModelMaxChannelInfo(key=NnModelInfo(75, 416, 416), max_channel=2))
-        model_list.models.append(NnModelMaxChannelInfo(key=NnModelInfo(76, 416, 416), max_channel=3))
+        model_list = get_default_model_list()
+        self.__write_models(model_list)
+        return model_list
 
+    def __write_models(self, model_list: NnModelMaxChannelInfoList) -> None:
+        import yaml
         with open(self.configuration_file_name, 'w') as outfile:
             yaml.dump(model_list.to_dict(), outfile)
 
-        return model_list
-
     def __read_default_models(self) -> NnModelMaxChannelInfoList:
-        model_list = None
-        try:
-            with open(self.configuration_file_name, 'r') as infile:
-                model_list = NnModelMaxChannelInfoList.from_dict(yaml.safe_load(infile))
-        except FileNotFoundError:
-            pass
-        if not model_list:
-            model_list = self.__write_default_models()
-        if not len(model_list.models):
+        model_list = read_model_list(self.configuration_file_name)
+        if model_list is None:
             model_list = self.__write_default_models()
         return model_list
         
@@ -489,16 +693,191 @@ class ChannelGpuManager:
             self.gpu_id_generator = (self.gpu_id_generator + 1) % self.number_of_gpus
         return ret
 
-    
-
-def get_gpu_id_for_the_channel(channel_id: int, purpose: int, width: int, height: int, media_tpe: int = 2) -> int:
+    def assign(self, candidate: ChannelAndNnModel, fps: float = 0.0, pid: Optional[int] = None) -> ModelCount:
+        """
+        ``pid`` is the process which will run the channel, it is only used to attribute measured GPU usage
+        """
+        with self.placement_engine.lock:
+            x = self.channel_to_gpu_map.get(candidate)
+            if x is not None:
+                x.count = x.count + 1
+                if pid is not None:
+                    x.pid = pid
+                return x
+            cost = self.placement_engine.get_cost(candidate.model_id, fps)
+            gpu_id = self.placement_engine.place(cost)
+            if gpu_id < 0:
+                gpu_id = self.get_next_gpu_id()
+            x = ModelCount(gpu_id=gpu_id, fps_consumed=cost.fps, pid=pid)
+            self.channel_to_gpu_map[candidate] = x
+            return x
+
+    def release(self, candidate: ChannelAndNnModel) -> Optional[ModelCount]:
+        """
+        Undo one assign(). The channel frees its GPU budget once its count drops to zero.
+        """
+        with self.placement_engine.lock:
+            x = self.channel_to_gpu_map.get(candidate)
+            if x is None:
+                return None
+            x.count = x.count - 1
+            if x.count <= 0:
+                self.unassign(candidate)
+            return x
+
+    def unassign(self, candidate: ChannelAndNnModel) -> Optional[ModelCount]:
+        with self.placement_engine.lock:
+            x = self.channel_to_gpu_map.pop(candidate, None)
+            if x is not None:
+                x.count = 0
+                self.placement_engine.release(x.gpu_id,
+                                              self.placement_engine.get_cost(candidate.model_id, x.fps_consumed))
+            return x
+
+    def migrate(self, candidate: ChannelAndNnModel, gpu_id: int) -> Optional[ModelCount]:
+        with self.placement_engine.lock:
+            x = self.channel_to_gpu_map.get(candidate)
+            if x is None or x.gpu_id == gpu_id:
+                return x
+            self.placement_engine.move(x.gpu_id, gpu_id,
+                                       self.placement_engine.get_cost(candidate.model_id, x.fps_consumed))
+            x.gpu_id = gpu_id
+            return x
+
+    def get_assignment_counts(self) -> Dict[Tuple[int, int, int, int], int]:
+        """
+        Number of assigned channels per (gpu_id, purpose, width, height)
+        """
+        counts: Dict[Tuple[int, int, int, int], int] = {}
+        with self.placement_engine.lock:
+            for k, v in self.channel_to_gpu_map.items():
+                key = (v.gpu_id, k.model_id.purpose, k.model_id.width, k.model_id.height)
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def get_assignments(self) -> List[Tuple[ChannelAndNnModel, ModelCount]]:
+        with self.placement_engine.lock:
+            return [(k, ModelCount(v.gpu_id, v.count, v.fps_consumed, v.pid))
+                    for k, v in self.channel_to_gpu_map.items()]
+
+    def update_model_limits(self, costs: List[ModelCost], min_samples: int = 60, write: bool = True) -> int:
+        """
+        Take max_channel and max_fps of every model from its measured suggestion, for costs with at least
+        ``min_samples`` samples. The budgets of the assigned channels are recomputed with the new limits and the
+        model list is written back to the configuration file. Returns the number of models changed.
+        """
+        changed = 0
+        with self.placement_engine.lock:
+            # Limits apply by purpose and input size, whatever max_fps / memory the keys carry
+            limits = {get_limit_key(limit.key): limit for limit in self.model_list.models}
+            updates = []
+            for cost in costs:
+                if cost.samples < min_samples or cost.suggested_max_channel <= 0:
+                    continue
+                key = get_limit_key(cost.key)
+                limit = limits.get(key)
+                if limit is None:
+                    limit = NnModelMaxChannelInfo(key=key, max_channel=cost.suggested_max_channel)
+                elif limit.max_channel == cost.suggested_max_channel and limit.max_fps == cost.suggested_max_fps:
+                    continue
+                updates.append((limit, cost))
+            if not updates:
+                return 0
+            # Reserved costs have to be released with the limits they were reserved with
+            for candidate, x in self.channel_to_gpu_map.items():
+                self.placement_engine.release(x.gpu_id,
+                                              self.placement_engine.get_cost(candidate.model_id, x.fps_consumed))
+            for limit, cost in updates:
+                key = get_limit_key(limit.key)
+                LOGGER.info("Model %s: max_channel %d -> %d, max_fps %.1f -> %.1f", key,
+                            limit.max_channel if key in limits else 0, cost.suggested_max_channel,
+                            limit.max_fps if key in limits else 0.0, cost.suggested_max_fps)
+                limit.max_channel = cost.suggested_max_channel
+                limit.max_fps = cost.suggested_max_fps
+                if key not in limits:
+                    self.model_list.models.append(limit)
+                    limits[key] = limit
+                self.placement_engine.set_limit(limit)
+                changed += 1
+            for candidate, x in self.channel_to_gpu_map.items():
+                self.placement_engine.reserve(x.gpu_id,
+                                              self.placement_engine.get_cost(candidate.model_id, x.fps_consumed))
+            if write:
+                self.__write_models(self.model_list)
+        return changed
+
+    def get_channels_on_gpu(self, gpu_id: int) -> List[ChannelAndNnModel]:
+        with self.placement_engine.lock:
+            return [k for k, v in self.channel_to_gpu_map.items() if v.gpu_id == gpu_id]
+
+    def start_rebalancer(self,
+                         on_migrate: Optional[Callable[[ChannelAndNnModel, int, int], None]] = None,
+                         on_event: Optional[Callable[[GpuEvent], None]] = None) -> None:
+        """
+        Without ``on_migrate`` the rebalancer only reports the migrations it would make, see ChannelRebalancer
+        """
+        if self.rebalancer is None:
+            # Counters only: a rebalancer poll must not replace the process list of the sampler's poll
+            self.rebalancer = ChannelRebalancer(self, self.model_list.rebalancer,
+                                                lambda: get_gpu_status(with_processes=False), on_migrate, on_event)
+            self.rebalancer.start()
+
+    def stop_rebalancer(self) -> None:
+        if self.rebalancer is not None:
+            self.rebalancer.stop()
+            self.rebalancer = None
+
+
+def get_gpu_id_for_the_channel(channel_id: int,
+                               purpose: int,
+                               width: int,
+                               height: int,
+                               media_tpe: int = 2,
+                               fps: float = 0.0,
+                               pid: Optional[int] = None) -> int:
     candidate = ChannelAndNnModel(channel_id, NnModelInfo(purpose, width, height))
-    if candidate in ChannelGpuManager().channel_to_gpu_map.keys():
-        x = ChannelGpuManager().channel_to_gpu_map[candidate]
-        x.count = x.count + 1
-
-    else:
-        x = ModelCount(gpu_id=ChannelGpuManager().get_next_gpu_id())
-        ChannelGpuManager().channel_to_gpu_map[candidate] = x
-    print(candidate, x)
+    x = ChannelGpuManager().assign(candidate, fps, pid)
+    LOGGER.debug("%s %s", candidate, x)
     return x.gpu_id
+
+
+def start_channel_rebalancer(on_migrate: Optional[Callable[[ChannelAndNnModel, int, int], None]] = None,
+                             on_event: Optional[Callable[[GpuEvent], None]] = None) -> bool:
+    """
+    Start the rebalancer of ChannelGpuManager when its model list enables it. The rebalancer is only configured in
+    the model list file, without the file it is off and no manager is created. Without ``on_migrate`` it only
+    reports, see ChannelRebalancer.
+    """
+    if not os.path.exists(CHANNEL_GPU_MANAGER_FILE_NAME):
+        return False
+    manager = ChannelGpuManager()
+    if not manager.model_list.rebalancer.enabled:
+        return False
+    manager.start_rebalancer(on_migrate, on_event)
+    LOGGER.info("Channel rebalancer started%s", "" if on_migrate is not None else " in report mode")
+    return True
+
+
+def stop_channel_rebalancer() -> None:
+    if ChannelGpuManager._instance is not None:
+        ChannelGpuManager().stop_rebalancer()
+
+
+def get_channel_assignment_counts() -> Dict[Tuple[int, int, int, int], int]:
+    """
+    Empty until a channel was placed in this process: the manager reads its model list and polls the GPUs when it
+    is created, which a metrics scrape should not do
+    """
+    if ChannelGpuManager._instance is None:
+        return {}
+    return ChannelGpuManager().get_assignment_counts()
+
+
+def release_gpu_for_the_channel(channel_id: int, purpose: int, width: int, height: int) -> Optional[int]:
+    x = ChannelGpuManager().release(ChannelAndNnModel(channel_id, NnModelInfo(purpose, width, height)))
+    return x.gpu_id if x is not None else None
+
+
+def unassign_gpu_for_the_channel(channel_id: int, purpose: int, width: int, height: int) -> Optional[int]:
+    x = ChannelGpuManager().unassign(ChannelAndNnModel(channel_id, NnModelInfo(purpose, width, height)))
+    return x.gpu_id if x is not None else None
@@ -0,0 +1,194 @@
+import logging
+import math
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from .controllers import ChannelGpuManager
+from .models import ChannelAndNnModel, ModelCost, ModelCount, NnModelInfo, ProcessStatus, SystemStatus
+from .pipeline import SampleSink
+from .placement import get_limit_key
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _ModelUsage:
+    """
+    Decayed sums of the usage attributed to the channels of one model
+    """
+    __slots__ = ("samples", "weight", "sm", "encoder", "decoder", "memory", "fps")
+
+    def __init__(self) -> None:
+        self.samples = 0
+        self.weight = 0.0
+        self.sm = 0.0
+        self.encoder = 0.0
+        self.decoder = 0.0
+        self.memory = 0.0
+        self.fps = 0.0
+
+    def decay(self, factor: float) -> None:
+        self.weight *= factor
+        self.sm *= factor
+        self.encoder *= factor
+        self.decoder *= factor
+        self.memory *= factor
+        self.fps *= factor
+
+    def add(self, sm: float, encoder: float, decoder: float, memory: float, fps: float) -> None:
+        self.samples += 1
+        self.weight += 1.0
+        self.sm += sm
+        self.encoder += encoder
+        self.decoder += decoder
+        self.memory += memory
+        self.fps += fps
+
+
+class ChannelCostAccountant(SampleSink):
+    """
+    Attribute the per-process GPU utilization of every sample to the channels assigned by ChannelGpuManager and
+    measure what one channel of every model really costs.
+
+    Channels assigned with a pid get a share of that process's usage on their GPU, weighted by the expected
+    load of their model. The usage of processes no channel claims is shared the same way by the channels of
+    that GPU assigned without a pid. Per channel usage is averaged per model with an exponential decay of
+    ``half_life_samples`` samples.
+
+    get_model_costs() turns the averages into max_channel / max_fps suggestions, so that the busiest engine
+    (SM, encoder or decoder) and the memory of a GPU stay under ``target_utilization``. They can be fed back
+    with ChannelGpuManager.update_model_limits, apply() does that every ``apply_interval_sec`` when it is set.
+    """
+
+    def __init__(self,
+                 manager: Optional[ChannelGpuManager] = None,
+                 target_utilization: float = 0.9,
+                 half_life_samples: int = 600,
+                 apply_interval_sec: float = 0.0,
+                 min_samples: int = 60) -> None:
+        self.manager = manager or ChannelGpuManager()
+        self.target_utilization = target_utilization
+        self.apply_interval_sec = apply_interval_sec
+        self.min_samples = min_samples
+        self.__last_apply: Optional[int] = None
+        self.decay = 0.5**(1.0 / half_life_samples) if half_life_samples > 0 else 1.0
+        self.__lock = Lock()
+        self.__usage: Dict[NnModelInfo, _ModelUsage] = {}
+        self.__memory_total: Optional[int] = None
+        self.__last_process: Optional[ProcessStatus] = None
+
+    def __attribute(self, channels: List[Tuple[ChannelAndNnModel, ModelCount]],
+                    processes: List[ProcessStatus]) -> List[Tuple[ChannelAndNnModel, ModelCount, Tuple]]:
+        """
+        Share the usage of ``processes`` over ``channels`` by expected load,
+        returns (channel, count, (sm, encoder, decoder, memory)). A channel is one share however often it was
+        assigned, ModelCount.count counts the assign() calls and not the streams.
+        """
+        if not channels:
+            return []
+        sm = sum(p.gpu_sm_percent or 0.0 for p in processes)
+        encoder = sum(p.gpu_encoder_percent or 0.0 for p in processes)
+        decoder = sum(p.gpu_decoder_percent or 0.0 for p in processes)
+        memory = sum(p.gpu_memory_usage_mib or 0 for p in processes)
+        engine = self.manager.placement_engine
+        weights = [engine.get_cost(candidate.model_id, x.fps_consumed).load for candidate, x in channels]
+        total = sum(weights)
+        if total <= 0:
+            weights = [1.0] * len(channels)
+            total = float(len(channels))
+        ret = []
+        for (candidate, x), weight in zip(channels, weights):
+            share = weight / total
+            ret.append((candidate, x, (sm * share, encoder * share, decoder * share, memory * share)))
+        return ret
+
+    def on_sample(self, timestamp: int, system_status: SystemStatus) -> None:
+        processes = system_status.processes
+        # Fast samples carry the processes of the last full sample, they are accounted once
+        if not processes or processes[0] is self.__last_process:
+            return
+        self.__last_process = processes[0]
+        if not any(p.gpu_sm_percent is not None for p in processes):
+            return
+
+        by_gpu: Dict[int, Dict[int, ProcessStatus]] = {}
+        for process in processes:
+            if process.gpu_id is not None:
+                by_gpu.setdefault(process.gpu_id, {})[process.pid] = process
+        channels_by_gpu: Dict[int, List[Tuple[ChannelAndNnModel, ModelCount]]] = {}
+        for candidate, x in self.manager.get_assignments():
+            channels_by_gpu.setdefault(x.gpu_id, []).append((candidate, x))
+
+        attributed = []
+        for gpu_id, channels in channels_by_gpu.items():
+            gpu_processes = by_gpu.get(gpu_id, {})
+            by_pid: Dict[int, List[Tuple[ChannelAndNnModel, ModelCount]]] = {}
+            unbound = []
+            for candidate, x in channels:
+                if x.pid is not None and x.pid in gpu_processes:
+                    by_pid.setdefault(x.pid, []).append((candidate, x))
+                else:
+                    unbound.append((candidate, x))
+            for pid, pid_channels in by_pid.items():
+                attributed.extend(self.__attribute(pid_channels, [gpu_processes[pid]]))
+            unclaimed = [p for pid, p in gpu_processes.items() if pid not in by_pid]
+            attributed.extend(self.__attribute(unbound, unclaimed))
+
+        memory_totals = [gpu.memory_total for gpu in system_status.gpus if gpu.memory_total and not gpu.is_stale]
+        with self.__lock:
+            if memory_totals:
+                self.__memory_total = min(memory_totals)
+            for usage in self.__usage.values():
+                usage.decay(self.decay)
+            for candidate, x, (sm, encoder, decoder, memory) in attributed:
+                # Same key as the placement limits, see PlacementEngine.get_limit
+                model = get_limit_key(candidate.model_id)
+                usage = self.__usage.get(model)
+                if usage is None:
+                    usage = self.__usage[model] = _ModelUsage()
+                usage.add(sm, encoder, decoder, memory, x.fps_consumed)
+
+        if self.apply_interval_sec > 0:
+            if self.__last_apply is None:
+                self.__last_apply = timestamp
+            elif timestamp - self.__last_apply >= self.apply_interval_sec * 1000:
+                self.__last_apply = timestamp
+                self.apply(self.min_samples)
+
+    def get_model_costs(self) -> List[ModelCost]:
+        with self.__lock:
+            items = list(self.__usage.items())
+            memory_total = self.__memory_total
+        ret = []
+        for model, usage in items:
+            if usage.weight <= 0:
+                continue
+            cost = ModelCost(key=model,
+                             samples=usage.samples,
+                             sm_percent=usage.sm / usage.weight,
+                             encoder_percent=usage.encoder / usage.weight,
+                             decoder_percent=usage.decoder / usage.weight,
+                             gpu_memory_mib=usage.memory / usage.weight,
+                             fps=usage.fps / usage.weight)
+            limits = []
+            busiest = max(cost.sm_percent, cost.encoder_percent, cost.decoder_percent)
+            if busiest > 0:
+                limits.append(math.floor(self.target_utilization * 100.0 / busiest))
+            if memory_total and cost.gpu_memory_mib > 0:
+                limits.append(math.floor(self.target_utilization * memory_total / cost.gpu_memory_mib))
+            if limits:
+                cost.suggested_max_channel = max(min(limits), 1)
+                cost.suggested_max_fps = cost.suggested_max_channel * cost.fps
+            ret.append(cost)
+        return ret
+
+    def apply(self, min_samples: Optional[int] = None, write: bool = True) -> int:
+        """
+        Feed the suggestions back to the placement limits, see ChannelGpuManager.update_model_limits
+        """
+        if min_samples is None:
+            min_samples = self.min_samples
+        return self.manager.update_model_limits(self.get_model_costs(), min_samples, write)
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__usage.clear()
@@ -0,0 +1,167 @@
+import logging
+import time
+from threading import Event, Thread
+from typing import Callable, Dict, List, Optional, Set
+
+from .backends import nvml as N
+from .controllers import GpuInfoFromNvml, NvmlDevice
+from .models import GpuEvent
+from .rebalancer import REBALANCE
+from .utils import get_current_time
+
+LOGGER = logging.getLogger(__name__)
+
+XID = "xid"
+SINGLE_BIT_ECC = "single_bit_ecc"
+DOUBLE_BIT_ECC = "double_bit_ecc"
+POWER_SOURCE = "power_source"
+THROTTLE = "throttle"
+PSTATE = "pstate"
+# REBALANCE comes from the rebalancer, the others from the GpuEventListener
+EVENT_TYPES = (XID, SINGLE_BIT_ECC, DOUBLE_BIT_ECC, POWER_SOURCE, THROTTLE, PSTATE, REBALANCE)
+
+# NVML event type -> GpuEvent.event_type, for the events delivered through an event set
+NVML_EVENTS = (
+    ("nvmlEventTypeXidCriticalError", XID),
+    ("nvmlEventTypeSingleBitEccError", SINGLE_BIT_ECC),
+    ("nvmlEventTypeDoubleBitEccError", DOUBLE_BIT_ECC),
+    ("nvmlEventTypePowerSourceChange", POWER_SOURCE),
+)
+
+THROTTLE_REASONS = (
+    ("nvmlClocksThrottleReasonApplicationsClocksSetting", "applications_clocks"),
+    ("nvmlClocksThrottleReasonSwPowerCap", "sw_power_cap"),
+    ("nvmlClocksThrottleReasonHwSlowdown", "hw_slowdown"),
+    ("nvmlClocksThrottleReasonSyncBoost", "sync_boost"),
+    ("nvmlClocksThrottleReasonSwThermalSlowdown", "sw_thermal"),
+    ("nvmlClocksThrottleReasonHwThermalSlowdown", "hw_thermal"),
+    ("nvmlClocksThrottleReasonHwPowerBrakeSlowdown", "hw_power_brake"),
+    ("nvmlClocksThrottleReasonDisplayClockSetting", "display_clocks"),
+)
+
+
+def describe_throttle_reasons(reasons: int) -> str:
+    names = [name for constant, name in THROTTLE_REASONS if reasons & getattr(N, constant, 0)]
+    return ",".join(names) or "none"
+
+
+class GpuEventListener(Thread):
+    """
+    Report what 1 s sampling misses: XID errors, ECC errors and power source changes through an NVML event set,
+    clock throttle reasons and performance state changes by polling them every ``poll_interval_sec``.
+
+    The idle throttle reason is ignored, it flips with every pause of the workload. The first poll only records
+    the initial state, events are raised for changes after it.
+    """
+
+    def __init__(self, on_event: Callable[[GpuEvent], None], poll_interval_sec: float = 0.1) -> None:
+        super().__init__(name="gpu_events", daemon=True)
+        self.on_event = on_event
+        self.poll_interval_sec = poll_interval_sec
+        self.__is_stop = Event()
+        self.__event_set = None
+        self.__devices: Dict[int, NvmlDevice] = {}
+        self.__throttle_reasons: Dict[int, int] = {}
+        self.__performance_states: Dict[int, int] = {}
+        self.__unsupported: Dict[int, Set[str]] = {}
+
+    def __emit(self, device: NvmlDevice, event_type: str, data: int, description: str) -> None:
+        event = GpuEvent(timestamp=get_current_time(),
+                         gpu_index=device.index,
+                         event_type=event_type,
+                         data=data,
+                         uuid=device.uuid,
+                         description=description)
+        level = logging.WARNING if event_type in (XID, DOUBLE_BIT_ECC) else logging.INFO
+        LOGGER.log(level, "GPU %d %s %s", device.index, event_type, description)
+        self.on_event(event)
+
+    def __query(self, device: NvmlDevice, name: str, fn) -> Optional[int]:
+        unsupported = self.__unsupported.setdefault(device.index, set())
+        if name in unsupported or fn is None:
+            return None
+        try:
+            return fn(device.handle)
+        except N.NVMLError as e:
+            if getattr(e, "value", None) == N.NVML_ERROR_NOT_SUPPORTED:
+                unsupported.add(name)
+            return None
+
+    def __register(self, devices: List[NvmlDevice]) -> None:
+        try:
+            self.__event_set = N.nvmlEventSetCreate()
+        except N.NVMLError as e:
+            LOGGER.warning("NVML events are not available: %s", e)
+            return
+        wanted = 0
+        for constant, _ in NVML_EVENTS:
+            wanted |= getattr(N, constant, 0)
+        for device in devices:
+            try:
+                mask = N.nvmlDeviceGetSupportedEventTypes(device.handle) & wanted
+                if mask:
+                    N.nvmlDeviceRegisterEvents(device.handle, mask, self.__event_set)
+            except N.NVMLError as e:
+                LOGGER.warning("Can not register NVML events of GPU %d: %s", device.index, e)
+
+    def __wait_event(self, timeout_sec: float) -> None:
+        wait = getattr(N, "nvmlEventSetWait_v2", None) or N.nvmlEventSetWait
+        try:
+            data = wait(self.__event_set, max(int(timeout_sec * 1000), 1))
+        except N.NVMLError as e:
+            if getattr(e, "value", None) != N.NVML_ERROR_TIMEOUT:
+                LOGGER.error("Waiting for NVML events failed: %s", e)
+                self.__is_stop.wait(timeout_sec)
+            return
+        device = self.__devices.get(N.nvmlDeviceGetIndex(data.device))
+        if device is None:
+            return
+        for constant, event_type in NVML_EVENTS:
+            if data.eventType & getattr(N, constant, 0):
+                description = f"XID {data.eventData}" if event_type == XID else event_type
+                self.__emit(device, event_type, int(data.eventData), description)
+
+    def __poll(self) -> None:
+        idle = getattr(N, "nvmlClocksThrottleReasonGpuIdle", 0)
+        get_throttle_reasons = getattr(N, "nvmlDeviceGetCurrentClocksThrottleReasons", None)
+        for device in self.__devices.values():
+            reasons = self.__query(device, "throttle_reasons", get_throttle_reasons)
+            if reasons is not None:
+                reasons &= ~idle
+                previous = self.__throttle_reasons.get(device.index)
+                self.__throttle_reasons[device.index] = reasons
+                if previous is not None and reasons != previous:
+                    self.__emit(device, THROTTLE, reasons, describe_throttle_reasons(reasons))
+            state = self.__query(device, "performance_state", N.nvmlDeviceGetPerformanceState)
+            if state is not None:
+                previous = self.__performance_states.get(device.index)
+                self.__performance_states[device.index] = state
+                if previous is not None and state != previous:
+                    self.__emit(device, PSTATE, state, f"P{previous} -> P{state}")
+
+    def run(self) -> None:
+        devices = GpuInfoFromNvml().get_devices()
+        self.__devices = {device.index: device for device in devices}
+        if not devices:
+            return
+        self.__register(devices)
+        next_poll = time.monotonic()
+        try:
+            while not self.__is_stop.is_set():
+                timeout = max(next_poll - time.monotonic(), 0.0)
+                if self.__event_set is not None:
+                    self.__wait_event(timeout)
+                elif self.__is_stop.wait(timeout):
+                    break
+                if time.monotonic() >= next_poll:
+                    self.__poll()
+                    next_poll = time.monotonic() + self.poll_interval_sec
+        finally:
+            if self.__event_set is not None:
+                try:
+                    N.nvmlEventSetFree(self.__event_set)
+                except N.NVMLError as e:
+                    LOGGER.error(e)
+
+    def stop(self) -> None:
+        self.__is_stop.set()
@@ -0,0 +1,521 @@
+"""
+Fleet aggregation of check_cuda agents.
+
+Agents and query clients talk to the aggregator over TCP in frames of a 4 byte big endian length followed by a
+codec.pack (msgpack) encoded message. An agent sends::
+
+    {"type": "hello", "node": "<host name>", "info": {<SystemInfo.to_dict()>}}
+
+and then the full / delta messages of a streaming.DeltaEncoder, one per sample which changed beyond the deadbands,
+and an empty delta as a heartbeat when it sent nothing for ``heartbeat_sec``. A query client sends::
+
+    {"type": "query", "id": 1, "query": "leastLoaded", "purpose": 75, "width": 416, "height": 416, "count": 1}
+
+and gets ``{"type": "result", "id": 1, "result": ...}`` or ``{"type": "error", "id": 1, "message": "..."}``
+back. Queries are ``nodes``, ``latest`` (``node``), ``aggregate`` (``node``, ``metric``, ``seconds``) and
+``leastLoaded`` (``purpose``, ``width``, ``height``, ``fps``, ``count``, all optional).
+"""
+import asyncio
+import heapq
+import logging
+import queue
+import select
+import socket
+import struct
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from . import codec
+from .models import NnModelInfo, NnModelMaxChannelInfo, SystemInfo, SystemStatus
+from .pipeline import SampleSink
+from .placement import LOAD_EPSILON, ChannelCost, get_channel_cost
+from .streaming import DeltaDecoder, DeltaEncoder, is_heartbeat
+from .timeseries import SystemStatusStore
+from .utils import get_current_time
+
+LOGGER = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    data = codec.pack(message)
+    return FRAME_HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    """
+    Next message, None when the peer closed the connection
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length, ) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes is too large")
+    return codec.unpack(await reader.readexactly(length))
+
+
+def _recv_exactly(sock: socket.socket, length: int) -> bytes:
+    data = bytearray()
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def recv_frame(sock: socket.socket) -> Dict[str, Any]:
+    (length, ) = FRAME_HEADER.unpack(_recv_exactly(sock, FRAME_HEADER.size))
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes is too large")
+    return codec.unpack(_recv_exactly(sock, length))
+
+
+class FleetGpu(NamedTuple):
+    node: str
+    index: int
+    uuid: Optional[str]
+    name: Optional[str]
+    # Largest of the GPU, encoder and decoder utilization, 0.0 - 1.0
+    load: float
+    memory_free_mib: Optional[float]
+
+
+class NodeState:
+    """
+    What the aggregator knows about one agent
+    """
+
+    def __init__(self, name: str, history_size: int) -> None:
+        self.name = name
+        self.system_info: Optional[SystemInfo] = None
+        self.status: Optional[SystemStatus] = None
+        self.timestamp = 0
+        self.last_seen = 0.0
+        self.is_connected = False
+        self.store = SystemStatusStore(history_size)
+        self.gpus: List[FleetGpu] = []
+        self.decoder = DeltaDecoder(as_records=True)
+
+    def update(self, timestamp: int, status: SystemStatus) -> None:
+        self.status = status
+        self.timestamp = timestamp
+        self.last_seen = time.monotonic()
+        self.store.append(timestamp, status)
+        gpus = []
+        for gpu in status.gpus:
+            if gpu.is_stale:
+                continue
+            utilizations = [u for u in (gpu.utilization_gpu, gpu.utilization_enc, gpu.utilization_dec) if u is not None]
+            memory_free = None
+            if gpu.memory_total:
+                memory_free = float(max(gpu.memory_total - (gpu.memory_used or 0), 0))
+            gpus.append(FleetGpu(self.name, gpu.index, gpu.uuid, gpu.name,
+                                 max(utilizations, default=0.0) / 100.0, memory_free))
+        self.gpus = gpus
+
+    def touch(self, timestamp: int) -> None:
+        """
+        Heartbeat, the node is alive and its last status still holds
+        """
+        self.timestamp = timestamp
+        self.last_seen = time.monotonic()
+
+
+class FleetAggregator:
+    """
+    Latest state and ``history_size`` samples of history of every agent, and fleet wide queries on them.
+
+    Connections are served on an asyncio event loop, either next to the sampler in the asyncio service mode
+    (add_task(serve)) or on a thread of its own (start()). Queries may also be called directly from any thread.
+    Nodes which sent nothing for ``stale_after_sec`` are left out of get_least_loaded_gpus. Idle agents send a
+    heartbeat every ``heartbeat_sec``, so ``stale_after_sec`` has to be a few times that.
+    """
+
+    def __init__(self,
+                 host: str = "0.0.0.0",
+                 port: int = 9411,
+                 history_size: int = 300,
+                 stale_after_sec: float = 15.0,
+                 limits: Optional[List[NnModelMaxChannelInfo]] = None) -> None:
+        self.host = host
+        self.history_size = history_size
+        self.stale_after_sec = stale_after_sec
+        self.__port = port
+        self.__limits: Dict[Tuple[int, int, int], NnModelMaxChannelInfo] = {}
+        for limit in limits or ():
+            self.__limits[(limit.key.purpose, limit.key.width, limit.key.height)] = limit
+        self.__lock = threading.Lock()
+        self.__nodes: Dict[str, NodeState] = {}
+        self.__server: Optional[asyncio.base_events.Server] = None
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__is_started = threading.Event()
+
+    @property
+    def port(self) -> int:
+        if self.__server is not None and self.__server.sockets:
+            return self.__server.sockets[0].getsockname()[1]
+        return self.__port
+
+    def on_hello(self, message: Dict[str, Any]) -> NodeState:
+        name = str(message["node"])
+        with self.__lock:
+            node = self.__nodes.get(name)
+            if node is None:
+                node = self.__nodes[name] = NodeState(name, self.history_size)
+            if message.get("info") is not None:
+                node.system_info = codec.get_codec(SystemInfo).from_dict(message["info"])
+            # A reconnected agent starts over with a full snapshot
+            node.decoder = DeltaDecoder(as_records=True)
+            node.is_connected = True
+        return node
+
+    def on_status(self, node: NodeState, message: Dict[str, Any]) -> None:
+        status = node.decoder.apply(message)
+        with self.__lock:
+            if is_heartbeat(message):
+                node.touch(message["timestamp"])
+            else:
+                node.update(message["timestamp"], status)
+
+    def on_disconnect(self, node: NodeState) -> None:
+        with self.__lock:
+            node.is_connected = False
+
+    def get_nodes(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self.__lock:
+            return [{
+                "node": node.name,
+                "connected": node.is_connected,
+                "timestamp": node.timestamp,
+                "ageSec": now - node.last_seen if node.last_seen else None,
+                "gpus": len(node.gpus),
+            } for node in self.__nodes.values()]
+
+    def get_system_info(self, node: str) -> Optional[SystemInfo]:
+        with self.__lock:
+            state = self.__nodes.get(node)
+            return state.system_info if state is not None else None
+
+    def get_latest(self, node: str) -> Optional[SystemStatus]:
+        """
+        The last status of ``node``, a codec.SystemStatusRecord with the fields of a SystemStatus
+        """
+        with self.__lock:
+            state = self.__nodes.get(node)
+            return state.status if state is not None else None
+
+    def get_store(self, node: str) -> Optional[SystemStatusStore]:
+        with self.__lock:
+            state = self.__nodes.get(node)
+            return state.store if state is not None else None
+
+    def get_cost(self, model: Optional[NnModelInfo], fps: float = 0.0) -> ChannelCost:
+        if model is None:
+            return ChannelCost(fps=fps)
+        return get_channel_cost(model, self.__limits.get((model.purpose, model.width, model.height)), fps)
+
+    def get_least_loaded_gpus(self,
+                              model: Optional[NnModelInfo] = None,
+                              fps: float = 0.0,
+                              count: int = 1) -> List[FleetGpu]:
+        """
+        Up to ``count`` GPUs of connected, fresh nodes which still fit one channel of ``model``, least loaded
+        (after adding the channel) first, more free memory breaking ties
+        """
+        cost = self.get_cost(model, fps)
+        deadline = time.monotonic() - self.stale_after_sec
+        with self.__lock:
+            candidates = [
+                gpu for node in self.__nodes.values() if node.is_connected and node.last_seen >= deadline
+                for gpu in node.gpus if gpu.load + cost.load <= 1.0 + LOAD_EPSILON and (
+                    gpu.memory_free_mib is None or gpu.memory_free_mib >= cost.memory)
+            ]
+        return heapq.nsmallest(count,
+                               candidates,
+                               key=lambda gpu: (gpu.load + cost.load, -(gpu.memory_free_mib or 0.0), gpu.node,
+                                                gpu.index))
+
+    def query(self, message: Dict[str, Any]) -> Any:
+        """
+        Answer a query message, see the module documentation. Raises ValueError for unknown queries.
+        """
+        name = message.get("query")
+        if name == "nodes":
+            return self.get_nodes()
+        if name == "latest":
+            status = self.get_latest(message["node"])
+            return codec.to_dict(status) if status is not None else None
+        if name == "aggregate":
+            store = self.get_store(message["node"])
+            aggregate = store.aggregate(message["metric"], message.get("seconds", 60.0)) if store else None
+            return aggregate._asdict() if aggregate is not None else None
+        if name == "leastLoaded":
+            model = None
+            if message.get("purpose") is not None:
+                model = NnModelInfo(message["purpose"], message.get("width", 0), message.get("height", 0))
+            gpus = self.get_least_loaded_gpus(model, message.get("fps", 0.0), message.get("count", 1))
+            return [gpu._asdict() for gpu in gpus]
+        raise ValueError(f"Unknown query {name}")
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        node: Optional[NodeState] = None
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    break
+                message_type = message.get("type")
+                if message_type == "hello":
+                    node = self.on_hello(message)
+                    LOGGER.info("Node %s connected from %s", node.name, peer)
+                elif message_type in ("full", "delta"):
+                    if node is None:
+                        raise ValueError("Status before hello")
+                    self.on_status(node, message)
+                elif message_type == "query":
+                    try:
+                        response = {"type": "result", "id": message.get("id"), "result": self.query(message)}
+                    except (KeyError, TypeError, ValueError) as e:
+                        response = {"type": "error", "id": message.get("id"), "message": str(e)}
+                    writer.write(encode_frame(response))
+                    await writer.drain()
+                else:
+                    raise ValueError(f"Unknown message type {message_type}")
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            LOGGER.warning("Fleet connection from %s closed: %s", peer, e)
+        except asyncio.CancelledError:
+            # Server shutdown, asyncio logs connection handlers which end cancelled
+            pass
+        finally:
+            if node is not None:
+                self.on_disconnect(node)
+                LOGGER.info("Node %s disconnected", node.name)
+            writer.close()
+
+    async def serve(self) -> None:
+        """
+        Serve until cancelled
+        """
+        self.__loop = asyncio.get_running_loop()
+        self.__server = await asyncio.start_server(self.__handle, self.host, self.__port)
+        LOGGER.info("Fleet aggregator listening on port %d", self.port)
+        self.__is_started.set()
+        async with self.__server:
+            await self.__server.serve_forever()
+
+    def start(self) -> None:
+        """
+        serve() on a thread of its own, returns once the port is open
+        """
+        self.__thread = threading.Thread(target=self.__run, name="fleet_aggregator", daemon=True)
+        self.__thread.start()
+        self.__is_started.wait(10.0)
+
+    def __run(self) -> None:
+        try:
+            asyncio.run(self.serve())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            LOGGER.exception(e)
+        finally:
+            self.__is_started.set()
+
+    def stop(self) -> None:
+        loop = self.__loop
+        server = self.__server
+        if loop is not None and server is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(server.close)
+        if self.__thread is not None:
+            self.__thread.join(5.0)
+
+
+class FleetAgent(SampleSink):
+    """
+    Stream the samples of this node to a FleetAggregator without blocking the sampler.
+
+    Samples go through a bounded queue to a sender thread, which delta encodes them and keeps one connection open.
+    When the queue is full the oldest sample is dropped. When nothing was sent for ``heartbeat_sec``, because the
+    samples did not change beyond the deadbands or the sampling interval backed off, a heartbeat is sent so the
+    aggregator does not take an idle node for a stale one. After a reconnect the stream restarts with a hello and
+    a full snapshot; reconnects back off exponentially up to ``retry_max_sec``.
+    """
+
+    def __init__(self,
+                 host: str,
+                 port: int,
+                 node: str,
+                 system_info: Optional[SystemInfo] = None,
+                 queue_size: int = 10,
+                 full_every: int = 300,
+                 heartbeat_sec: float = 5.0,
+                 timeout_sec: float = 5.0,
+                 retry_min_sec: float = 1.0,
+                 retry_max_sec: float = 30.0) -> None:
+        self.host = host
+        self.port = port
+        self.node = node
+        self.system_info = system_info
+        self.heartbeat_sec = heartbeat_sec
+        self.timeout_sec = timeout_sec
+        self.retry_min_sec = retry_min_sec
+        self.retry_max_sec = retry_max_sec
+        self.dropped_samples = 0
+        self.sent_messages = 0
+        self.__encoder = DeltaEncoder(full_every=full_every)
+        self.__queue: "queue.Queue[Tuple[int, SystemStatus]]" = queue.Queue(maxsize=queue_size)
+        self.__is_stop = threading.Event()
+        self.__socket: Optional[socket.socket] = None
+        self.__retry_delay = 0.0
+        self.__last_sent = 0.0
+        self.__thread = threading.Thread(target=self.run, name="fleet_agent", daemon=True)
+        self.__thread.start()
+
+    def on_sample(self, timestamp: int, system_status: SystemStatus) -> None:
+        while True:
+            try:
+                self.__queue.put_nowait((timestamp, system_status))
+                return
+            except queue.Full:
+                try:
+                    self.__queue.get_nowait()
+                    self.dropped_samples += 1
+                except queue.Empty:
+                    pass
+
+    def __connect(self) -> bool:
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout_sec)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            info = codec.to_dict(self.system_info) if self.system_info is not None else None
+            sock.sendall(encode_frame({"type": "hello", "node": self.node, "info": info}))
+        except OSError as e:
+            self.__retry_delay = min(max(self.__retry_delay * 2, self.retry_min_sec), self.retry_max_sec)
+            LOGGER.warning("Can not connect to the fleet aggregator %s:%d, retrying in %.1f s: %s", self.host,
+                           self.port, self.__retry_delay, e)
+            return False
+        self.__socket = sock
+        self.__retry_delay = 0.0
+        self.__last_sent = time.monotonic()
+        self.__encoder.reset()
+        return True
+
+    def __disconnect(self) -> None:
+        if self.__socket is not None:
+            try:
+                self.__socket.close()
+            except OSError:
+                pass
+            self.__socket = None
+
+    def __is_closed_by_peer(self) -> bool:
+        """
+        The aggregator never sends to agents, a readable socket means it closed the connection. Checked before
+        every send, otherwise the first message after an aggregator restart would be lost.
+        """
+        try:
+            readable, _, _ = select.select([self.__socket], [], [], 0)
+            return bool(readable) and not self.__socket.recv(1)
+        except OSError:
+            return True
+
+    def run(self) -> None:
+        while not self.__is_stop.is_set():
+            if self.__socket is None and not self.__connect():
+                self.__is_stop.wait(self.__retry_delay)
+                continue
+            try:
+                sample: Optional[Tuple[int, SystemStatus]] = self.__queue.get(timeout=0.5)
+            except queue.Empty:
+                sample = None
+            if sample is None and time.monotonic() - self.__last_sent < self.heartbeat_sec:
+                continue
+            if self.__is_closed_by_peer():
+                LOGGER.warning("The fleet aggregator closed the connection, reconnecting")
+                self.__disconnect()
+                if not self.__connect():
+                    continue
+            message = self.__encoder.encode(*sample) if sample is not None else None
+            if message is None and time.monotonic() - self.__last_sent >= self.heartbeat_sec:
+                message = self.__encoder.heartbeat(sample[0] if sample is not None else get_current_time())
+            if message is None:
+                continue
+            try:
+                self.__socket.sendall(encode_frame(message))
+                self.__last_sent = time.monotonic()
+                self.sent_messages += 1
+            except OSError as e:
+                LOGGER.warning("Sending to the fleet aggregator failed: %s", e)
+                self.__disconnect()
+        self.__disconnect()
+
+    def close(self) -> None:
+        self.__is_stop.set()
+        self.__thread.join(self.timeout_sec)
+
+
+class FleetClient:
+    """
+    Blocking query client of a FleetAggregator, one connection reused by all queries
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 9411, timeout_sec: float = 5.0) -> None:
+        self.host = host
+        self.port = port
+        self.timeout_sec = timeout_sec
+        self.__socket: Optional[socket.socket] = None
+        self.__lock = threading.Lock()
+        self.__next_id = 0
+
+    def __request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        if self.__socket is None:
+            self.__socket = socket.create_connection((self.host, self.port), timeout=self.timeout_sec)
+            self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__socket.sendall(encode_frame(message))
+        return recv_frame(self.__socket)
+
+    def query(self, query: str, **params) -> Any:
+        """
+        Raises ValueError when the aggregator rejected the query, OSError when it can not be reached
+        """
+        with self.__lock:
+            self.__next_id += 1
+            message = dict(params, type="query", id=self.__next_id, query=query)
+            try:
+                response = self.__request(message)
+            except OSError:
+                # The aggregator may have restarted, try once more on a new connection
+                self.close()
+                response = self.__request(message)
+        if response.get("type") == "error":
+            raise ValueError(response.get("message"))
+        return response.get("result")
+
+    def get_nodes(self) -> List[Dict[str, Any]]:
+        return self.query("nodes")
+
+    def get_least_loaded_gpus(self,
+                              purpose: Optional[int] = None,
+                              width: int = 0,
+                              height: int = 0,
+                              fps: float = 0.0,
+                              count: int = 1) -> List[FleetGpu]:
+        result = self.query("leastLoaded", purpose=purpose, width=width, height=height, fps=fps, count=count)
+        return [FleetGpu(**gpu) for gpu in result]
+
+    def close(self) -> None:
+        if self.__socket is not None:
+            try:
+                self.__socket.close()
+            except OSError:
+                pass
+            self.__socket = None
@@ -0,0 +1,86 @@
+import logging
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .backends import nvml as N
+from .controllers import GpuInfoFromNvml, NvmlDevice, get_typed_value
+
+LOGGER = logging.getLogger(__name__)
+
+# metric name -> NVML sampling type
+SAMPLE_METRICS = (
+    ("utilization_gpu", "NVML_GPU_UTILIZATION_SAMPLES"),
+    ("utilization_memory", "NVML_MEMORY_UTILIZATION_SAMPLES"),
+    ("utilization_enc", "NVML_ENC_UTILIZATION_SAMPLES"),
+    ("utilization_dec", "NVML_DEC_UTILIZATION_SAMPLES"),
+    ("processor_clock_mhz", "NVML_PROCESSOR_CLK_SAMPLES"),
+)
+
+
+class GpuSamples(NamedTuple):
+    # milliseconds since the epoch, int64
+    timestamps: np.ndarray
+    # float64
+    values: np.ndarray
+
+
+class GpuSampleReader:
+    """
+    Read the driver's internal sample buffers with nvmlDeviceGetSamples.
+
+    The driver records utilization and clocks several times a second (about every 1/6 s for utilization) and
+    keeps the last few seconds of them. Every read returns the samples taken since the previous read of the same
+    GPU and metric, so reading once per regular sample gives sub-second resolution without polling faster.
+    """
+
+    def __init__(self, metrics: Optional[Sequence[str]] = None) -> None:
+        self.metrics = [(name, constant) for name, constant in SAMPLE_METRICS
+                        if metrics is None or name in metrics]
+        self.__last_seen: Dict[Tuple[int, str], int] = {}
+        self.__unsupported: Set[Tuple[int, str]] = set()
+
+    def __read_metric(self, device: NvmlDevice, metric: str, sampling_type: int) -> Optional[GpuSamples]:
+        key = (device.index, metric)
+        if key in self.__unsupported:
+            return None
+        try:
+            value_type, samples = N.nvmlDeviceGetSamples(device.handle, sampling_type,
+                                                          self.__last_seen.get(key, 0))
+        except N.NVMLError as e:
+            value = getattr(e, "value", None)
+            if value == N.NVML_ERROR_NOT_SUPPORTED:
+                self.__unsupported.add(key)
+            elif value != getattr(N, "NVML_ERROR_NOT_FOUND", None):    # NOT_FOUND: nothing new since last read
+                LOGGER.debug("Reading %s samples of GPU %d failed: %s", metric, device.index, e)
+            return None
+        if not samples:
+            return None
+        timestamps = np.fromiter((sample.timeStamp for sample in samples), dtype=np.int64, count=len(samples))
+        values = np.fromiter((get_typed_value(value_type, sample.sampleValue) for sample in samples),
+                             dtype=np.float64,
+                             count=len(samples))
+        self.__last_seen[key] = int(timestamps[-1])
+        # NVML timestamps are in microseconds
+        return GpuSamples(timestamps // 1000, values)
+
+    def read(self, device: NvmlDevice) -> Dict[str, GpuSamples]:
+        """
+        New samples of one GPU per metric, metrics without new samples are left out
+        """
+        ret = {}
+        for metric, constant in self.metrics:
+            sampling_type = getattr(N, constant, None)
+            if sampling_type is None:
+                continue
+            samples = self.__read_metric(device, metric, sampling_type)
+            if samples is not None:
+                ret[metric] = samples
+        return ret
+
+    def read_all(self, devices: Optional[List[NvmlDevice]] = None) -> Dict[int, Dict[str, GpuSamples]]:
+        """
+        read() of every GPU, by GPU index. The GPUs are read in parallel on the poll pool of GpuInfoFromNvml with
+        its deadline, a GPU which hangs is left out instead of stalling the sampler.
+        """
+        return GpuInfoFromNvml().run_per_device(self.read, devices)
@@ -0,0 +1,215 @@
+import base64
+import glob
+import logging
+import os
+import queue
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from threading import Event, Thread
+from typing import List
+
+from .models import GpuEvent, InfluxExporterConfig, SystemStatus
+from .pipeline import SampleSink
+
+LOGGER = logging.getLogger(__name__)
+
+SPOOL_PREFIX = "spool_"
+SPOOL_SUFFIX = ".lp"
+MB = 1024 * 1024
+
+# Client errors which are worth retrying, every other 4xx rejects the batch for good
+RETRIABLE_HTTP_STATUSES = (408, 429)
+
+GPU_FIELDS = ("utilization_gpu", "utilization_enc", "utilization_dec", "memory_used", "memory_total", "temperature",
+              "fan_speed", "power_draw", "enforced_power_limit")
+
+
+def escape_tag(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def format_tags(**tags) -> str:
+    """
+    ``,name=value`` for every tag which is not None
+    """
+    return "".join(f",{name}={escape_tag(value)}" for name, value in tags.items() if value is not None)
+
+
+def format_fields(obj, names) -> str:
+    return ",".join(f"{name}={float(getattr(obj, name))}" for name in names if getattr(obj, name) is not None)
+
+
+def format_line_protocol(measurement: str, host_name: str, timestamp: int, system_status: SystemStatus) -> List[str]:
+    """
+    Influx line protocol points of one sample, ``timestamp`` in milliseconds
+    """
+    host = escape_tag(host_name)
+    lines = [f"{measurement},host={host} cpu_percent={float(system_status.cpu.cpu_percent)},"
+             f"cpu_memory_usage_percent={float(system_status.cpu.cpu_memory_usage_percent)} {timestamp}"]
+    for gpu in system_status.gpus:
+        if gpu.is_stale:
+            continue
+        fields = format_fields(gpu, GPU_FIELDS)
+        if fields:
+            lines.append(f"{measurement}_gpu,host={host},gpu={gpu.index}{format_tags(uuid=gpu.uuid)} {fields} "
+                         f"{timestamp}")
+    return lines
+
+
+def escape_field_string(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"")
+
+
+def format_event_line(measurement: str, host_name: str, event: GpuEvent) -> str:
+    """
+    Influx line protocol point of one GpuEvent, in the ``<measurement>_event`` measurement
+    """
+    return (f"{measurement}_event,host={escape_tag(host_name)},gpu={event.gpu_index}"
+            f"{format_tags(uuid=event.uuid, type=event.event_type)} data={event.data}i,"
+            f'description="{escape_field_string(event.description)}" {event.timestamp}')
+
+
+class InfluxExporter(SampleSink):
+    """
+    Send samples to InfluxDB over the HTTP line protocol API without blocking the sampler.
+
+    Points go through a bounded queue to a sender thread which writes them in batches of ``batch_size`` or every
+    ``flush_interval_sec``. Batches which failed on a connection error or a server error are spooled to disk and
+    retried with exponential backoff. The spool is drained before new points once the server is reachable again.
+    A batch the server rejects with a client error, e.g. 400 for a malformed point, would fail the same way every
+    time: it is logged and dropped.
+    """
+
+    def __init__(self, config: InfluxExporterConfig, host_name: str, spool_folder: str) -> None:
+        self.config = config
+        self.host_name = host_name
+        self.spool_folder = spool_folder
+        self.__queue: "queue.Queue[str]" = queue.Queue(maxsize=config.queue_size)
+        self.__is_stop = Event()
+        self.__is_already_shutting_down = False
+        self.__retry_delay = 0.0
+        self.__next_attempt = 0.0
+        self.__is_database_created = not config.create_database
+        self.dropped_points = 0
+        self.rejected_points = 0
+        self.sent_points = 0
+        os.makedirs(spool_folder, exist_ok=True)
+        self.__thread = Thread(target=self.run, name="influx_exporter", daemon=True)
+        self.__thread.start()
+
+    def on_sample(self, timestamp: int, system_status: SystemStatus) -> None:
+        for line in format_line_protocol(self.config.measurement, self.host_name, timestamp, system_status):
+            try:
+                self.__queue.put_nowait(line)
+            except queue.Full:
+                self.dropped_points += 1
+
+    def on_event(self, event: GpuEvent) -> None:
+        try:
+            self.__queue.put_nowait(format_event_line(self.config.measurement, self.host_name, event))
+        except queue.Full:
+            self.dropped_points += 1
+
+    def __request(self, path: str, params: dict, data: bytes) -> None:
+        url = self.config.url.rstrip("/") + path + "?" + urllib.parse.urlencode(params)
+        request = urllib.request.Request(url, data=data, method="POST")
+        if self.config.username:
+            credentials = f"{self.config.username}:{self.config.password}".encode()
+            request.add_header("Authorization", "Basic " + base64.b64encode(credentials).decode())
+        with urllib.request.urlopen(request, timeout=self.config.timeout_sec) as response:
+            response.read()
+
+    def __send(self, lines: List[str]) -> bool:
+        """
+        False when the batch has to be sent again later
+        """
+        if time.monotonic() < self.__next_attempt:
+            return False
+        try:
+            if not self.__is_database_created:
+                self.__request("/query", {"q": f'CREATE DATABASE "{self.config.database}"'}, b"")
+                self.__is_database_created = True
+            self.__request("/write", {"db": self.config.database, "precision": "ms"}, "\n".join(lines).encode())
+        except urllib.error.HTTPError as e:
+            if 400 <= e.code < 500 and e.code not in RETRIABLE_HTTP_STATUSES:
+                self.__retry_delay = 0.0
+                self.rejected_points += len(lines)
+                LOGGER.error("Influx rejected %d point(s), dropping them: %s %s", len(lines), e,
+                             e.read()[:200].decode(errors="replace"))
+                return True
+            self.__back_off(e)
+            return False
+        except (urllib.error.URLError, OSError) as e:
+            self.__back_off(e)
+            return False
+        self.__retry_delay = 0.0
+        self.sent_points += len(lines)
+        return True
+
+    def __back_off(self, e: Exception) -> None:
+        self.__retry_delay = min(max(self.__retry_delay * 2, self.config.retry_min_sec), self.config.retry_max_sec)
+        self.__next_attempt = time.monotonic() + self.__retry_delay
+        LOGGER.warning("Influx write failed, retrying in %.1f s: %s", self.__retry_delay, e)
+
+    def __get_spool_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.spool_folder, SPOOL_PREFIX + "*" + SPOOL_SUFFIX)))
+
+    def __spool(self, lines: List[str]) -> None:
+        paths = self.__get_spool_paths()
+        total = sum(os.path.getsize(p) for p in paths)
+        while paths and total > self.config.spool_max_mib * MB:
+            LOGGER.warning("Influx spool full, dropping %s", paths[0])
+            total -= os.path.getsize(paths[0])
+            os.remove(paths.pop(0))
+        path = os.path.join(self.spool_folder, f"{SPOOL_PREFIX}{time.time_ns()}{SPOOL_SUFFIX}")
+        with open(path, "w") as outfile:
+            outfile.write("\n".join(lines))
+
+    def __drain_spool(self) -> bool:
+        """
+        Resend spooled batches oldest first, False when the server is still unreachable
+        """
+        for path in self.__get_spool_paths():
+            with open(path, "r") as infile:
+                lines = infile.read().splitlines()
+            for start in range(0, len(lines), self.config.batch_size):
+                if not self.__send(lines[start:start + self.config.batch_size]):
+                    # Keep what was not sent yet
+                    with open(path, "w") as outfile:
+                        outfile.write("\n".join(lines[start:]))
+                    return False
+            os.remove(path)
+        return True
+
+    def __flush(self, lines: List[str]) -> None:
+        if not lines:
+            return
+        if self.__drain_spool() and self.__send(lines):
+            return
+        self.__spool(lines)
+
+    def run(self) -> None:
+        batch: List[str] = []
+        deadline = time.monotonic() + self.config.flush_interval_sec
+        while True:
+            timeout = min(max(deadline - time.monotonic(), 0.0), 1.0)
+            try:
+                batch.append(self.__queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            if len(batch) >= self.config.batch_size or time.monotonic() >= deadline:
+                self.__flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.config.flush_interval_sec
+            if self.__is_stop.is_set() and self.__queue.empty():
+                break
+        self.__flush(batch)
+
+    def close(self) -> None:
+        if self.__is_already_shutting_down:
+            return
+        self.__is_already_shutting_down = True
+        self.__is_stop.set()
+        self.__thread.join(timeout=self.config.timeout_sec * 2)
@@ -1,27 +1,85 @@
 import logging
 import time
 from threading import Event, Thread
+from typing import List, Optional, Tuple
 
-from influxdb import InfluxDBClient
-
-from . import controllers
+from . import controllers, system_info_cache
+from .models import GpuEvent, ProcessStatus, SamplingConfig, SystemStatus
+from .pipeline import SampleSink, SamplePipeline
+from .sampling import AdaptiveInterval
+from .timeseries import SystemStatusStore
+from .utils import get_current_time
 
 LOGGER = logging.getLogger(__name__)
 LOGGER_CPU_USAGE = logging.getLogger("cpu_usage")
 
 
+def format_system_status(obj: SystemStatus) -> str:
+    """
+    One comma separated cpu_usage log line, the columns match the header written by LogCpuGpuUsage
+    """
+    s = f"{obj.cpu.cpu_percent},{obj.cpu.cpu_memory_usage_percent},"
+    i = 0
+    for gpu in obj.gpus:
+        s += (f"#GPU{str(i)},"
+              f"{str(gpu.index)},"
+              f"{str(gpu.uuid)},"
+              f"{str(gpu.name)},"
+              f"{str(gpu.utilization_gpu)},"
+              f"{str(gpu.utilization_enc)},"
+              f"{str(gpu.utilization_dec)},"
+              f"{str(gpu.memory_used)},"
+              f"{str(gpu.memory_total)},")
+        i += 1
+
+    i = 0
+    for process in obj.processes:
+        s += (f"#PROCESS{str(i)},"
+              f"{str(process.pid)},"
+              f"{str(process.command)},"
+              f"{str(process.cpu_percent)},"
+              f"{str(process.cpu_memory_usage_mib)},"
+              f"{str(process.gpu_id)},"
+              f"{str(process.gpu_memory_usage_mib)},")
+        i += 1
+    return s
+
+
 class LogCpuGpuUsage(Thread):
     """
-    Log CPU, GPU and memory usage
+    Log CPU, GPU and memory usage.
+
+    With adaptive sampling, samples between the full ones every ``sampling.interval_sec`` only read the CPU and
+    GPU counters and reuse the process list of the last full sample. Only full samples go to the cpu_usage log.
     """
 
-    def __init__(self):
+    def __init__(self, history_size: int = 3600, sampling: Optional[SamplingConfig] = None):
+        self.sampling = sampling or SamplingConfig()
+        self.__interval = AdaptiveInterval(self.sampling)
+        self.__last_full_sample = 0.0
+        self.__processes: List[ProcessStatus] = []
+        self.__sample_reader = None
+        if self.sampling.high_resolution:
+            from .gpu_samples import GpuSampleReader
+            self.__sample_reader = GpuSampleReader()
         self.__is_stop = Event()
         self.__is_already_shutting_down = False
+        self.__pipeline = SamplePipeline()
+        self.__store = SystemStatusStore(history_size)
+        self.__pipeline.add_sink(self.__store)
         super().__init__()
 
-    def run(self) -> None:
-        obj = controllers.get_system_info()
+    def add_sink(self, sink: SampleSink) -> None:
+        self.__pipeline.add_sink(sink)
+
+    def get_store(self) -> SystemStatusStore:
+        return self.__store
+
+    def start_log(self) -> SystemStatus:
+        """
+        Write the start and header lines of the cpu_usage log, returns the first sample
+        """
+        obj = system_info_cache.get_system_info()
         host_name = obj.host_name
         host_os = obj.os
         LOGGER_CPU_USAGE.info(f"============== Start ================ {host_name}, {host_os}")
@@ -39,75 +97,65 @@ class LogCpuGpuUsage(Thread):
             i += 1
 
         LOGGER_CPU_USAGE.info(header)
-        db_name = "Hajmola"
-        measurement_name = "cpu_gpu"
-        client = None
-        if False:
-            try:
-                client = InfluxDBClient('192.168.1.174', 8086, 'admin', 'admin123')
-                list_of_database = client.get_list_database()
-                list_of_database = [values for item in list_of_database for key, values in item.items()]
-
-                if db_name not in list_of_database:
-                    LOGGER.info("Create database: " + db_name)
-                    client.create_database(db_name)
-                    # self.__client.create_retention_policy('sajag_policy',
-                    #                                       '4w',
-                    #                                       3,
-                    #                                       database=self.__db_name)
-                client.close()
-                client = InfluxDBClient('192.168.1.156', 8086, 'admin', 'admin123', database=db_name)
-            except Exception as e:
-                print(e)
+        self.__last_full_sample = time.monotonic()
+        self.__processes = list(obj.processes)
+        self.__interval.update(obj)
+        return obj
+
+    def take_sample(self) -> Tuple[SystemStatus, bool]:
+        """
+        Next sample and whether it is a full one
+        """
+        start = time.monotonic()
+        is_full = not self.sampling.adaptive or self.__interval.is_full_due(start - self.__last_full_sample)
+        if is_full:
+            obj = controllers.get_system_status()
+            self.__last_full_sample = start
+            self.__processes = list(obj.processes)
+        else:
+            obj = controllers.get_fast_system_status(list(self.__processes))
+        self.__interval.update(obj, time.monotonic() - start, is_full)
+        return obj, is_full
+
+    def get_interval(self) -> float:
+        if not self.sampling.adaptive:
+            return self.sampling.interval_sec
+        return self.__interval.get_next_interval(time.monotonic() - self.__last_full_sample)
+
+    def process_sample(self, obj: SystemStatus, is_full: bool = True) -> None:
+        """
+        Hand one sample to the sinks and the cpu_usage log
+        """
+        self.__pipeline.on_sample(get_current_time(), obj)
+        if is_full and self.__sample_reader is not None:
+            for index, samples in self.__sample_reader.read_all().items():
+                if samples:
+                    self.__pipeline.on_gpu_samples(index, samples)
+        if is_full and LOGGER_CPU_USAGE.isEnabledFor(logging.INFO):
+            # Formatting is skipped entirely when the cpu_usage logger is disabled in logging.yaml
+            LOGGER_CPU_USAGE.info(format_system_status(obj))
+
+    def on_event(self, event: GpuEvent) -> None:
+        """
+        Hand a GpuEvent to the sinks, safe to call from the event listener thread
+        """
+        self.__pipeline.on_event(event)
 
+    def finish_log(self) -> None:
+        self.__pipeline.close()
+        LOGGER_CPU_USAGE.info("============== End   ================")
+
+    def run(self) -> None:
+        obj = self.start_log()
+        is_full = True
         while True:
-            s_influx = (f"cpu_percent={obj.cpu.cpu_percent},"
-                        f"cpu_memory_usage_percent={obj.cpu.cpu_memory_usage_percent}")
-            s = f"{obj.cpu.cpu_percent},{obj.cpu.cpu_memory_usage_percent},"
-            i = 0
-            for gpu in obj.gpus:
-                s += (f"#GPU{str(i)},"
-                      f"{str(gpu.index)},"
-                      f"{str(gpu.uuid)},"
-                      f"{str(gpu.name)},"
-                      f"{str(gpu.utilization_gpu)},"
-                      f"{str(gpu.utilization_enc)},"
-                      f"{str(gpu.utilization_dec)},"
-                      f"{str(gpu.memory_used)},"
-                      f"{str(gpu.memory_total)},")
-                i += 1
-
-            i = 0
-            for process in obj.processes:
-                s += (f"#PROCESS{str(i)},"
-                      f"{str(process.pid)},"
-                      f"{str(process.command)},"
-                      f"{str(process.cpu_percent)},"
-                      f"{str(process.cpu_memory_usage_mib)},"
-                      f"{str(process.gpu_id)},"
-                      f"{str(process.gpu_memory_usage_mib)},")
-                i += 1
-            LOGGER_CPU_USAGE.info(s)
-            if client:
-                data = []
-                t = int(time.time()*1000)
-                data_point = f"{measurement_name},host={host_name} {s_influx} {t}"
-                data.append(data_point)
-                # print(data_point)
-                print(s)
-                try:
-                    client.write_points(data, time_precision="ms", batch_size=1, protocol="line")
-                except Exception as e:
-                    print(e)
-                    client = None
-            if self.__is_stop.wait(1.0):
+            self.process_sample(obj, is_full)
+            if self.__is_stop.wait(self.get_interval()):
                 break
             else:
-                obj = controllers.get_system_status()
+                obj, is_full = self.take_sample()
                 continue
-        if client:
-            client.close()
-        LOGGER_CPU_USAGE.info("============== End   ================")
+        self.finish_log()
 
     def stop(self):
         if self.__is_already_shutting_down:
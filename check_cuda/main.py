@@ -8,7 +8,11 @@ import threading
 
 import yaml
 
-from . import controllers, log_cpu_gpu_usage
+from . import controllers, log_cpu_gpu_usage, system_info_cache
+from .config import get_config
+from .events import GpuEventListener
+from .models import CheckCudaConfig, SystemInfo
+from .recorder import BinaryRecorder
 from .utils import get_session_folder
 
 LOGGER = logging.getLogger(__name__)
@@ -47,6 +51,8 @@ def get_version():
 
 
 is_shutdown = threading.Event()
+# Called by stop_handler, e.g. to stop the asyncio service
+shutdown_callbacks = []
 
 
 def stop_handler(*args):
@@ -58,6 +64,8 @@ def stop_handler(*args):
     #zope.event.notify(shutdown_event.ShutdownEvent("KeyboardInterrupt received"))
     global is_shutdown
     is_shutdown.set()
+    for callback in shutdown_callbacks:
+        callback()
 
 
 def raise_unhandled_exeception_error():
@@ -80,27 +88,174 @@ def main():
     LOGGER.info("=============================================")
     print("Using session {}".format(get_session_folder()))
 
-    LOGGER.info(controllers.get_system_info())
+    system_info = system_info_cache.get_system_info()
+    LOGGER.info(system_info)
     LOGGER.info(controllers.get_system_status())
+    config = get_config()
+    if config.service.mode == "asyncio":
+        run_service(config, system_info)
+    else:
+        run_threads(config, system_info)
+
+    LOGGER.info("=============================================")
+    LOGGER.info("             1Shutdown complete {} {}               ".format(__name__, get_version()))
+    LOGGER.info("=============================================")
+
+
+def create_usage_logger(config: CheckCudaConfig, system_info: SystemInfo) -> log_cpu_gpu_usage.LogCpuGpuUsage:
+    l = log_cpu_gpu_usage.LogCpuGpuUsage(sampling=config.sampling)
+    if config.recorder.enabled:
+        l.add_sink(
+            BinaryRecorder(os.path.join(get_session_folder(), "samples"),
+                           records_per_segment=config.recorder.records_per_segment,
+                           max_segments=config.recorder.max_segments,
+                           max_bytes=config.recorder.max_mib * 1024 * 1024,
+                           min_interval_sec=config.recorder.min_interval_sec))
+    # Optional sinks are imported only when they are enabled, see cli
+    if config.influx.enabled:
+        from .influx_exporter import InfluxExporter
+        spool_folder = os.path.join(get_session_folder(), "influx_spool")
+        l.add_sink(InfluxExporter(config.influx, system_info.host_name, spool_folder))
+    if config.cost_accounting.enabled:
+        from .cost_accounting import ChannelCostAccountant
+        l.add_sink(
+            ChannelCostAccountant(target_utilization=config.cost_accounting.target_utilization,
+                                  half_life_samples=config.cost_accounting.half_life_samples,
+                                  apply_interval_sec=config.cost_accounting.apply_interval_sec,
+                                  min_samples=config.cost_accounting.min_samples))
+    if config.fleet.agent_enabled:
+        from .fleet import FleetAgent
+        l.add_sink(
+            FleetAgent(config.fleet.aggregator_host,
+                       config.fleet.port,
+                       system_info.host_name,
+                       system_info,
+                       heartbeat_sec=config.fleet.heartbeat_sec))
+    return l
+
+
+def create_fleet_aggregator(config: CheckCudaConfig):
+    from .fleet import FleetAggregator
+    return FleetAggregator(config.fleet.listen_host,
+                           config.fleet.port,
+                           history_size=config.fleet.history_size,
+                           stale_after_sec=config.fleet.stale_after_sec,
+                           limits=controllers.get_model_list().models)
+
+
+def create_placement_server(config: CheckCudaConfig, system_info: SystemInfo, fleet_aggregator=None):
+    """
+    Place channels over the nodes of ``fleet_aggregator`` when it runs in this process, else over the local GPUs
+    """
+    from .placement_service import ClusterPlacer, PlacementServer
+    model_list = controllers.get_model_list()
+    placer = ClusterPlacer(model_list.models, controllers.get_placement_policy(model_list))
+    sync = None
+    if fleet_aggregator is not None:
+        sync = lambda: placer.sync_from_fleet(fleet_aggregator, config.placement_service.remove_node_after_sec)
+    else:
+        placer.add_node(system_info.host_name, controllers.get_gpu_status())
+    return PlacementServer(placer,
+                           config.placement_service.host,
+                           config.placement_service.port,
+                           sync=sync,
+                           sync_interval_sec=config.placement_service.sync_interval_sec)
+
+
+def run_service(config: CheckCudaConfig, system_info: SystemInfo) -> None:
+    """
+    Sampler, sinks and metrics endpoint on one event loop until stop_handler is called
+    """
+    import asyncio
+
+    from .service import CheckCudaService
+    service = CheckCudaService(create_usage_logger(config, system_info),
+                               executor_workers=config.service.executor_workers)
+    if config.metrics_server.enabled:
+        from .metrics_server import AsyncMetricsServer, MetricsSnapshot
+        snapshot = MetricsSnapshot(controllers.get_channel_assignment_counts)
+        service.add_sink(snapshot)
+        metrics_server = AsyncMetricsServer(snapshot, config.metrics_server.host, config.metrics_server.port)
+        service.add_task(metrics_server.serve)
+    fleet_aggregator = None
+    if config.fleet.aggregator_enabled:
+        fleet_aggregator = create_fleet_aggregator(config)
+        service.add_task(fleet_aggregator.serve)
+    placement_server = None
+    if config.placement_service.enabled:
+        placement_server = create_placement_server(config, system_info, fleet_aggregator)
+        placement_server.start()
+    event_listener = None
+    if config.events.enabled:
+        event_listener = GpuEventListener(service.usage.on_event, config.events.poll_interval_sec)
+        event_listener.start()
+    # Channels run in other processes, nothing here can move them: the rebalancer reports
+    controllers.start_channel_rebalancer(on_event=service.usage.on_event)
+    shutdown_callbacks.append(service.stop)
+    try:
+        if is_shutdown.is_set():
+            return
+        asyncio.run(service.run())
+    except Exception as e:
+        LOGGER.exception(e)
+        raise_unhandled_exeception_error()
+    finally:
+        shutdown_callbacks.remove(service.stop)
+        controllers.stop_channel_rebalancer()
+        if event_listener is not None:
+            event_listener.stop()
+        if placement_server is not None:
+            placement_server.stop()
+        if fleet_aggregator is not None:
+            fleet_aggregator.stop()
+
+
+def run_threads(config: CheckCudaConfig, system_info: SystemInfo) -> None:
     l = None
+    metrics_server = None
+    event_listener = None
+    fleet_aggregator = None
+    placement_server = None
     try:
         global is_shutdown
-        l = log_cpu_gpu_usage.LogCpuGpuUsage()
+        l = create_usage_logger(config, system_info)
+        if config.metrics_server.enabled:
+            from .metrics_server import MetricsServer, MetricsSnapshot
+            snapshot = MetricsSnapshot(controllers.get_channel_assignment_counts)
+            l.add_sink(snapshot)
+            metrics_server = MetricsServer(snapshot, config.metrics_server.host, config.metrics_server.port)
+            metrics_server.start()
+        if config.fleet.aggregator_enabled:
+            fleet_aggregator = create_fleet_aggregator(config)
+            fleet_aggregator.start()
+        if config.placement_service.enabled:
+            placement_server = create_placement_server(config, system_info, fleet_aggregator)
+            placement_server.start()
         l.start()
+        if config.events.enabled:
+            event_listener = GpuEventListener(l.on_event, config.events.poll_interval_sec)
+            event_listener.start()
+        # Channels run in other processes, nothing here can move them: the rebalancer reports
+        controllers.start_channel_rebalancer(on_event=l.on_event)
         while not is_shutdown.wait(10.0):
             continue
     except Exception as e:
         LOGGER.exception(e)
         # LOGGER.fatal(e)
         raise_unhandled_exeception_error()
+    controllers.stop_channel_rebalancer()
+    if event_listener is not None:
+        event_listener.stop()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if placement_server is not None:
+        placement_server.stop()
+    if fleet_aggregator is not None:
+        fleet_aggregator.stop()
     if l is not None:
         print("Here stop")
         l.stop()
 
-    LOGGER.info("=============================================")
-    LOGGER.info("             1Shutdown complete {} {}               ".format(__name__, get_version()))
-    LOGGER.info("=============================================")
-
 # def main1():
 #     signal.signal(signal.SIGINT, stop_handler)
 #     signal.signal(signal.SIGTERM, stop_handler)
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .models import GpuEvent, SystemStatus
+from .pipeline import SampleSink
+
+LOGGER = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (metric name, GpuStatus attribute, help)
+GPU_GAUGES = (
+    ("check_cuda_gpu_utilization_percent", "utilization_gpu", "GPU utilization"),
+    ("check_cuda_gpu_encoder_utilization_percent", "utilization_enc", "Encoder utilization"),
+    ("check_cuda_gpu_decoder_utilization_percent", "utilization_dec", "Decoder utilization"),
+    ("check_cuda_gpu_memory_used_mib", "memory_used", "GPU memory used in MiB"),
+    ("check_cuda_gpu_memory_total_mib", "memory_total", "GPU memory total in MiB"),
+    ("check_cuda_gpu_temperature_celsius", "temperature", "GPU temperature"),
+    ("check_cuda_gpu_power_draw_watts", "power_draw", "GPU power draw"),
+    ("check_cuda_gpu_stale", "is_stale", "1 when the last poll of the GPU did not finish in time"),
+)
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels: Dict[str, object]) -> str:
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def render_metrics(timestamp: int,
+                   system_status: SystemStatus,
+                   channel_counts: Optional[Dict[Tuple[int, int, int, int], int]] = None,
+                   event_counts: Optional[Dict[Tuple[int, str], int]] = None) -> bytes:
+    """
+    Prometheus text exposition format of one sample
+    """
+    lines: List[str] = []
+
+    def gauge(name: str, help_text: str, samples: List[Tuple[Dict[str, object], object]]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            if value is not None:
+                lines.append(f"{name}{format_labels(labels) if labels else ''} {float(value)}")
+
+    gauge("check_cuda_last_sample_timestamp_seconds", "Time of the last sample", [({}, timestamp / 1000.0)])
+    gauge("check_cuda_cpu_percent", "Host CPU utilization", [({}, system_status.cpu.cpu_percent)])
+    gauge("check_cuda_cpu_memory_usage_percent", "Host memory utilization",
+          [({}, system_status.cpu.cpu_memory_usage_percent)])
+    gpu_labels = [({"gpu": gpu.index, "uuid": gpu.uuid, "name": gpu.name}, gpu) for gpu in system_status.gpus]
+    for name, attribute, help_text in GPU_GAUGES:
+        gauge(name, help_text, [(labels, getattr(gpu, attribute)) for labels, gpu in gpu_labels])
+    process_labels = [({"pid": p.pid, "command": p.command, "gpu": p.gpu_id}, p) for p in system_status.processes]
+    gauge("check_cuda_process_gpu_memory_mib", "GPU memory used by the process in MiB",
+          [(labels, p.gpu_memory_usage_mib) for labels, p in process_labels])
+    gauge("check_cuda_process_cpu_percent", "CPU utilization of the process",
+          [(labels, p.cpu_percent) for labels, p in process_labels])
+    if channel_counts is not None:
+        gauge("check_cuda_channel_assignments", "Channels assigned by ChannelGpuManager",
+              [({"gpu": k[0], "purpose": k[1], "width": k[2], "height": k[3]}, v) for k, v in channel_counts.items()])
+    if event_counts:
+        name = "check_cuda_gpu_events_total"
+        lines.append(f"# HELP {name} GPU events (XID, ECC, throttling, P-state changes) since start")
+        lines.append(f"# TYPE {name} counter")
+        for (gpu, event_type), count in sorted(event_counts.items()):
+            lines.append(f"{name}{format_labels({'gpu': gpu, 'type': event_type})} {float(count)}")
+    lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+class MetricsSnapshot(SampleSink):
+    """
+    Latest rendered metrics page. It is rebuilt by the sampler, scrapes only read the cached bytes.
+    """
+
+    def __init__(self, get_channel_counts: Optional[Callable[[], Dict[Tuple[int, int, int, int], int]]] = None):
+        self.__get_channel_counts = get_channel_counts
+        self.__event_counts: Dict[Tuple[int, str], int] = {}
+        self.__event_lock = threading.Lock()
+        self.__page = b""
+
+    def on_event(self, event: GpuEvent) -> None:
+        key = (event.gpu_index, event.event_type)
+        with self.__event_lock:
+            self.__event_counts[key] = self.__event_counts.get(key, 0) + 1
+
+    def on_sample(self, timestamp: int, system_status: SystemStatus) -> None:
+        channel_counts = None
+        if self.__get_channel_counts is not None:
+            try:
+                channel_counts = self.__get_channel_counts()
+            except Exception as e:
+                LOGGER.exception(e)
+        # A single reference assignment, readers never see a half built page
+        with self.__event_lock:
+            event_counts = dict(self.__event_counts)
+        self.__page = render_metrics(timestamp, system_status, channel_counts, event_counts)
+
+    def get_page(self) -> bytes:
+        return self.__page
+
+
+class MetricsServer:
+    """
+    Serve MetricsSnapshot on GET /metrics
+    """
+
+    def __init__(self, snapshot: MetricsSnapshot, host: str = "127.0.0.1", port: int = 9410) -> None:
+        self.snapshot = snapshot
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                page = snapshot.get_page()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+            def log_message(self, format, *args):
+                LOGGER.debug(format, *args)
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="metrics_server", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.__server.server_address[1]
+
+    def start(self) -> None:
+        self.__thread.start()
+        LOGGER.info("Serving metrics on port %d", self.port)
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+class AsyncMetricsServer:
+    """
+    MetricsServer on an asyncio event loop instead of its own threads, for the asyncio service mode
+    """
+
+    def __init__(self, snapshot: MetricsSnapshot, host: str = "127.0.0.1", port: int = 9410) -> None:
+        self.snapshot = snapshot
+        self.host = host
+        self.__port = port
+        self.__server: Optional[asyncio.base_events.Server] = None
+
+    @property
+    def port(self) -> int:
+        if self.__server is not None and self.__server.sockets:
+            return self.__server.sockets[0].getsockname()[1]
+        return self.__port
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=10.0)
+            # Skip the headers, GET requests have no body
+            while (await asyncio.wait_for(reader.readline(), timeout=10.0)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2 or parts[0] != "GET" or parts[1].split("?", 1)[0] != "/metrics":
+                writer.write(b"HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            else:
+                page = self.snapshot.get_page()
+                writer.write(f"HTTP/1.0 200 OK\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                             f"Content-Length: {len(page)}\r\n\r\n".encode("latin-1") + page)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            LOGGER.debug("Metrics request failed: %s", e)
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        """
+        Serve until cancelled
+        """
+        self.__server = await asyncio.start_server(self.__handle, self.host, self.__port)
+        LOGGER.info("Serving metrics on port %d", self.port)
+        async with self.__server:
+            await self.__server.serve_forever()
@@ -1,9 +1,7 @@
 from dataclasses import dataclass, field
 from typing import List, Optional, Tuple
 
-import yaml
 from dataclasses_json import DataClassJsonMixin, LetterCase, dataclass_json
-from pprint import pprint
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
@@ -80,6 +78,7 @@ class GpuStatus(DataClassJsonMixin):
     enforced_power_limit: Optional[int] = None
     memory_used: Optional[int] = None
     memory_total: Optional[int] = None
+    is_stale: bool = False
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
@@ -96,6 +95,11 @@ class ProcessStatus(DataClassJsonMixin):
     cpu_memory_usage_mib: Optional[int] = None
     gpu_memory_usage_mib: Optional[int] = None
     gpu_id: Optional[int] = None
+    # Share of the GPU used by the process since the previous sample, where NVML reports it
+    gpu_sm_percent: Optional[float] = None
+    gpu_memory_percent: Optional[float] = None
+    gpu_encoder_percent: Optional[float] = None
+    gpu_decoder_percent: Optional[float] = None
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
@@ -109,6 +113,21 @@ class SystemStatus(DataClassJsonMixin):
     processes: List[ProcessStatus] = field(default_factory=list)
 
 
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class GpuEvent(DataClassJsonMixin):
+    """
+    Something that happened on a GPU between two samples, see events.GpuEventListener.
+    event_type is one of events.EVENT_TYPES, data is e.g. the XID or the throttle reason mask.
+    """
+    timestamp: int
+    gpu_index: int
+    event_type: str
+    data: int = 0
+    uuid: Optional[str] = None
+    description: str = ""
+
+
 @dataclass_json(letter_case=LetterCase.CAMEL)
 @dataclass(unsafe_hash=True)
 class NnModelInfo(DataClassJsonMixin):
@@ -118,8 +137,8 @@ class NnModelInfo(DataClassJsonMixin):
     purpose: int
     width: int
     height: int
-    max_fps: int
-    memory: int
+    max_fps: int = 0
+    memory: int = 0
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
 @dataclass
@@ -150,10 +169,27 @@ class NnModelMaxChannelInfo(DataClassJsonMixin):
     max_fps: float = 0.0
 
 
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class RebalancerConfig(DataClassJsonMixin):
+    """
+    Thresholds are fractions of the GPU memory / compute budget
+    """
+    enabled: bool = False
+    interval_sec: float = 10.0
+    high_watermark: float = 0.9
+    low_watermark: float = 0.75
+    sustain_intervals: int = 3
+    max_migrations_per_interval: int = 2
+    cooldown_intervals: int = 6
+
+
 @dataclass_json(letter_case=LetterCase.CAMEL)
 @dataclass
 class NnModelMaxChannelInfoList(DataClassJsonMixin):
     models: List[NnModelMaxChannelInfo] = field(default_factory=list)
+    placement_policy: str = "least_loaded"
+    rebalancer: RebalancerConfig = field(default_factory=RebalancerConfig)
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
@@ -175,6 +211,52 @@ class ModelCount(DataClassJsonMixin):
     gpu_id: int
     count: int = 1
     fps_consumed: float = 0
+    # Process running the channel, lets cost_accounting attribute that process' GPU usage to the channel
+    pid: Optional[int] = None
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class PlacementRequest(DataClassJsonMixin):
+    """
+    Channel ``channel_id`` of ``model`` at ``fps`` to be placed on a GPU of the cluster
+    """
+    channel_id: int
+    model: NnModelInfo
+    fps: float = 0.0
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class PlacementResult(DataClassJsonMixin):
+    """
+    GPU ``gpu_id`` of node ``node`` runs the channel, gpu_id is -1 when the cluster has no GPU
+    """
+    channel_id: int
+    model: NnModelInfo
+    node: Optional[str] = None
+    gpu_id: int = -1
+    fps_consumed: float = 0.0
+    # False when the channel already had this placement
+    is_new: bool = True
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class ModelCost(DataClassJsonMixin):
+    """
+    Measured GPU cost of one channel of a model, averaged over the channels and samples seen, see
+    cost_accounting.ChannelCostAccountant
+    """
+    key: NnModelInfo
+    samples: int = 0
+    sm_percent: float = 0.0
+    encoder_percent: float = 0.0
+    decoder_percent: float = 0.0
+    gpu_memory_mib: float = 0.0
+    fps: float = 0.0
+    suggested_max_channel: int = 0
+    suggested_max_fps: float = 0.0
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
@@ -183,3 +265,168 @@ class ModelPerGpu(DataClassJsonMixin):
     """
     docstring
     """
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class InfluxExporterConfig(DataClassJsonMixin):
+    """
+    Batched export of the samples and GpuEvents to InfluxDB, see influx_exporter.InfluxExporter
+    """
+    enabled: bool = False
+    url: str = "http://localhost:8086"
+    database: str = "check_cuda"
+    username: str = ""
+    password: str = ""
+    measurement: str = "cpu_gpu"
+    create_database: bool = True
+    batch_size: int = 500
+    flush_interval_sec: float = 5.0
+    queue_size: int = 10000
+    timeout_sec: float = 5.0
+    retry_min_sec: float = 1.0
+    retry_max_sec: float = 60.0
+    spool_max_mib: int = 100
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class RecorderConfig(DataClassJsonMixin):
+    """
+    Binary sample segments in the session folder, see recorder.BinaryRecorder. 0 disables a limit.
+    """
+    enabled: bool = True
+    records_per_segment: int = 86400
+    max_segments: int = 30
+    max_mib: int = 1024
+    # Record at most one sample per interval, the fast samples of adaptive sampling are thinned out
+    min_interval_sec: float = 1.0
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class MetricsServerConfig(DataClassJsonMixin):
+    """
+    The endpoint has no authentication, it listens on the loopback interface unless host is set to e.g. 0.0.0.0
+    """
+    enabled: bool = True
+    host: str = "127.0.0.1"
+    port: int = 9410
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class SamplingConfig(DataClassJsonMixin):
+    """
+    Sampling interval of LogCpuGpuUsage, see sampling.AdaptiveInterval. With adaptive disabled every sample is a
+    full one, interval_sec apart.
+    """
+    adaptive: bool = False
+    interval_sec: float = 1.0
+    min_interval_sec: float = 0.1
+    max_interval_sec: float = 10.0
+    # A change of at least this much between two samples is fast
+    utilization_step: float = 10.0
+    memory_step_mib: int = 512
+    # Utilization at or above this is hot and sampled at min_interval_sec
+    utilization_threshold: float = 90.0
+    memory_threshold_percent: float = 95.0
+    # Number of flat samples before the interval grows by backoff_factor
+    idle_samples: int = 10
+    backoff_factor: float = 1.5
+    # Fraction of the wall time the sampler itself may spend sampling
+    overhead_budget: float = 0.02
+    # Read the driver's sub-second sample buffers with every full sample, see gpu_samples.GpuSampleReader
+    high_resolution: bool = False
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class EventListenerConfig(DataClassJsonMixin):
+    """
+    NVML events and polled throttle reasons and P-states as GpuEvents, see events.GpuEventListener
+    """
+    enabled: bool = True
+    # Throttle reasons and performance state have no NVML events and are polled this often
+    poll_interval_sec: float = 0.1
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class CostAccountingConfig(DataClassJsonMixin):
+    """
+    Measured GPU cost per channel of every model and suggested limits, see cost_accounting.ChannelCostAccountant
+    """
+    enabled: bool = False
+    # Fraction of the busiest GPU engine and of the GPU memory the suggested limits aim for
+    target_utilization: float = 0.9
+    half_life_samples: int = 600
+    # Write the suggested limits to the model list this often, 0 only measures
+    apply_interval_sec: float = 0.0
+    min_samples: int = 60
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class ServiceConfig(DataClassJsonMixin):
+    """
+    mode is "thread" (a sampler thread per component) or "asyncio" (one event loop, see service.py).
+
+    In asyncio mode the sampler, the sinks, the metrics endpoint and the fleet aggregator run on the loop. These
+    keep threads of their own because they block: the NVML event listener, the InfluxDB sender, the fleet agent,
+    the placement server with its sync and the channel rebalancer, besides the per GPU poll pool of controllers.
+    """
+    mode: str = "thread"
+    executor_workers: int = 4
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class PlacementServiceConfig(DataClassJsonMixin):
+    """
+    Channel placement over HTTP for the GPUs of this node or of the fleet, see placement_service.PlacementServer
+    """
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9412
+    # How often the GPUs of the fleet aggregator are taken over, when it runs in the same process
+    sync_interval_sec: float = 5.0
+    # A stale or disconnected node gets no new channels, its channels are placed again once it sent nothing for
+    # remove_node_after_sec
+    remove_node_after_sec: float = 60.0
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class FleetConfig(DataClassJsonMixin):
+    """
+    Streaming samples to a fleet aggregator and running one, see fleet.FleetAgent and fleet.FleetAggregator
+    """
+    # Stream samples to the aggregator at aggregator_host:port
+    agent_enabled: bool = False
+    aggregator_host: str = "localhost"
+    # Run an aggregator on listen_host:port
+    aggregator_enabled: bool = False
+    listen_host: str = "0.0.0.0"
+    port: int = 9411
+    history_size: int = 300
+    # Idle agents send a heartbeat every heartbeat_sec, a node which sent nothing for stale_after_sec is not placed on
+    heartbeat_sec: float = 5.0
+    stale_after_sec: float = 15.0
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class CheckCudaConfig(DataClassJsonMixin):
+    """
+    Configuration of the optional components, read from check_cuda.yml, see config.ConfigManager
+    """
+    influx: InfluxExporterConfig = field(default_factory=InfluxExporterConfig)
+    recorder: RecorderConfig = field(default_factory=RecorderConfig)
+    metrics_server: MetricsServerConfig = field(default_factory=MetricsServerConfig)
+    service: ServiceConfig = field(default_factory=ServiceConfig)
+    sampling: SamplingConfig = field(default_factory=SamplingConfig)
+    events: EventListenerConfig = field(default_factory=EventListenerConfig)
+    cost_accounting: CostAccountingConfig = field(default_factory=CostAccountingConfig)
+    fleet: FleetConfig = field(default_factory=FleetConfig)
+    placement_service: PlacementServiceConfig = field(default_factory=PlacementServiceConfig)
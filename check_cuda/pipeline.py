@@ -0,0 +1,81 @@
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .models import GpuEvent, SystemStatus
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SampleSink:
+    """
+    Receives every SystemStatus taken by LogCpuGpuUsage and every GpuEvent of the GpuEventListener.
+    Events arrive on the listener thread, concurrently with samples.
+    """
+
+    def on_sample(self, timestamp: int, system_status: SystemStatus) -> None:
+        """
+        ``timestamp`` is in milliseconds since the epoch, see utils.get_current_time
+        """
+        pass
+
+    def on_event(self, event: GpuEvent) -> None:
+        pass
+
+    def on_gpu_samples(self, gpu_index: int, samples: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> None:
+        """
+        Driver sample buffers of one GPU read since the last call, metric -> (timestamps in ms, values), see
+        gpu_samples.GpuSampleReader
+        """
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SamplePipeline:
+    """
+    Fan out samples to the registered sinks. A failing sink is logged and does not stop the others.
+    """
+
+    def __init__(self) -> None:
+        self.__sinks: List[SampleSink] = []
+
+    def add_sink(self, sink: SampleSink) -> None:
+        self.__sinks.append(sink)
+
+    def remove_sink(self, sink: SampleSink) -> None:
+        if sink in self.__sinks:
+            self.__sinks.remove(sink)
+
+    def get_sinks(self) -> List[SampleSink]:
+        return list(self.__sinks)
+
+    def on_sample(self, timestamp: int, system_status: SystemStatus) -> None:
+        for sink in self.__sinks:
+            try:
+                sink.on_sample(timestamp, system_status)
+            except Exception as e:
+                LOGGER.exception(e)
+
+    def on_event(self, event: GpuEvent) -> None:
+        for sink in self.__sinks:
+            try:
+                sink.on_event(event)
+            except Exception as e:
+                LOGGER.exception(e)
+
+    def on_gpu_samples(self, gpu_index: int, samples: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> None:
+        for sink in self.__sinks:
+            try:
+                sink.on_gpu_samples(gpu_index, samples)
+            except Exception as e:
+                LOGGER.exception(e)
+
+    def close(self) -> None:
+        for sink in self.__sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                LOGGER.exception(e)
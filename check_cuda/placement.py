@@ -0,0 +1,313 @@
+import heapq
+import logging
+import threading
+from enum import Enum
+from typing import AbstractSet, Dict, List, Optional, Tuple
+
+from .models import GpuStatus, NnModelInfo, NnModelMaxChannelInfo
+
+LOGGER = logging.getLogger(__name__)
+
+# Slack allowed on the compute budget so that e.g. 3 x (1/3) still fits into 1.0
+LOAD_EPSILON = 1e-6
+
+
+class PlacementPolicy(str, Enum):
+    """
+    How a GPU is chosen among the ones that still have budget left
+    """
+    LEAST_LOADED = "least_loaded"
+    BEST_FIT = "best_fit"
+    SPREAD = "spread"
+
+
+class ChannelCost:
+    """
+    Budget consumed by one channel of a model on one GPU
+    """
+    __slots__ = ("load", "memory", "fps")
+
+    def __init__(self, load: float = 0.0, memory: float = 0.0, fps: float = 0.0) -> None:
+        self.load = load
+        self.memory = memory
+        self.fps = fps
+
+    def __repr__(self) -> str:
+        return f"ChannelCost(load={self.load:.4f}, memory={self.memory:.1f}, fps={self.fps:.1f})"
+
+
+def get_limit_key(model: NnModelInfo) -> NnModelInfo:
+    """
+    What a model is limited by: purpose and input size, without max_fps and memory
+    """
+    return NnModelInfo(model.purpose, model.width, model.height)
+
+
+def get_channel_cost(model: NnModelInfo, limit: Optional[NnModelMaxChannelInfo], fps: float = 0.0) -> ChannelCost:
+    """
+    Cost of one channel of ``model``.
+
+    ``max_channel`` channels of a model saturate a GPU, so every channel takes ``1 / max_channel`` of the compute
+    budget. When the channel fps is known and the model has a ``max_fps`` budget, the fps share is used instead
+    if it is larger. Memory comes from the model itself, otherwise from ``max_memory / max_channel``.
+    """
+    cost = ChannelCost()
+    if limit is None:
+        cost.memory = float(model.memory or 0)
+        cost.fps = float(fps or model.max_fps or 0)
+        return cost
+    max_channel = limit.max_channel if limit.max_channel and limit.max_channel > 0 else 0
+    cost.fps = float(fps or model.max_fps or 0)
+    if not cost.fps and max_channel and limit.max_fps:
+        cost.fps = limit.max_fps / max_channel
+    if max_channel:
+        cost.load = 1.0 / max_channel
+    if limit.max_fps and cost.fps:
+        cost.load = max(cost.load, cost.fps / limit.max_fps)
+    if model.memory:
+        cost.memory = float(model.memory)
+    elif max_channel and limit.max_memory:
+        cost.memory = limit.max_memory / max_channel
+    return cost
+
+
+class GpuBudget:
+    """
+    Reserved and available budget of one GPU.
+
+    ``memory_base`` is what was used before any channel was placed. update() takes the live memory use and GPU
+    utilization of a sample: a GPU is as loaded as the larger of what its channels reserved and what it measures,
+    so channels which use more than their budget, or other processes, keep new channels away.
+    """
+    def __init__(self, gpu_id: int, memory_total: Optional[int] = None, memory_used: Optional[int] = None) -> None:
+        self.gpu_id = gpu_id
+        self.memory_total = float(memory_total) if memory_total else None
+        self.memory_base = float(memory_used or 0)
+        self.memory_used: Optional[float] = None
+        self.utilization = 0.0
+        self.load = 0.0
+        self.memory_reserved = 0.0
+        self.fps_consumed = 0.0
+        self.channels = 0
+        self.version = 0
+
+    @property
+    def memory_free(self) -> Optional[float]:
+        """
+        Memory left for channels which are not placed yet
+        """
+        if self.memory_total is None:
+            return None
+        used = max(self.memory_base + self.memory_reserved, self.memory_used or 0.0)
+        return max(self.memory_total - used, 0.0)
+
+    @property
+    def effective_load(self) -> float:
+        return max(self.load, self.utilization)
+
+    def update(self, gpu: GpuStatus) -> bool:
+        """
+        Take the live memory use and utilization of ``gpu``, False when nothing changed
+        """
+        memory_used = float(gpu.memory_used) if gpu.memory_used is not None else None
+        utilization = gpu.utilization_gpu / 100.0 if gpu.utilization_gpu is not None else 0.0
+        if memory_used == self.memory_used and utilization == self.utilization:
+            return False
+        if gpu.memory_total:
+            self.memory_total = float(gpu.memory_total)
+        self.memory_used = memory_used
+        self.utilization = utilization
+        self.version += 1
+        return True
+
+    def fits(self, cost: ChannelCost) -> bool:
+        if self.effective_load + cost.load > 1.0 + LOAD_EPSILON:
+            return False
+        memory_free = self.memory_free
+        if memory_free is not None and cost.memory > memory_free:
+            return False
+        return True
+
+    def reserve(self, cost: ChannelCost) -> None:
+        self.load += cost.load
+        self.memory_reserved += cost.memory
+        self.fps_consumed += cost.fps
+        self.channels += 1
+        self.version += 1
+
+    def release(self, cost: ChannelCost) -> None:
+        self.load = max(self.load - cost.load, 0.0)
+        self.memory_reserved = max(self.memory_reserved - cost.memory, 0.0)
+        self.fps_consumed = max(self.fps_consumed - cost.fps, 0.0)
+        self.channels = max(self.channels - 1, 0)
+        self.version += 1
+
+    def __repr__(self) -> str:
+        return (f"GpuBudget(gpu_id={self.gpu_id}, load={self.load:.3f}, memory_reserved={self.memory_reserved:.1f}, "
+                f"memory_free={self.memory_free}, utilization={self.utilization:.2f}, channels={self.channels})")
+
+
+def _score(policy: PlacementPolicy, budget: GpuBudget) -> Tuple:
+    if policy == PlacementPolicy.BEST_FIT:
+        return (-budget.effective_load, -budget.memory_reserved, budget.gpu_id)
+    if policy == PlacementPolicy.SPREAD:
+        return (budget.channels, budget.effective_load, budget.gpu_id)
+    return (budget.effective_load, budget.channels, budget.gpu_id)
+
+
+def _get_overcommit_key(budget: GpuBudget) -> Tuple:
+    return (budget.effective_load, budget.channels, budget.gpu_id)
+
+
+class PlacementEngine:
+    """
+    Bin-packs channels onto GPUs using the per model budgets of ChannelGpuManager.yml.
+
+    GPUs are kept in a heap ordered by the policy score. Entries are invalidated lazily through a per GPU
+    version number, so a placement costs O(log n) unless the best GPUs are out of budget. Budgets follow the live
+    memory use and utilization passed to update_gpus(), see GpuBudget.
+    """
+    def __init__(self,
+                 gpus: List[GpuStatus],
+                 limits: List[NnModelMaxChannelInfo],
+                 policy: PlacementPolicy = PlacementPolicy.LEAST_LOADED) -> None:
+        self.policy = PlacementPolicy(policy)
+        self.__lock = threading.RLock()
+        self.__limits: Dict[Tuple[int, int, int], NnModelMaxChannelInfo] = {}
+        for limit in limits:
+            self.__limits[(limit.key.purpose, limit.key.width, limit.key.height)] = limit
+        self.__budgets: Dict[int, GpuBudget] = {}
+        self.__heap: List[Tuple[Tuple, int, int]] = []
+        for gpu in gpus:
+            self.__budgets[gpu.index] = GpuBudget(gpu.index, gpu.memory_total, gpu.memory_used)
+        self.__rebuild_heap()
+
+    @property
+    def lock(self) -> threading.RLock:
+        return self.__lock
+
+    @property
+    def budgets(self) -> Dict[int, GpuBudget]:
+        return self.__budgets
+
+    def __rebuild_heap(self) -> None:
+        self.__heap = [(_score(self.policy, b), b.gpu_id, b.version) for b in self.__budgets.values()]
+        heapq.heapify(self.__heap)
+
+    def __push(self, budget: GpuBudget) -> None:
+        heapq.heappush(self.__heap, (_score(self.policy, budget), budget.gpu_id, budget.version))
+        if len(self.__heap) > 4 * len(self.__budgets) + 16:
+            self.__rebuild_heap()
+
+    def add_gpu(self, gpu_id: int, memory_total: Optional[int] = None, memory_used: Optional[int] = None) -> None:
+        with self.__lock:
+            if gpu_id in self.__budgets:
+                return
+            budget = GpuBudget(gpu_id, memory_total, memory_used)
+            self.__budgets[gpu_id] = budget
+            self.__push(budget)
+
+    def update_gpu(self, gpu_id: int, gpu: GpuStatus) -> None:
+        """
+        Refresh the budget of ``gpu_id`` from sampled GPU status, a stale GPU keeps its last values
+        """
+        with self.__lock:
+            budget = self.__budgets.get(gpu_id)
+            if budget is not None and not gpu.is_stale and budget.update(gpu):
+                self.__push(budget)
+
+    def update_gpus(self, gpus: List[GpuStatus]) -> None:
+        """
+        update_gpu() for GPU ids which are the GpuStatus.index, as in ChannelGpuManager
+        """
+        with self.__lock:
+            for gpu in gpus:
+                self.update_gpu(gpu.index, gpu)
+
+    def remove_gpu(self, gpu_id: int) -> None:
+        """
+        Forget a GPU, its heap entries are dropped lazily
+        """
+        with self.__lock:
+            self.__budgets.pop(gpu_id, None)
+
+    def set_limit(self, limit: NnModelMaxChannelInfo) -> None:
+        """
+        Add or replace the limit of a model. Costs already reserved are not changed, see
+        ChannelGpuManager.update_model_limits.
+        """
+        with self.__lock:
+            self.__limits[(limit.key.purpose, limit.key.width, limit.key.height)] = limit
+
+    def get_limit(self, model: NnModelInfo) -> Optional[NnModelMaxChannelInfo]:
+        return self.__limits.get((model.purpose, model.width, model.height))
+
+    def get_cost(self, model: NnModelInfo, fps: float = 0.0) -> ChannelCost:
+        return get_channel_cost(model, self.get_limit(model), fps)
+
+    def __select(self, cost: ChannelCost, exclude: AbstractSet[int]) -> Tuple[Optional[int], Optional[GpuBudget]]:
+        """
+        (GPU id with the best score that still fits ``cost``, None when no GPU has budget left), and the least
+        loaded GPU not in ``exclude`` among the ones looked at, which is every GPU when none fits
+        """
+        skipped = []
+        selected = None
+        least_loaded = None
+        while self.__heap:
+            entry = heapq.heappop(self.__heap)
+            _, gpu_id, version = entry
+            budget = self.__budgets.get(gpu_id)
+            if budget is None or budget.version != version:
+                continue    # stale entry
+            skipped.append(entry)
+            if gpu_id in exclude:
+                continue
+            if least_loaded is None or _get_overcommit_key(budget) < _get_overcommit_key(least_loaded):
+                least_loaded = budget
+            if budget.fits(cost):
+                selected = gpu_id
+                break
+        for entry in skipped:
+            heapq.heappush(self.__heap, entry)
+        return selected, least_loaded
+
+    def select(self, cost: ChannelCost, exclude: AbstractSet[int] = frozenset()) -> Optional[int]:
+        """
+        GPU id with the best score that still fits ``cost``, None when no GPU has budget left
+        """
+        with self.__lock:
+            return self.__select(cost, exclude)[0]
+
+    def place(self, cost: ChannelCost, exclude: AbstractSet[int] = frozenset()) -> int:
+        """
+        Reserve ``cost`` on the best GPU not in ``exclude``. When every GPU is out of budget the least loaded one is
+        overcommitted. Returns -1 when there is no GPU at all.
+        """
+        with self.__lock:
+            gpu_id, least_loaded = self.__select(cost, exclude)
+            if gpu_id is None:
+                if least_loaded is None:
+                    return -1
+                gpu_id = least_loaded.gpu_id
+                LOGGER.warning("No GPU has budget left for %s, overcommitting GPU %d", cost, gpu_id)
+            self.reserve(gpu_id, cost)
+            return gpu_id
+
+    def reserve(self, gpu_id: int, cost: ChannelCost) -> None:
+        with self.__lock:
+            budget = self.__budgets[gpu_id]
+            budget.reserve(cost)
+            self.__push(budget)
+
+    def release(self, gpu_id: int, cost: ChannelCost) -> None:
+        with self.__lock:
+            budget = self.__budgets.get(gpu_id)
+            if budget is None:
+                return
+            budget.release(cost)
+            self.__push(budget)
+
+    def move(self, from_gpu_id: int, to_gpu_id: int, cost: ChannelCost) -> None:
+        with self.__lock:
+            self.release(from_gpu_id, cost)
+            self.reserve(to_gpu_id, cost)
@@ -0,0 +1,327 @@
+"""
+Cluster wide channel placement.
+
+ClusterPlacer has get_gpu_id_for_the_channel semantics over the GPUs of many nodes, PlacementServer exposes it
+over HTTP with JSON bodies in the camelCase keys of the models::
+
+    POST /place      {"requests": [{"channelId": 1, "model": {"purpose": 75, "width": 416, "height": 416},
+                                    "fps": 10.0}]}
+                  -> {"results": [{"channelId": 1, "model": {...}, "node": "gpu-node-3", "gpuId": 1,
+                                   "fpsConsumed": 10.0, "isNew": true}]}
+    POST /release    {"requests": [...]} -> {"released": 1}
+    GET  /assignments                    -> {"results": [...]}
+    GET  /nodes                          -> {"nodes": {"gpu-node-3": 2}}
+"""
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from . import codec
+from .models import ChannelAndNnModel, GpuStatus, NnModelMaxChannelInfo, PlacementRequest, PlacementResult
+from .placement import ChannelCost, PlacementEngine, PlacementPolicy
+
+LOGGER = logging.getLogger(__name__)
+
+CONTENT_TYPE = "application/json"
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+class ClusterPlacer:
+    """
+    Bin-pack channels onto the GPUs of all nodes with one PlacementEngine.
+
+    Every (node, GPU index) gets an engine GPU id of its own. Placement is idempotent per ChannelAndNnModel: asking
+    again for a placed channel returns its placement without reserving anything. A batch is placed under one lock,
+    so concurrent batches never see each other half done. A suspended node gets no new channels but keeps the ones
+    placed on it, and their budget. When a node is removed its channels are forgotten and get a new placement on
+    their next request.
+    """
+
+    def __init__(self,
+                 limits: List[NnModelMaxChannelInfo],
+                 policy: PlacementPolicy = PlacementPolicy.LEAST_LOADED) -> None:
+        self.engine = PlacementEngine([], limits, policy)
+        self.__gpu_ids: Dict[Tuple[str, int], int] = {}
+        self.__gpus: Dict[int, Tuple[str, int]] = {}
+        self.__next_gpu_id = 0
+        self.__suspended: Set[int] = set()
+        self.__assignments: Dict[ChannelAndNnModel, Tuple[int, ChannelCost]] = {}
+
+    def add_node(self, node: str, gpus: List[GpuStatus]) -> None:
+        """
+        Add the GPUs of ``node`` which are not known yet, their budgets start from the memory used now. The budgets
+        of known GPUs are refreshed from ``gpus``. A suspended node is resumed.
+        """
+        with self.engine.lock:
+            self.resume_node(node)
+            for gpu in gpus:
+                if gpu.is_stale:
+                    continue
+                gpu_id = self.__gpu_ids.get((node, gpu.index))
+                if gpu_id is not None:
+                    self.engine.update_gpu(gpu_id, gpu)
+                    continue
+                gpu_id = self.__next_gpu_id
+                self.__next_gpu_id += 1
+                self.__gpu_ids[(node, gpu.index)] = gpu_id
+                self.__gpus[gpu_id] = (node, gpu.index)
+                self.engine.add_gpu(gpu_id, gpu.memory_total, gpu.memory_used)
+                LOGGER.info("Placement: added GPU %d of %s", gpu.index, node)
+
+    def __get_node_gpu_ids(self, node: str) -> Set[int]:
+        return {gpu_id for (name, _), gpu_id in self.__gpu_ids.items() if name == node}
+
+    def suspend_node(self, node: str) -> None:
+        """
+        Place no new channels on ``node``, the channels already placed on it are kept
+        """
+        with self.engine.lock:
+            gpu_ids = self.__get_node_gpu_ids(node) - self.__suspended
+            if gpu_ids:
+                self.__suspended.update(gpu_ids)
+                LOGGER.warning("Placement: suspended %s", node)
+
+    def resume_node(self, node: str) -> None:
+        with self.engine.lock:
+            gpu_ids = self.__get_node_gpu_ids(node) & self.__suspended
+            if gpu_ids:
+                self.__suspended.difference_update(gpu_ids)
+                LOGGER.info("Placement: resumed %s", node)
+
+    def remove_node(self, node: str) -> int:
+        """
+        Forget ``node`` and the channels placed on it, returns the number of channels forgotten
+        """
+        with self.engine.lock:
+            gpu_ids = self.__get_node_gpu_ids(node)
+            if not gpu_ids:
+                return 0
+            for gpu_id in gpu_ids:
+                self.__suspended.discard(gpu_id)
+                del self.__gpu_ids[self.__gpus.pop(gpu_id)]
+                self.engine.remove_gpu(gpu_id)
+            channels = [key for key, (gpu_id, _) in self.__assignments.items() if gpu_id in gpu_ids]
+            for key in channels:
+                del self.__assignments[key]
+            LOGGER.warning("Placement: removed %s, %d channel(s) have to be placed again", node, len(channels))
+            return len(channels)
+
+    def get_nodes(self) -> Dict[str, int]:
+        """
+        node -> number of GPUs
+        """
+        with self.engine.lock:
+            nodes: Dict[str, int] = {}
+            for node, _ in self.__gpu_ids:
+                nodes[node] = nodes.get(node, 0) + 1
+            return nodes
+
+    def __get_result(self, key: ChannelAndNnModel, gpu_id: int, cost: ChannelCost, is_new: bool) -> PlacementResult:
+        node, index = self.__gpus[gpu_id]
+        return PlacementResult(channel_id=key.channel_id,
+                               model=key.model_id,
+                               node=node,
+                               gpu_id=index,
+                               fps_consumed=cost.fps,
+                               is_new=is_new)
+
+    def place(self, requests: List[PlacementRequest]) -> List[PlacementResult]:
+        results = []
+        with self.engine.lock:
+            for request in requests:
+                key = ChannelAndNnModel(request.channel_id, request.model)
+                assignment = self.__assignments.get(key)
+                if assignment is not None:
+                    results.append(self.__get_result(key, assignment[0], assignment[1], False))
+                    continue
+                cost = self.engine.get_cost(request.model, request.fps)
+                gpu_id = self.engine.place(cost, self.__suspended)
+                if gpu_id < 0:
+                    results.append(PlacementResult(channel_id=request.channel_id, model=request.model))
+                    continue
+                self.__assignments[key] = (gpu_id, cost)
+                results.append(self.__get_result(key, gpu_id, cost, True))
+        return results
+
+    def release(self, requests: List[PlacementRequest]) -> int:
+        released = 0
+        with self.engine.lock:
+            for request in requests:
+                assignment = self.__assignments.pop(ChannelAndNnModel(request.channel_id, request.model), None)
+                if assignment is not None:
+                    self.engine.release(*assignment)
+                    released += 1
+        return released
+
+    def get_assignments(self) -> List[PlacementResult]:
+        with self.engine.lock:
+            return [self.__get_result(key, gpu_id, cost, False) for key, (gpu_id, cost) in self.__assignments.items()]
+
+    def sync_from_fleet(self, aggregator, remove_after_sec: float = 60.0) -> None:
+        """
+        Take over the nodes of a fleet.FleetAggregator: fresh nodes are added or resumed, stale or disconnected
+        ones suspended, and ones not heard from for ``remove_after_sec`` removed. A node which reconnects within
+        that time keeps its channels.
+        """
+        for node in aggregator.get_nodes():
+            age_sec = node["ageSec"]
+            if age_sec is None or age_sec > max(remove_after_sec, aggregator.stale_after_sec):
+                self.remove_node(node["node"])
+                continue
+            status = aggregator.get_latest(node["node"])
+            if status is None or not node["connected"] or age_sec > aggregator.stale_after_sec:
+                self.suspend_node(node["node"])
+            else:
+                self.add_node(node["node"], status.gpus)
+
+
+class PlacementServer:
+    """
+    Serve a ClusterPlacer over HTTP, see the module documentation. ``sync`` is called every ``sync_interval_sec``
+    to update the nodes, e.g. ClusterPlacer.sync_from_fleet.
+    """
+
+    def __init__(self,
+                 placer: ClusterPlacer,
+                 host: str = "127.0.0.1",
+                 port: int = 9412,
+                 sync: Optional[Callable[[], None]] = None,
+                 sync_interval_sec: float = 5.0) -> None:
+        self.placer = placer
+        self.sync = sync
+        self.sync_interval_sec = sync_interval_sec
+        self.__is_stop = threading.Event()
+        request_codec = codec.get_codec(PlacementRequest)
+        result_codec = codec.get_codec(PlacementResult)
+
+        def get_requests(body: Dict[str, Any]) -> List[PlacementRequest]:
+            return [request_codec.from_dict(request) for request in body["requests"]]
+
+        def get_results(results: List[PlacementResult]) -> Dict[str, Any]:
+            return {"results": [result_codec.to_dict(result) for result in results]}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written apart, Nagle would hold the body back for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def __reply(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/assignments":
+                    self.__reply(200, get_results(placer.get_assignments()))
+                elif path == "/nodes":
+                    self.__reply(200, {"nodes": placer.get_nodes()})
+                else:
+                    self.__reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                path = self.path.split("?", 1)[0]
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY_SIZE:
+                    self.close_connection = True
+                    self.__reply(413, {"error": "request too large"})
+                    return
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                    if path == "/place":
+                        self.__reply(200, get_results(placer.place(get_requests(body))))
+                    elif path == "/release":
+                        self.__reply(200, {"released": placer.release(get_requests(body))})
+                    else:
+                        self.__reply(404, {"error": "not found"})
+                except (KeyError, TypeError, ValueError) as e:
+                    self.__reply(400, {"error": f"bad request: {e!r}"})
+
+            def log_message(self, format, *args):
+                LOGGER.debug(format, *args)
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="placement_server", daemon=True)
+        self.__sync_thread = threading.Thread(target=self.__sync_forever, name="placement_sync", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.__server.server_address[1]
+
+    def __sync_forever(self) -> None:
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                LOGGER.exception(e)
+            if self.__is_stop.wait(self.sync_interval_sec):
+                break
+
+    def start(self) -> None:
+        if self.sync is not None:
+            self.__sync_thread.start()
+        self.__thread.start()
+        LOGGER.info("Serving channel placement on port %d", self.port)
+
+    def stop(self) -> None:
+        self.__is_stop.set()
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+class PlacementClient:
+    """
+    Blocking client of a PlacementServer, one keep-alive connection reused by all calls
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9412, timeout_sec: float = 10.0) -> None:
+        self.host = host
+        self.port = port
+        self.timeout_sec = timeout_sec
+        self.__connection = None
+        self.__lock = threading.Lock()
+
+    def __request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        import http.client
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": CONTENT_TYPE} if data is not None else {}
+        with self.__lock:
+            for attempt in range(2):
+                if self.__connection is None:
+                    self.__connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout_sec)
+                try:
+                    self.__connection.request(method, path, body=data, headers=headers)
+                    response = self.__connection.getresponse()
+                    payload = json.loads(response.read())
+                    break
+                except (OSError, http.client.HTTPException):
+                    # A kept alive connection may have been closed by the server, retry once on a new one
+                    self.close()
+                    if attempt:
+                        raise
+        if response.status != 200:
+            raise ValueError(payload.get("error"))
+        return payload
+
+    def place(self, requests: List[PlacementRequest]) -> List[PlacementResult]:
+        body = {"requests": [codec.to_dict(request) for request in requests]}
+        result_codec = codec.get_codec(PlacementResult)
+        return [result_codec.from_dict(result) for result in self.__request("POST", "/place", body)["results"]]
+
+    def release(self, requests: List[PlacementRequest]) -> int:
+        body = {"requests": [codec.to_dict(request) for request in requests]}
+        return self.__request("POST", "/release", body)["released"]
+
+    def get_nodes(self) -> Dict[str, int]:
+        return self.__request("GET", "/nodes")["nodes"]
+
+    def close(self) -> None:
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
@@ -0,0 +1,247 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Set
+
+import psutil
+from singleton_decorator.decorator import singleton
+
+from .models import ProcessStatus
+
+LOGGER = logging.getLogger(__name__)
+MB = 1024 * 1024
+
+
+class WindowStats(NamedTuple):
+    min: float
+    avg: float
+    max: float
+    count: int
+
+
+class RollingWindow:
+    """
+    Last ``size`` samples of a metric with O(1) append and average
+    """
+    __slots__ = ("__values", "__total")
+
+    def __init__(self, size: int) -> None:
+        self.__values: Deque[float] = deque(maxlen=size)
+        self.__total = 0.0
+
+    def append(self, value: float) -> None:
+        if len(self.__values) == self.__values.maxlen:
+            self.__total -= self.__values[0]
+        self.__values.append(value)
+        self.__total += value
+
+    def get_stats(self) -> Optional[WindowStats]:
+        if not self.__values:
+            return None
+        return WindowStats(min(self.__values), self.__total / len(self.__values), max(self.__values),
+                           len(self.__values))
+
+    def __len__(self) -> int:
+        return len(self.__values)
+
+
+class ProcessEntry:
+    """
+    Fields of a process which do not change during its lifetime, the psutil handle used to sample it and its
+    recent CPU and memory usage. ``lock`` serializes the sampling of the shared handle.
+    """
+    __slots__ = ("pid", "create_time", "name", "exe", "username", "command", "full_command", "handle",
+                 "is_cpu_primed", "cpu_window", "memory_window", "lock", "sample_id", "cpu_percent", "memory_mib")
+
+    def __init__(self, pid: int, create_time: float, window_size: int) -> None:
+        self.pid = pid
+        self.create_time = create_time
+        self.name = ""
+        self.exe = ""
+        self.username: Optional[str] = None
+        self.command = '?'
+        self.full_command: List[str] = ['?']
+        self.handle: Optional[psutil.Process] = None
+        self.is_cpu_primed = False
+        self.cpu_window = RollingWindow(window_size)
+        self.memory_window = RollingWindow(window_size)
+        self.lock = threading.Lock()
+        self.sample_id: Optional[int] = None
+        self.cpu_percent: Optional[float] = None
+        self.memory_mib: Optional[int] = None
+
+    def matches(self, name: str) -> bool:
+        return (self.full_command != ['?']
+                and (name == self.name or self.full_command[0] == name or os.path.basename(self.exe) == name))
+
+
+@singleton
+class ProcessTable:
+    """
+    PID keyed cache of immutable process fields.
+
+    An entry is read once per process lifetime, a reused PID is detected through its create time. Only the CPU
+    usage and the RSS are read on every sample.
+
+    The psutil.Process handle is kept for the lifetime of the process: cpu_percent() measures the CPU time since
+    the previous call on the same handle, so a fresh handle per sample would always report 0.0.
+
+    The process list of the host is read every SCAN_INTERVAL_SEC only: find() reuses the processes of the last
+    scan in between, and dead entries are evicted at the same pace.
+    """
+    WINDOW_SIZE = 60
+    SCAN_INTERVAL_SEC = 10.0
+
+    def __init__(self) -> None:
+        self.__entries: Dict[int, ProcessEntry] = {}
+        self.__lock = threading.Lock()
+        self.__cpu_count = psutil.cpu_count() or 1
+        self.__last_scan: Optional[float] = None
+        self.__last_eviction: Optional[float] = None
+        # name -> pids found by the last scan
+        self.__found: Dict[str, List[int]] = {}
+
+    def __new_entry(self, ps_process: psutil.Process, create_time: float) -> ProcessEntry:
+        entry = ProcessEntry(ps_process.pid, create_time, self.WINDOW_SIZE)
+        entry.handle = ps_process
+        try:
+            entry.name = ps_process.name()
+            entry.exe = ps_process.exe()
+        except (psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+        try:
+            entry.username = ps_process.username()
+        except (psutil.AccessDenied, KeyError):
+            pass
+        # cmdline returns full path;,        # as in `ps -o comm`, get short cmdnames.
+        try:
+            cmdline = ps_process.cmdline()
+        except (psutil.AccessDenied, psutil.ZombieProcess):
+            cmdline = None
+        if cmdline:
+            entry.command = os.path.basename(cmdline[0])
+            entry.full_command = cmdline
+        # else: sometimes, zombie or unknown (e.g. [kworker/8:2H])
+        return entry
+
+    def get_entry(self, ps_process: psutil.Process) -> ProcessEntry:
+        """
+        Raises psutil.NoSuchProcess when the process is gone
+        """
+        create_time = ps_process.create_time()
+        with self.__lock:
+            entry = self.__entries.get(ps_process.pid)
+        if entry is None or entry.create_time != create_time:
+            entry = self.__new_entry(ps_process, create_time)
+            with self.__lock:
+                self.__entries[ps_process.pid] = entry
+        return entry
+
+    def get_process(self, pid: int) -> psutil.Process:
+        """
+        Long lived handle of ``pid``, raises psutil.NoSuchProcess when the process is gone
+        """
+        with self.__lock:
+            entry = self.__entries.get(pid)
+        if entry is not None and entry.handle is not None:
+            return entry.handle
+        return psutil.Process(pid=pid)
+
+    def extract(self, ps_process: psutil.Process, sample_id: Optional[int] = None) -> ProcessStatus:
+        """
+        A process on several GPUs is extracted once per GPU. Calls with the same ``sample_id`` read the process
+        once and return the same usage, a second cpu_percent() right after the first would measure nothing.
+        """
+        entry = self.get_entry(ps_process)
+        handle = entry.handle if entry.handle is not None else ps_process
+        with entry.lock:
+            process = ProcessStatus(pid=handle.pid,
+                                    command=entry.command,
+                                    full_command=entry.full_command,
+                                    username=entry.username)
+            if sample_id is not None and entry.sample_id == sample_id:
+                process.cpu_percent = entry.cpu_percent
+                process.cpu_memory_usage_mib = entry.memory_mib
+                return process
+            entry.sample_id = sample_id
+            entry.cpu_percent = None
+            entry.memory_mib = None
+            with handle.oneshot():
+                try:
+                    cpu_percent = handle.cpu_percent() / self.__cpu_count
+                    if entry.is_cpu_primed:
+                        process.cpu_percent = entry.cpu_percent = cpu_percent
+                        entry.cpu_window.append(cpu_percent)
+                    else:
+                        # The first cpu_percent() call on a handle only sets the reference point
+                        entry.is_cpu_primed = True
+                    process.cpu_memory_usage_mib = entry.memory_mib = handle.memory_info().rss // MB
+                    entry.memory_window.append(process.cpu_memory_usage_mib)
+                except psutil.AccessDenied:
+                    pass
+        return process
+
+    def get_cpu_stats(self, pid: int) -> Optional[WindowStats]:
+        with self.__lock:
+            entry = self.__entries.get(pid)
+        return entry.cpu_window.get_stats() if entry is not None else None
+
+    def get_memory_stats(self, pid: int) -> Optional[WindowStats]:
+        with self.__lock:
+            entry = self.__entries.get(pid)
+        return entry.memory_window.get_stats() if entry is not None else None
+
+    def evict_dead(self, alive: Optional[Set[int]] = None) -> int:
+        """
+        Drop the entries of exited processes, returns the number of dropped entries
+        """
+        if alive is None:
+            alive = set(psutil.pids())
+        with self.__lock:
+            dead = [pid for pid in self.__entries if pid not in alive]
+            for pid in dead:
+                del self.__entries[pid]
+            self.__last_eviction = time.monotonic()
+        return len(dead)
+
+    def evict_dead_if_due(self) -> int:
+        """
+        evict_dead() when the last eviction is SCAN_INTERVAL_SEC old
+        """
+        if self.__last_eviction is not None and time.monotonic() - self.__last_eviction < self.SCAN_INTERVAL_SEC:
+            return 0
+        return self.evict_dead()
+
+    def scan(self) -> None:
+        """
+        Read the process list of the host: add entries for new processes, replace the ones of reused PIDs and
+        evict the dead ones
+        """
+        pids = psutil.pids()
+        for pid in pids:
+            try:
+                self.get_entry(psutil.Process(pid))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        self.evict_dead(set(pids))
+        with self.__lock:
+            self.__found.clear()
+            self.__last_scan = time.monotonic()
+
+    def find(self, name: str) -> List[psutil.Process]:
+        """
+        Handles of the processes called ``name`` as of the last scan, see ProcessEntry.matches. Scans when the
+        last scan is SCAN_INTERVAL_SEC old.
+        """
+        if self.__last_scan is None or time.monotonic() - self.__last_scan >= self.SCAN_INTERVAL_SEC:
+            self.scan()
+        with self.__lock:
+            pids = self.__found.get(name)
+            if pids is None:
+                pids = self.__found[name] = [pid for pid, entry in self.__entries.items() if entry.matches(name)]
+            return [self.__entries[pid].handle for pid in pids if pid in self.__entries]
+
+    def __len__(self) -> int:
+        return len(self.__entries)
@@ -0,0 +1,155 @@
+import logging
+from threading import Event, Thread
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from .models import ChannelAndNnModel, GpuEvent, GpuStatus, RebalancerConfig
+from .utils import get_current_time
+
+if TYPE_CHECKING:
+    from .controllers import ChannelGpuManager
+
+LOGGER = logging.getLogger(__name__)
+
+# GpuEvent.event_type of a migration, see events.EVENT_TYPES
+REBALANCE = "rebalance"
+
+
+def get_gpu_pressure(gpu: GpuStatus, budget_load: float = 0.0) -> float:
+    """
+    Highest of live memory use, live GPU utilization and reserved compute budget, as a fraction of 1.0
+    """
+    pressure = budget_load
+    if gpu.memory_total and gpu.memory_used is not None:
+        pressure = max(pressure, gpu.memory_used / gpu.memory_total)
+    if gpu.utilization_gpu is not None:
+        pressure = max(pressure, gpu.utilization_gpu / 100.0)
+    return pressure
+
+
+class ChannelRebalancer(Thread):
+    """
+    Move channels off GPUs that stay over their memory or FPS budget.
+
+    Only ``on_migrate`` can move a running channel, the manager only keeps the books. Without it the rebalancer
+    reports: the migrations it would make are logged and passed to ``on_event`` as REBALANCE events, and the
+    channel map and the budgets are left alone so that they keep matching what runs on every GPU.
+    """
+
+    def __init__(self,
+                 manager: "ChannelGpuManager",
+                 config: RebalancerConfig,
+                 get_gpu_status: Callable[[], List[GpuStatus]],
+                 on_migrate: Optional[Callable[[ChannelAndNnModel, int, int], None]] = None,
+                 on_event: Optional[Callable[[GpuEvent], None]] = None):
+        self.__is_stop = Event()
+        self.__is_already_shutting_down = False
+        self.__manager = manager
+        self.__config = config
+        self.__get_gpu_status = get_gpu_status
+        self.__on_migrate = on_migrate
+        self.__on_event = on_event
+        self.__hot_count: Dict[int, int] = {}
+        self.__hot_gpus = set()
+        self.__cooldown: Dict[ChannelAndNnModel, int] = {}
+        super().__init__(daemon=True)
+
+    def run(self) -> None:
+        while not self.__is_stop.wait(self.__config.interval_sec):
+            try:
+                self.rebalance_once()
+            except Exception as e:
+                LOGGER.exception(e)
+
+    def __update_hot_gpus(self, pressure: Dict[int, float]) -> None:
+        # Hysteresis: a GPU becomes hot after sustain_intervals samples above the high watermark
+        # and stays hot until it drops under the low watermark.
+        for gpu_id, p in pressure.items():
+            if p >= self.__config.high_watermark:
+                self.__hot_count[gpu_id] = self.__hot_count.get(gpu_id, 0) + 1
+                if self.__hot_count[gpu_id] >= self.__config.sustain_intervals:
+                    self.__hot_gpus.add(gpu_id)
+            elif p <= self.__config.low_watermark:
+                self.__hot_count[gpu_id] = 0
+                self.__hot_gpus.discard(gpu_id)
+
+    def rebalance_once(self) -> int:
+        """
+        One rebalancing pass, returns the number of migrated, or in report mode suggested, channels
+        """
+        for candidate in list(self.__cooldown.keys()):
+            self.__cooldown[candidate] -= 1
+            if self.__cooldown[candidate] <= 0:
+                del self.__cooldown[candidate]
+
+        engine = self.__manager.placement_engine
+        gpus = {gpu.index: gpu for gpu in self.__get_gpu_status()}
+        engine.update_gpus(list(gpus.values()))
+        pressure: Dict[int, float] = {}
+        for gpu_id, gpu in gpus.items():
+            budget = engine.budgets.get(gpu_id)
+            pressure[gpu_id] = get_gpu_pressure(gpu, budget.load if budget else 0.0)
+        self.__update_hot_gpus(pressure)
+
+        migrations = 0
+        for hot_gpu_id in sorted(self.__hot_gpus, key=lambda g: -pressure.get(g, 0.0)):
+            gpu = gpus.get(hot_gpu_id)
+            if gpu is None:
+                continue
+            for candidate in reversed(self.__manager.get_channels_on_gpu(hot_gpu_id)):
+                if migrations >= self.__config.max_migrations_per_interval:
+                    return migrations
+                if pressure[hot_gpu_id] <= self.__config.low_watermark:
+                    break
+                if candidate in self.__cooldown:
+                    continue
+                excluded = {g for g, p in pressure.items() if p > self.__config.low_watermark or g in self.__hot_gpus}
+                # The channel map and the budgets must not change between choosing the target and moving there
+                with engine.lock:
+                    x = self.__manager.channel_to_gpu_map.get(candidate)
+                    if x is None or x.gpu_id != hot_gpu_id:
+                        continue
+                    cost = engine.get_cost(candidate.model_id, x.fps_consumed)
+                    target = engine.select(cost, exclude=excluded)
+                    if target is None:
+                        continue
+                    if self.__on_migrate is not None:
+                        self.__manager.migrate(candidate, target)
+                self.__cooldown[candidate] = self.__config.cooldown_intervals
+                migrations += 1
+                # Estimate the effect until the next sample shows the real numbers
+                for gpu_id, sign in ((hot_gpu_id, -1), (target, 1)):
+                    memory_total = gpus[gpu_id].memory_total if gpu_id in gpus else None
+                    delta = cost.load
+                    if memory_total:
+                        delta = max(delta, cost.memory / memory_total)
+                    pressure[gpu_id] = pressure.get(gpu_id, 0.0) + sign * delta
+                if self.__on_migrate is None:
+                    self.__report(candidate, gpu, target)
+                    continue
+                LOGGER.info("Migrated %s from GPU %d to GPU %d", candidate, hot_gpu_id, target)
+                try:
+                    self.__on_migrate(candidate, hot_gpu_id, target)
+                except Exception as e:
+                    LOGGER.exception(e)
+        return migrations
+
+    def __report(self, candidate: ChannelAndNnModel, gpu: GpuStatus, target: int) -> None:
+        description = f"{candidate} should move to GPU {target}"
+        LOGGER.warning("GPU %d is over budget: %s", gpu.index, description)
+        if self.__on_event is not None:
+            try:
+                self.__on_event(
+                    GpuEvent(timestamp=get_current_time(),
+                             gpu_index=gpu.index,
+                             event_type=REBALANCE,
+                             data=target,
+                             uuid=gpu.uuid,
+                             description=description))
+            except Exception as e:
+                LOGGER.exception(e)
+
+    def stop(self):
+        if self.__is_already_shutting_down:
+            return
+        self.__is_already_shutting_down = True
+        self.__is_stop.set()
@@ -0,0 +1,262 @@
+import glob
+import json
+import logging
+import os
+import threading
+from typing import BinaryIO, Dict, List, Optional, TextIO
+
+import numpy as np
+
+from .models import GpuEvent, SystemStatus
+from .pipeline import SampleSink
+from .timeseries import GPU_METRICS
+
+LOGGER = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "samples_"
+SEGMENT_SUFFIX = ".bin"
+HEADER_SUFFIX = ".json"
+EVENTS_PREFIX = "events_"
+EVENTS_SUFFIX = ".jsonl"
+FORMAT_VERSION = 1
+
+
+def get_record_dtype(number_of_gpus: int) -> np.dtype:
+    """
+    One fixed width little endian record per sample. Missing values are NaN.
+    """
+    fields = [("timestamp", "<i8"), ("cpu.cpu_percent", "<f4"), ("cpu.cpu_memory_usage_percent", "<f4")]
+    for index in range(number_of_gpus):
+        fields.extend((f"gpu{index}.{metric}", "<f4") for metric in GPU_METRICS)
+    return np.dtype(fields)
+
+
+class BinaryRecorder(SampleSink):
+    """
+    Append samples as fixed width binary records to chunked segment files.
+
+    A segment ``samples_<first timestamp>.bin`` holds up to ``records_per_segment`` records of one layout, its
+    layout is described by the ``.json`` header next to it. A new segment is started when it is full or when the
+    number of GPUs changes. When a segment is started, the oldest ones are removed until at most ``max_segments``
+    segments of at most ``max_bytes`` in total are left, 0 disables a limit. The segment being written is never
+    removed. Samples less than ``min_interval_sec`` after the last recorded one are skipped, so the fast samples
+    of adaptive sampling do not multiply the disk usage.
+    GpuEvents are appended as JSON lines to ``events_<first timestamp>.jsonl`` files in the same folder, which are
+    rotated after ``records_per_segment`` events and removed with the same limits as the segments.
+    """
+
+    def __init__(self,
+                 folder: str,
+                 records_per_segment: int = 86400,
+                 max_segments: int = 0,
+                 flush_every: int = 10,
+                 max_bytes: int = 0,
+                 min_interval_sec: float = 0.0) -> None:
+        self.folder = folder
+        self.records_per_segment = records_per_segment
+        self.max_segments = max_segments
+        self.max_bytes = max_bytes
+        self.min_interval_ms = int(min_interval_sec * 1000)
+        self.flush_every = flush_every
+        self.__lock = threading.Lock()
+        self.__file: Optional[BinaryIO] = None
+        self.__dtype: Optional[np.dtype] = None
+        self.__number_of_gpus = -1
+        self.__records_in_segment = 0
+        self.__record: Optional[np.ndarray] = None
+        self.__last_timestamp: Optional[int] = None
+        self.__events_file: Optional[TextIO] = None
+        self.__events_in_file = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def __open_segment(self, timestamp: int, number_of_gpus: int) -> None:
+        self.__close_segment()
+        self.__dtype = get_record_dtype(number_of_gpus)
+        self.__record = np.zeros(1, dtype=self.__dtype)
+        self.__number_of_gpus = number_of_gpus
+        self.__records_in_segment = 0
+        base_name = os.path.join(self.folder, f"{SEGMENT_PREFIX}{timestamp}")
+        with open(base_name + HEADER_SUFFIX, "w") as outfile:
+            json.dump({"version": FORMAT_VERSION, "numberOfGpus": number_of_gpus, "fields": self.__dtype.names},
+                      outfile)
+        self.__file = open(base_name + SEGMENT_SUFFIX, "ab")
+        self.__remove_old_files(get_segment_paths(self.folder), HEADER_SUFFIX)
+
+    def __close_segment(self) -> None:
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __open_events_file(self, timestamp: int) -> None:
+        self.__close_events_file()
+        self.__events_in_file = 0
+        self.__events_file = open(os.path.join(self.folder, f"{EVENTS_PREFIX}{timestamp}{EVENTS_SUFFIX}"), "a")
+        self.__remove_old_files(get_events_paths(self.folder))
+
+    def __close_events_file(self) -> None:
+        if self.__events_file is not None:
+            self.__events_file.close()
+            self.__events_file = None
+
+    def __remove_old_files(self, paths: List[str], header_suffix: Optional[str] = None) -> None:
+        """
+        Remove the oldest of ``paths`` and their headers beyond the limits. The last path is the one just opened.
+        """
+        if self.max_segments <= 0 and self.max_bytes <= 0:
+            return
+        sizes = []
+        for path in paths:
+            try:
+                sizes.append(os.path.getsize(path))
+            except OSError:
+                sizes.append(0)
+        count = len(paths)
+        total = sum(sizes)
+        for path, size in zip(paths[:-1], sizes):
+            is_too_many = self.max_segments > 0 and count > self.max_segments
+            is_too_large = self.max_bytes > 0 and total > self.max_bytes
+            if not is_too_many and not is_too_large:
+                break
+            removed = [path]
+            if header_suffix is not None:
+                removed.append(os.path.splitext(path)[0] + header_suffix)
+            for p in removed:
+                try:
+                    os.remove(p)
+                except OSError as e:
+                    LOGGER.error(e)
+            count -= 1
+            total -= size
+
+    def on_sample(self, timestamp: int, system_status: SystemStatus) -> None:
+        self.append(timestamp, system_status)
+
+    def append(self, timestamp: int, system_status: SystemStatus) -> None:
+        with self.__lock:
+            if self.__last_timestamp is not None and timestamp - self.__last_timestamp < self.min_interval_ms:
+                return
+            self.__last_timestamp = timestamp
+            number_of_gpus = len(system_status.gpus)
+            if (self.__file is None or number_of_gpus != self.__number_of_gpus
+                    or self.__records_in_segment >= self.records_per_segment):
+                self.__open_segment(timestamp, number_of_gpus)
+            record = self.__record[0]
+            record["timestamp"] = timestamp
+            record["cpu.cpu_percent"] = system_status.cpu.cpu_percent
+            record["cpu.cpu_memory_usage_percent"] = system_status.cpu.cpu_memory_usage_percent
+            for index, gpu in enumerate(system_status.gpus):
+                for metric in GPU_METRICS:
+                    value = None if gpu.is_stale else getattr(gpu, metric)
+                    record[f"gpu{index}.{metric}"] = np.nan if value is None else value
+            self.__file.write(self.__record.tobytes())
+            self.__records_in_segment += 1
+            if self.__records_in_segment % self.flush_every == 0:
+                self.__file.flush()
+
+    def on_event(self, event: GpuEvent) -> None:
+        with self.__lock:
+            if self.__events_file is None or self.__events_in_file >= self.records_per_segment:
+                self.__open_events_file(event.timestamp)
+            self.__events_file.write(event.to_json() + "\n")
+            self.__events_file.flush()
+            self.__events_in_file += 1
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__close_segment()
+            self.__close_events_file()
+
+
+def get_timestamped_paths(folder: str, prefix: str, suffix: str) -> List[str]:
+    """
+    Files ``<prefix><timestamp><suffix>`` of ``folder``, oldest first. Files whose name has no timestamp are ignored.
+    """
+    paths = []
+    for path in glob.glob(os.path.join(folder, prefix + "*" + suffix)):
+        try:
+            paths.append((int(os.path.basename(path)[len(prefix):-len(suffix)]), path))
+        except ValueError:
+            continue
+    return [path for _, path in sorted(paths)]
+
+
+def get_segment_paths(folder: str) -> List[str]:
+    """
+    Segment files of ``folder``, oldest first
+    """
+    return get_timestamped_paths(folder, SEGMENT_PREFIX, SEGMENT_SUFFIX)
+
+
+def get_events_paths(folder: str) -> List[str]:
+    """
+    Event files of ``folder``, oldest first
+    """
+    return get_timestamped_paths(folder, EVENTS_PREFIX, EVENTS_SUFFIX)
+
+
+def load_events(folder: str, since: Optional[int] = None, until: Optional[int] = None) -> List[GpuEvent]:
+    """
+    Recorded GpuEvents with ``since <= timestamp < until``, oldest first
+    """
+    events = []
+    for path in get_events_paths(folder):
+        try:
+            with open(path, "r") as infile:
+                for line in infile:
+                    try:
+                        event = GpuEvent.from_json(line)
+                    except (ValueError, KeyError) as e:
+                        LOGGER.error("Skipping event %r: %s", line, e)
+                        continue
+                    if (since is None or event.timestamp >= since) and (until is None or event.timestamp < until):
+                        events.append(event)
+        except FileNotFoundError:
+            continue
+    return events
+
+
+def open_segment(path: str) -> Optional[np.memmap]:
+    """
+    Memory map one segment. A partially written last record is ignored.
+    """
+    with open(path[:-len(SEGMENT_SUFFIX)] + HEADER_SUFFIX, "r") as infile:
+        header = json.load(infile)
+    dtype = get_record_dtype(header["numberOfGpus"])
+    count = os.path.getsize(path) // dtype.itemsize
+    if not count:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count, ))
+
+
+def load_history(folder: str, since: Optional[int] = None, until: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    All recorded samples with ``since <= timestamp < until`` as one array per metric. Metrics missing from a
+    segment (e.g. a GPU added later) are NaN for that segment.
+    """
+    segments = []
+    for path in get_segment_paths(folder):
+        try:
+            segment = open_segment(path)
+        except (OSError, ValueError, KeyError) as e:
+            LOGGER.error("Skipping segment %s: %s", path, e)
+            continue
+        if segment is None:
+            continue
+        timestamps = segment["timestamp"]
+        start = 0 if since is None else np.searchsorted(timestamps, since, side="left")
+        end = len(segment) if until is None else np.searchsorted(timestamps, until, side="left")
+        if end > start:
+            segments.append(segment[start:end])
+
+    names: List[str] = []
+    for segment in segments:
+        names.extend(name for name in segment.dtype.names if name not in names)
+    history: Dict[str, np.ndarray] = {}
+    for name in names:
+        dtype = np.int64 if name == "timestamp" else np.float32
+        parts = [
+            np.asarray(segment[name], dtype=dtype) if name in segment.dtype.names else np.full(
+                len(segment), np.nan, dtype=dtype) for segment in segments
+        ]
+        history[name] = np.concatenate(parts)
+    return history
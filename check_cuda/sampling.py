@@ -0,0 +1,135 @@
+import logging
+from typing import Dict, Optional
+
+from .models import SamplingConfig, SystemStatus
+
+LOGGER = logging.getLogger(__name__)
+
+# Counters compared between two samples to detect fast changes
+FAST_COUNTERS = ("utilization_gpu", "utilization_enc", "utilization_dec")
+
+
+class AdaptiveInterval:
+    """
+    Pick the time to the next sample from the last samples.
+
+    - hot (a utilization at or above utilization_threshold, or memory above memory_threshold_percent) or fast
+      changing (a utilization step of utilization_step, a memory step of memory_step_mib): min_interval_sec
+    - flat for idle_samples samples in a row: grow by backoff_factor up to max_interval_sec
+    - anything in between: interval_sec
+
+    get_interval() keeps the time spent sampling under overhead_budget of the wall time. Full samples (processes
+    included) and fast samples (counters only) are averaged apart: a fast sample costs a fraction of a full one, and
+    a mixed average would keep the fast rate from ever engaging. Full samples are taken at least interval_sec apart
+    and get the budget first, fast samples between them only get what the full ones leave over.
+    """
+
+    # Weight of the newest sample in the sampling time averages
+    COST_WEIGHT = 0.2
+    # Timers wake up a little early, a sample this much before the full one is due is still the full one
+    FULL_SAMPLE_SLACK_SEC = 0.005
+
+    def __init__(self, config: SamplingConfig) -> None:
+        self.config = config
+        self.interval_sec = config.interval_sec
+        self.full_cost_sec = 0.0
+        self.fast_cost_sec = 0.0
+        self.__flat_samples = 0
+        self.__previous: Dict[int, tuple] = {}
+
+    def __is_hot(self, system_status: SystemStatus) -> bool:
+        for gpu in system_status.gpus:
+            if gpu.is_stale:
+                continue
+            for name in FAST_COUNTERS:
+                value = getattr(gpu, name)
+                if value is not None and value >= self.config.utilization_threshold:
+                    return True
+            if gpu.memory_used is not None and gpu.memory_total:
+                if gpu.memory_used * 100.0 / gpu.memory_total >= self.config.memory_threshold_percent:
+                    return True
+        return False
+
+    def __get_change(self, system_status: SystemStatus) -> float:
+        """
+        Largest change since the previous sample as a fraction of its step, >= 1.0 is fast
+        """
+        change = 0.0
+        current: Dict[int, tuple] = {}
+        for gpu in system_status.gpus:
+            if gpu.is_stale:
+                continue
+            values = tuple(getattr(gpu, name) for name in FAST_COUNTERS) + (gpu.memory_used, )
+            current[gpu.index] = values
+            previous = self.__previous.get(gpu.index)
+            if previous is None:
+                continue
+            steps = (self.config.utilization_step, ) * len(FAST_COUNTERS) + (self.config.memory_step_mib, )
+            for old, new, step in zip(previous, values, steps):
+                if old is not None and new is not None and step:
+                    change = max(change, abs(new - old) / step)
+        self.__previous = current
+        return change
+
+    def __get_average(self, average: float, cost_sec: float) -> float:
+        return cost_sec if not average else self.COST_WEIGHT * cost_sec + (1 - self.COST_WEIGHT) * average
+
+    def update(self, system_status: SystemStatus, cost_sec: Optional[float] = None, is_full: bool = True) -> float:
+        """
+        Account a sample which took ``cost_sec`` seconds to take, returns the interval to the next one before the
+        overhead budget is applied
+        """
+        if cost_sec is not None:
+            if is_full:
+                self.full_cost_sec = self.__get_average(self.full_cost_sec, cost_sec)
+            else:
+                self.fast_cost_sec = self.__get_average(self.fast_cost_sec, cost_sec)
+        config = self.config
+        change = self.__get_change(system_status)
+        if change >= 1.0 or self.__is_hot(system_status):
+            self.__flat_samples = 0
+            interval = config.min_interval_sec
+        elif change >= 0.5:
+            self.__flat_samples = 0
+            interval = config.interval_sec
+        else:
+            self.__flat_samples += 1
+            interval = max(self.interval_sec, config.interval_sec)
+            if self.__flat_samples >= config.idle_samples:
+                self.__flat_samples = 0
+                interval = min(interval * config.backoff_factor, config.max_interval_sec)
+        if interval != self.interval_sec:
+            LOGGER.debug("Sampling interval %.2f s -> %.2f s", self.interval_sec, interval)
+        self.interval_sec = interval
+        return interval
+
+    def get_interval(self, is_full: bool) -> float:
+        """
+        Interval to the next sample when it is a full one or a fast one, with the overhead budget applied
+        """
+        budget = self.config.overhead_budget
+        if budget <= 0:
+            return self.interval_sec
+        full_interval = self.full_cost_sec / budget
+        if is_full:
+            return max(self.interval_sec, full_interval)
+        # Share of the wall time the full samples take
+        full_share = self.full_cost_sec / max(self.config.interval_sec, full_interval)
+        if full_share >= budget:
+            # Nothing left for fast samples, wait for the next full one
+            return max(self.interval_sec, self.config.interval_sec, full_interval)
+        return max(self.interval_sec, self.fast_cost_sec / (budget - full_share))
+
+    def is_full_due(self, since_full_sec: float) -> bool:
+        """
+        Whether a sample ``since_full_sec`` after the last full one is a full one
+        """
+        return since_full_sec >= self.config.interval_sec - self.FULL_SAMPLE_SLACK_SEC
+
+    def get_next_interval(self, since_full_sec: float) -> float:
+        """
+        Interval to the next sample ``since_full_sec`` after the last full one: fast ones until the next full one is
+        due, which is not delayed by them
+        """
+        until_full = max(self.config.interval_sec, self.get_interval(is_full=True)) - since_full_sec
+        return max(min(self.get_interval(is_full=False), until_full), 0.0)
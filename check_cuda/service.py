@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, List, Optional
+
+from .log_cpu_gpu_usage import LogCpuGpuUsage
+from .pipeline import SampleSink
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CheckCudaService:
+    """
+    Run the sampler and any number of coroutines (exporters, servers, RPC clients) on one asyncio event loop.
+
+    Blocking NVML / psutil calls and the sinks run in a small thread pool, the loop itself only schedules them.
+    stop() may be called from any thread or a signal handler, run() then cancels the coroutines, closes the sinks
+    and returns.
+
+    Components which block on sockets or NVML keep their own threads next to the loop, see ServiceConfig.
+    """
+
+    def __init__(self, usage: Optional[LogCpuGpuUsage] = None, executor_workers: int = 4) -> None:
+        self.usage = usage or LogCpuGpuUsage()
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="check_cuda")
+        self.__task_factories: List[Callable[[], Awaitable[Any]]] = []
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__is_stop: Optional[asyncio.Event] = None
+        self.__is_stop_requested = False
+
+    def add_sink(self, sink: SampleSink) -> None:
+        self.usage.add_sink(sink)
+
+    def add_task(self, factory: Callable[[], Awaitable[Any]]) -> None:
+        """
+        ``factory()`` is awaited next to the sampler once run() starts and cancelled on stop
+        """
+        self.__task_factories.append(factory)
+
+    async def run_blocking(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def __sample_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        obj = await self.run_blocking(self.usage.start_log)
+        is_full = True
+        try:
+            while True:
+                start = loop.time()
+                await self.run_blocking(self.usage.process_sample, obj, is_full)
+                try:
+                    await asyncio.wait_for(self.__is_stop.wait(),
+                                           max(self.usage.get_interval() - (loop.time() - start), 0.0))
+                    break
+                except asyncio.TimeoutError:
+                    pass
+                obj, is_full = await self.run_blocking(self.usage.take_sample)
+        finally:
+            await self.run_blocking(self.usage.finish_log)
+
+    @staticmethod
+    def __on_task_done(task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            LOGGER.error("Service task failed", exc_info=task.exception())
+
+    async def run(self) -> None:
+        self.__loop = asyncio.get_running_loop()
+        self.__is_stop = asyncio.Event()
+        if self.__is_stop_requested:
+            self.__is_stop.set()
+        sampler = asyncio.ensure_future(self.__sample_forever())
+        # Without a sampler there is nothing left to serve
+        sampler.add_done_callback(lambda _: self.__is_stop.set())
+        tasks = [asyncio.ensure_future(factory()) for factory in self.__task_factories]
+        for task in tasks:
+            task.add_done_callback(self.__on_task_done)
+        try:
+            await self.__is_stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # The sampler finishes its current sample and closes the sinks
+            self.__is_stop.set()
+            try:
+                await sampler
+            except Exception as e:
+                LOGGER.exception(e)
+            self.executor.shutdown(wait=True)
+
+    def stop(self) -> None:
+        self.__is_stop_requested = True
+        loop = self.__loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.__is_stop.set)
@@ -0,0 +1,252 @@
+"""
+Delta encoded SystemStatus streams.
+
+The first message of a stream, and every ``full_every``-th one after it, is a full snapshot::
+
+    {"type": "full", "seq": 0, "timestamp": 1700000000000, "status": {<SystemStatus.to_dict()>}}
+
+The others only carry what changed since the last message, in the same camelCase keys::
+
+    {"type": "delta", "seq": 1, "timestamp": 1700000001000,
+     "cpu": {"cpuPercent": 12.5},
+     "gpus": {"0": {"utilizationGpu": 80}},
+     "processes": {"1234:0": {"cpuPercent": 3.0}},
+     "removedGpus": ["1"], "removedProcesses": ["4321:0"]}
+
+GPUs are keyed by index and processes by ``<pid>:<gpu_id>``. A new GPU or process is sent with all of its fields.
+A numeric field is only sent when it moved by at least its deadband since the value last sent, so slow drifts are
+still sent once they add up. A delta without any changes is a heartbeat: it tells the receiver the sender is alive.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from . import codec
+from .models import CpuStatus, GpuStatus, ProcessStatus, SystemStatus
+from .utils import get_current_time
+
+# attribute name -> smallest change which is sent
+DEFAULT_DEADBANDS: Dict[str, float] = {
+    "cpu_percent": 1.0,
+    "cpu_memory_usage_percent": 0.5,
+    "temperature": 1.0,
+    "fan_speed": 1.0,
+    "utilization_gpu": 1.0,
+    "utilization_enc": 1.0,
+    "utilization_dec": 1.0,
+    "power_draw": 2,    # W
+    "memory_used": 16,    # MiB
+    "cpu_memory_usage_mib": 16,
+    "gpu_memory_usage_mib": 16,
+}
+
+
+def get_process_key(process: Dict[str, Any]) -> str:
+    return f"{process.get('pid')}:{process.get('gpuId')}"
+
+
+def _get_key_deadbands(deadbands: Dict[str, float]) -> Dict[str, float]:
+    """
+    Deadbands by attribute name -> deadbands by JSON key
+    """
+    keys: Dict[str, str] = {}
+    for cls in (CpuStatus, GpuStatus, ProcessStatus):
+        keys.update(codec.get_field_keys(cls))
+    return {keys.get(name, name): band for name, band in deadbands.items()}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_heartbeat(message: Dict[str, Any]) -> bool:
+    """
+    A delta without any changes
+    """
+    return message["type"] == "delta" and len(message) == 3
+
+
+class DeltaEncoder:
+    """
+    Turn consecutive SystemStatus samples into full / delta messages, see the module documentation
+    """
+
+    def __init__(self, deadbands: Optional[Dict[str, float]] = None, full_every: int = 300) -> None:
+        self.full_every = full_every
+        self.__deadbands = _get_key_deadbands(DEFAULT_DEADBANDS if deadbands is None else deadbands)
+        self.__seq = 0
+        self.__since_full = 0
+        self.__is_full_needed = True
+        # What the receiver currently has
+        self.__cpu: Dict[str, Any] = {}
+        self.__gpus: Dict[str, Dict[str, Any]] = {}
+        self.__processes: Dict[str, Dict[str, Any]] = {}
+
+    def reset(self) -> None:
+        """
+        Send a full snapshot next, e.g. after a subscriber (re)connected
+        """
+        self.__is_full_needed = True
+
+    def __get_changes(self, sent: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+        changes = {}
+        for key, value in current.items():
+            previous = sent.get(key)
+            if value == previous:
+                continue
+            if _is_number(value) and _is_number(previous) and abs(value - previous) < self.__deadbands.get(key, 0):
+                continue
+            changes[key] = value
+            sent[key] = value
+        return changes
+
+    def __get_item_changes(self, sent_items: Dict[str, Dict[str, Any]],
+                           current_items: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        changes = {}
+        for key, current in current_items.items():
+            sent = sent_items.get(key)
+            if sent is None:
+                sent_items[key] = dict(current)
+                changes[key] = current
+                continue
+            item_changes = self.__get_changes(sent, current)
+            if item_changes:
+                changes[key] = item_changes
+        return changes
+
+    def encode(self, timestamp: int, system_status: SystemStatus) -> Optional[Dict[str, Any]]:
+        """
+        Message for ``system_status``, None when nothing changed beyond the deadbands
+        """
+        status = codec.to_dict(system_status)
+        gpus = {str(gpu["index"]): gpu for gpu in status["gpus"]}
+        processes = {get_process_key(process): process for process in status["processes"]}
+        if self.__is_full_needed or (self.full_every and self.__since_full >= self.full_every):
+            self.__is_full_needed = False
+            self.__since_full = 0
+            self.__cpu = dict(status["cpu"] or {})
+            self.__gpus = {key: dict(gpu) for key, gpu in gpus.items()}
+            self.__processes = {key: dict(process) for key, process in processes.items()}
+            message = {"type": "full", "seq": self.__seq, "timestamp": timestamp, "status": status}
+        else:
+            message = {"type": "delta", "seq": self.__seq, "timestamp": timestamp}
+            cpu = self.__get_changes(self.__cpu, status["cpu"] or {})
+            if cpu:
+                message["cpu"] = cpu
+            for name, removed_name, sent_items, current_items in (("gpus", "removedGpus", self.__gpus, gpus),
+                                                                  ("processes", "removedProcesses",
+                                                                   self.__processes, processes)):
+                changes = self.__get_item_changes(sent_items, current_items)
+                if changes:
+                    message[name] = changes
+                removed = [key for key in sent_items if key not in current_items]
+                if removed:
+                    message[removed_name] = removed
+                    for key in removed:
+                        del sent_items[key]
+            if len(message) == 3:
+                return None
+        self.__seq += 1
+        self.__since_full += 1
+        return message
+
+    def heartbeat(self, timestamp: int) -> Optional[Dict[str, Any]]:
+        """
+        Empty delta for when nothing changed for a while, None when a full snapshot has to be sent first
+        """
+        if self.__is_full_needed:
+            return None
+        message = {"type": "delta", "seq": self.__seq, "timestamp": timestamp}
+        self.__seq += 1
+        self.__since_full += 1
+        return message
+
+
+class DeltaDecoder:
+    """
+    Rebuild SystemStatus objects from the messages of a DeltaEncoder. With ``as_records`` they are built as
+    codec.SystemStatusRecord, for receivers which keep a snapshot per sender.
+    """
+
+    def __init__(self, as_records: bool = False) -> None:
+        self.as_records = as_records
+        self.__cpu: Optional[Dict[str, Any]] = None
+        self.__gpus: Dict[str, Dict[str, Any]] = {}
+        self.__processes: Dict[str, Dict[str, Any]] = {}
+        self.__next_seq: Optional[int] = None
+
+    def apply(self, message: Dict[str, Any]) -> SystemStatus:
+        """
+        Raises ValueError for a delta which does not follow the previous message, the stream has to restart
+        from a full snapshot then
+        """
+        if message["type"] == "full":
+            status = message["status"]
+            self.__cpu = dict(status["cpu"]) if status["cpu"] is not None else None
+            self.__gpus = {str(gpu["index"]): dict(gpu) for gpu in status["gpus"]}
+            self.__processes = {get_process_key(process): dict(process) for process in status["processes"]}
+        else:
+            if self.__next_seq is None or message["seq"] != self.__next_seq:
+                raise ValueError(f"Expected message {self.__next_seq}, got {message['seq']}")
+            if "cpu" in message:
+                self.__cpu = dict(self.__cpu or {}, **message["cpu"])
+            for name, removed_name, items in (("gpus", "removedGpus", self.__gpus),
+                                              ("processes", "removedProcesses", self.__processes)):
+                for key, changes in message.get(name, {}).items():
+                    items.setdefault(key, {}).update(changes)
+                for key in message.get(removed_name, ()):
+                    items.pop(key, None)
+        self.__next_seq = message["seq"] + 1
+        return self.get_system_status()
+
+    def get_system_status(self) -> SystemStatus:
+        status_codec = codec.get_codec(SystemStatus)
+        from_dict = status_codec.record_from_dict if self.as_records else status_codec.from_dict
+        return from_dict({
+            "cpu": self.__cpu,
+            "gpus": list(self.__gpus.values()),
+            "processes": list(self.__processes.values())
+        })
+
+
+def _get_default_status() -> SystemStatus:
+    from .controllers import get_system_status
+    return get_system_status()
+
+
+def stream_system_status(interval_sec: float = 1.0,
+                         deadbands: Optional[Dict[str, float]] = None,
+                         full_every: int = 300,
+                         get_status: Optional[Callable[[], SystemStatus]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Sample every ``interval_sec`` seconds and yield the messages of a DeltaEncoder, forever
+    """
+    encoder = DeltaEncoder(deadbands, full_every)
+    get_status = get_status or _get_default_status
+    while True:
+        start = time.monotonic()
+        message = encoder.encode(get_current_time(), get_status())
+        if message is not None:
+            yield message
+        time.sleep(max(interval_sec - (time.monotonic() - start), 0.0))
+
+
+async def astream_system_status(interval_sec: float = 1.0,
+                                deadbands: Optional[Dict[str, float]] = None,
+                                full_every: int = 300,
+                                get_status: Optional[Callable[[], SystemStatus]] = None
+                                ) -> AsyncIterator[Dict[str, Any]]:
+    """
+    stream_system_status() as an async iterator, the blocking sampling runs in the default executor
+    """
+    encoder = DeltaEncoder(deadbands, full_every)
+    get_status = get_status or _get_default_status
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        system_status = await loop.run_in_executor(None, get_status)
+        message = encoder.encode(get_current_time(), system_status)
+        if message is not None:
+            yield message
+        await asyncio.sleep(max(interval_sec - (loop.time() - start), 0.0))
+
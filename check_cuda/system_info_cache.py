@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import platform
+from threading import Lock, Thread
+from typing import Any, Dict, Optional, Tuple
+
+from singleton_decorator.decorator import singleton
+
+from . import controllers
+from .models import SystemInfo
+from .utils import get_session_folder
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_FILE_NAME = "system_info.json"
+BOOT_ID_FILE_NAME = "/proc/sys/kernel/random/boot_id"
+
+
+def get_boot_id() -> str:
+    try:
+        with open(BOOT_ID_FILE_NAME) as f:
+            return f.read().strip()
+    except OSError:
+        import psutil
+        return str(int(psutil.boot_time()))
+
+
+def get_system_info_key() -> Dict[str, Any]:
+    """
+    What the static system info depends on: a reboot, a driver update or a changed set of GPUs invalidate it
+    """
+    nvml = controllers.GpuInfoFromNvml()
+    return {
+        "hostName": platform.uname().node,
+        "bootId": get_boot_id(),
+        "driverVersion": nvml.get_driver_version(),
+        "gpuUuids": sorted(device.uuid or "" for device in nvml.get_devices()),
+    }
+
+
+@singleton
+class SystemInfoCache:
+    """
+    controllers.get_system_info() once per boot, driver and set of GPUs.
+
+    get_cpu() runs cpuinfo, which spawns subprocesses and takes seconds. The result is kept in
+    ``<session>/system_info.json`` with the key of get_system_info_key(), so a restart on the same host only
+    reads the file. When the key changed, the GPUs are read from NVML right away and the CPU info of the old file
+    is used until a background refresh has rewritten the file. Without a file the info is taken synchronously.
+
+    free_memory_mib of the GPUs is the one of the time the file was written.
+    """
+
+    def __init__(self, file_name: Optional[str] = None) -> None:
+        self.file_name = file_name or os.path.join(get_session_folder(), CACHE_FILE_NAME)
+        self.__lock = Lock()
+        self.__system_info: Optional[SystemInfo] = None
+        self.__refresh: Optional[Thread] = None
+
+    def __load(self) -> Optional[Tuple[Dict[str, Any], SystemInfo]]:
+        try:
+            with open(self.file_name) as f:
+                data = json.load(f)
+            return data["key"], SystemInfo.from_dict(data["systemInfo"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            LOGGER.warning("Ignoring system info cache %s: %s", self.file_name, e)
+            return None
+
+    def __save(self, key: Dict[str, Any], system_info: SystemInfo) -> None:
+        temp_file_name = self.file_name + ".tmp"
+        try:
+            with open(temp_file_name, "w") as f:
+                json.dump({"key": key, "systemInfo": system_info.to_dict()}, f)
+            os.replace(temp_file_name, self.file_name)
+        except OSError as e:
+            LOGGER.error("Can not write system info cache %s: %s", self.file_name, e)
+
+    def __refresh_in_background(self, key: Dict[str, Any]) -> None:
+        try:
+            system_info = controllers.get_system_info()
+        except Exception as e:
+            LOGGER.exception(e)
+            return
+        self.__save(key, system_info)
+        with self.__lock:
+            self.__system_info = system_info
+        LOGGER.info("System info cache refreshed")
+
+    def get(self) -> SystemInfo:
+        with self.__lock:
+            if self.__system_info is not None:
+                return self.__system_info
+            key = get_system_info_key()
+            cached = self.__load()
+            if cached is not None and cached[0] == key:
+                self.__system_info = cached[1]
+            elif cached is not None:
+                LOGGER.info("System info cache is out of date, refreshing it in the background")
+                self.__system_info = SystemInfo(host_name=key["hostName"],
+                                                os=platform.platform(),
+                                                cpu=cached[1].cpu,
+                                                gpus=controllers.get_gpu_info())
+                self.__refresh = Thread(target=self.__refresh_in_background,
+                                        args=(key, ),
+                                        name="system_info",
+                                        daemon=True)
+                self.__refresh.start()
+            else:
+                self.__system_info = controllers.get_system_info()
+                self.__save(key, self.__system_info)
+            return self.__system_info
+
+    def wait_refresh(self, timeout: Optional[float] = None) -> None:
+        refresh = self.__refresh
+        if refresh is not None:
+            refresh.join(timeout)
+
+    def invalidate(self) -> None:
+        """
+        Forget the info of this process and the file, the next get() takes it again
+        """
+        with self.__lock:
+            self.__system_info = None
+            try:
+                os.remove(self.file_name)
+            except FileNotFoundError:
+                pass
+
+
+def get_system_info() -> SystemInfo:
+    return SystemInfoCache().get()
@@ -0,0 +1,144 @@
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .models import SystemStatus
+from .pipeline import SampleSink
+
+LOGGER = logging.getLogger(__name__)
+
+GPU_METRICS = ("utilization_gpu", "utilization_enc", "utilization_dec", "memory_used", "temperature", "power_draw")
+
+
+class WindowAggregate(NamedTuple):
+    mean: float
+    p95: float
+    max: float
+    count: int
+
+
+class RingBuffer:
+    """
+    Fixed size, preallocated buffer of (timestamp, value) pairs. Missing values are stored as NaN.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.__timestamps = np.zeros(capacity, dtype=np.int64)
+        self.__values = np.full(capacity, np.nan, dtype=np.float64)
+        self.__next = 0
+        self.__count = 0
+
+    def append(self, timestamp: int, value: Optional[float]) -> None:
+        self.__timestamps[self.__next] = timestamp
+        self.__values[self.__next] = np.nan if value is None else value
+        self.__next = (self.__next + 1) % self.capacity
+        if self.__count < self.capacity:
+            self.__count += 1
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """
+        Append many pairs at once, only the newest ``capacity`` are kept
+        """
+        timestamps = timestamps[-self.capacity:]
+        values = values[-self.capacity:]
+        count = len(timestamps)
+        first = min(count, self.capacity - self.__next)
+        self.__timestamps[self.__next:self.__next + first] = timestamps[:first]
+        self.__values[self.__next:self.__next + first] = values[:first]
+        self.__timestamps[:count - first] = timestamps[first:]
+        self.__values[:count - first] = values[first:]
+        self.__next = (self.__next + count) % self.capacity
+        self.__count = min(self.__count + count, self.capacity)
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def get_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Timestamps and values, oldest first
+        """
+        if self.__count < self.capacity:
+            return self.__timestamps[:self.__count].copy(), self.__values[:self.__count].copy()
+        return np.roll(self.__timestamps, -self.__next), np.roll(self.__values, -self.__next)
+
+    def get_window(self, since: int) -> np.ndarray:
+        """
+        Values with a timestamp >= ``since``
+        """
+        timestamps, values = self.get_arrays()
+        return values[np.searchsorted(timestamps, since, side="left"):]
+
+    def aggregate(self, since: int) -> Optional[WindowAggregate]:
+        values = self.get_window(since)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return None
+        return WindowAggregate(float(values.mean()), float(np.percentile(values, 95)), float(values.max()),
+                               len(values))
+
+
+class SystemStatusStore(SampleSink):
+    """
+    In memory history of SystemStatus samples, one RingBuffer per metric.
+
+    Metric names are ``cpu.cpu_percent``, ``cpu.cpu_memory_usage_percent`` and ``gpu<index>.<metric>`` for every
+    metric in GPU_METRICS. Driver sample buffers (see gpu_samples.GpuSampleReader) are kept as
+    ``gpu<index>.<metric>.hires``. Memory use is bounded by ``capacity`` samples per metric.
+    """
+
+    def __init__(self, capacity: int = 3600) -> None:
+        self.capacity = capacity
+        self.__buffers: Dict[str, RingBuffer] = {}
+        self.__lock = threading.Lock()
+        self.__last_timestamp = 0
+
+    def __get_buffer(self, metric: str) -> RingBuffer:
+        buffer = self.__buffers.get(metric)
+        if buffer is None:
+            buffer = RingBuffer(self.capacity)
+            self.__buffers[metric] = buffer
+        return buffer
+
+    def on_sample(self, timestamp: int, system_status: SystemStatus) -> None:
+        self.append(timestamp, system_status)
+
+    def append(self, timestamp: int, system_status: SystemStatus) -> None:
+        with self.__lock:
+            self.__last_timestamp = timestamp
+            self.__get_buffer("cpu.cpu_percent").append(timestamp, system_status.cpu.cpu_percent)
+            self.__get_buffer("cpu.cpu_memory_usage_percent").append(timestamp,
+                                                                     system_status.cpu.cpu_memory_usage_percent)
+            for gpu in system_status.gpus:
+                if gpu.is_stale:
+                    continue
+                for metric in GPU_METRICS:
+                    self.__get_buffer(f"gpu{gpu.index}.{metric}").append(timestamp, getattr(gpu, metric))
+
+    def on_gpu_samples(self, gpu_index: int, samples: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> None:
+        with self.__lock:
+            for metric, (timestamps, values) in samples.items():
+                if len(timestamps):
+                    self.__get_buffer(f"gpu{gpu_index}.{metric}.hires").extend(timestamps, values)
+                    self.__last_timestamp = max(self.__last_timestamp, int(timestamps[-1]))
+
+    def get_metrics(self) -> List[str]:
+        with self.__lock:
+            return list(self.__buffers.keys())
+
+    def get_arrays(self, metric: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        with self.__lock:
+            buffer = self.__buffers.get(metric)
+            return buffer.get_arrays() if buffer is not None else None
+
+    def aggregate(self, metric: str, seconds: float) -> Optional[WindowAggregate]:
+        """
+        mean / p95 / max of ``metric`` over the last ``seconds`` seconds
+        """
+        with self.__lock:
+            buffer = self.__buffers.get(metric)
+            if buffer is None:
+                return None
+            return buffer.aggregate(self.__last_timestamp - int(seconds * 1000))
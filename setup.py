@@ -43,6 +43,6 @@ setup(
     package_data={'': ['*.yaml', 'VERSION']},
     entry_points={
         'console_scripts': [
-            'check_cuda = check_cuda.main:main',
+            'check_cuda = check_cuda.cli:main',
         ],
     })
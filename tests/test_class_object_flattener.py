@@ -0,0 +1,70 @@
+import collections
+
+from check_cuda import class_object_flattener
+from check_cuda.class_object_flattener import (get_flatten_columns, get_flatten_keys, get_flatten_values_list,
+                                               get_flatten_values_list_fast)
+from check_cuda.models import CpuStatus, GpuStatus, ProcessStatus, SystemStatus
+
+
+def get_slow_values(obj, ignore_list=()):
+    return get_flatten_values_list(obj, get_flatten_keys(obj), list(ignore_list))
+
+
+def get_system_status(full_commands):
+    return SystemStatus(cpu=CpuStatus(cpu_percent=10.0, cpu_memory_usage_percent=20.0),
+                        gpus=[GpuStatus(index=0, uuid="GPU-0", utilization_gpu=50)],
+                        processes=[
+                            ProcessStatus(pid=100 + i, command="python3", full_command=full_command, gpu_id=0)
+                            for i, full_command in enumerate(full_commands)
+                        ])
+
+
+def test_fast_values_match_slow_values():
+    for full_commands in ([None], [["python3", "a.py"]], [None, ["python3"]], [["python3"], None], []):
+        obj = get_system_status(full_commands)
+        assert get_flatten_values_list_fast(obj) == get_slow_values(obj)
+
+
+def test_plan_follows_non_dataclass_fields():
+    # Same number of processes, but None flattens to one key and a list of strings to none
+    first = get_system_status([None, None])
+    second = get_system_status([["python3", "a.py"], None])
+    third = get_system_status([["python3", "b.py", "--x"], ["python3"]])
+    for obj in (first, second, third, first):
+        assert get_flatten_values_list_fast(obj) == get_slow_values(obj)
+    assert len(get_flatten_values_list_fast(first)) == len(get_slow_values(second)) + 1
+
+
+def test_plan_follows_mapping_fields():
+    first = get_system_status([{"argv": ["x"], "cwd": "/"}])
+    second = get_system_status([{"cwd": "/"}])
+    for obj in (first, second):
+        assert get_flatten_values_list_fast(obj) == get_slow_values(obj)
+
+
+def test_ignore_list():
+    obj = get_system_status([None])
+    ignore_list = ["cpu.cpu_percent", "processes.#0.full_command"]
+    assert get_flatten_values_list_fast(obj, ignore_list) == get_slow_values(obj, ignore_list)
+
+
+def test_columns_align_across_shapes():
+    objs = [get_system_status([None]), get_system_status([["python3"]])]
+    columns = get_flatten_columns(objs)
+    assert all(len(column) == 2 for column in columns.values())
+    # Only the first sample has the key, the second has no value for it
+    assert "processes.#0.full_command" in columns
+    assert list(columns["processes.#0.pid"]) == [100.0, 100.0]
+
+
+def test_plan_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(class_object_flattener, "MAX_PLANS", 4)
+    monkeypatch.setattr(class_object_flattener, "_PLANS", collections.OrderedDict())
+    recent = get_system_status([None])
+    for count in range(1, 10):
+        get_flatten_values_list_fast(recent)
+        obj = get_system_status([None] * count)
+        assert get_flatten_values_list_fast(obj) == get_slow_values(obj)
+        assert len(class_object_flattener._PLANS) <= 4
+    # The plan used with every sample is kept
+    assert any(key[1] == class_object_flattener.get_shape(recent) for key in class_object_flattener._PLANS)
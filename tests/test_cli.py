@@ -0,0 +1,22 @@
+import json
+import time
+
+import psutil
+
+from check_cuda import backends, cli, controllers
+
+
+def test_status_measures_the_cpu_over_an_interval(capsys, monkeypatch):
+    backends.use_simulation(backends.Simulation(number_of_gpus=1, seed=1, processes_per_gpu=0))
+    # status creates the NVML singleton, which keeps the device list of this simulation
+    monkeypatch.setattr(controllers.GpuInfoFromNvml, "_instance", None)
+    monkeypatch.setattr(cli, "CPU_SAMPLE_SEC", 0.2)
+    readings = []
+    cpu_percent = psutil.cpu_percent
+    monkeypatch.setattr(psutil, "cpu_percent", lambda: readings.append(time.monotonic()) or cpu_percent())
+    assert cli.main(["status", "--json"]) == 0
+    # A single psutil.cpu_percent() call measures nothing, the reported one is compared with a reading before it
+    assert len(readings) == 2
+    assert readings[1] - readings[0] >= 0.2
+    status = json.loads(capsys.readouterr().out)
+    assert len(status["gpus"]) == 1
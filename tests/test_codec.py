@@ -0,0 +1,57 @@
+import pytest
+
+from check_cuda import codec
+from check_cuda.models import CpuStatus, GpuStatus, ProcessStatus, SystemStatus
+
+CPU = CpuStatus(cpu_percent=12.5, cpu_memory_usage_percent=40.0)
+GPU = GpuStatus(index=1,
+                uuid="GPU-1",
+                name="Tesla T4",
+                temperature=61.0,
+                utilization_gpu=35.5,
+                power_draw=70,
+                memory_used=1024,
+                memory_total=16000)
+PROCESS = ProcessStatus(pid=1234,
+                        command="python",
+                        full_command="python -m check_cuda",
+                        cpu_percent=3.0,
+                        gpu_memory_usage_mib=512,
+                        gpu_id=1,
+                        gpu_sm_percent=20.0)
+SYSTEM = SystemStatus(cpu=CPU, gpus=[GpuStatus(index=0, is_stale=True), GPU], processes=[PROCESS])
+
+
+@pytest.mark.parametrize("obj", [CPU, GPU, PROCESS, SYSTEM, SystemStatus(cpu=CpuStatus())])
+def test_json_is_the_dataclasses_json_one(obj):
+    assert codec.to_json(obj) == obj.to_json()
+    assert codec.to_dict(obj) == obj.to_dict()
+    assert codec.get_codec(type(obj)).from_json(obj.to_json()) == obj
+
+
+@pytest.mark.parametrize("obj", [CPU, GPU, PROCESS, SYSTEM])
+def test_binary_round_trip(obj):
+    data = codec.to_binary(obj)
+    assert len(data) < len(obj.to_json())
+    assert codec.from_binary(type(obj), data) == obj
+
+
+def test_pack_round_trip():
+    value = [None, True, False, 0, 127, -32, -33, 2**32, -2**40, 1.5, "", "x" * 300, b"\x00" * 300, list(range(20)),
+             {"a": {"b": []}}]
+    # Tuples come back as lists
+    assert codec.unpack(codec.pack(value)) == value
+    with pytest.raises(ValueError):
+        codec.unpack(codec.pack(1) + b"\x00")
+
+
+def test_records():
+    record = codec.to_record(SYSTEM)
+    assert type(record) is codec.SystemStatusRecord
+    assert type(record.gpus[1]) is codec.GpuStatusRecord
+    assert not hasattr(record.gpus[1], "__dict__")
+    assert record.gpus[1].utilization_gpu == 35.5
+    # Records encode like the model they mirror
+    assert codec.to_json(record) == SYSTEM.to_json()
+    assert codec.get_codec(SystemStatus).record_from_dict(SYSTEM.to_dict()) == record
+    assert codec.SystemStatusRecord(cpu=codec.CpuStatusRecord()).gpus == []
@@ -0,0 +1,24 @@
+import pytest
+
+from check_cuda import backends
+from check_cuda.controllers import GpuInfoFromNvml
+
+
+@pytest.fixture
+def simulation():
+    # The simulated backend stays installed, no test here talks to a real driver
+    s = backends.Simulation(number_of_gpus=2, seed=1, processes_per_gpu=1)
+    backends.use_simulation(s)
+    return s
+
+
+def test_device_busy_with_an_earlier_poll_is_stale(simulation):
+    nvml = GpuInfoFromNvml.__wrapped__()
+    simulation.hang_sec = 0.8
+    simulation.hung_gpus.add(1)
+    assert [gpu.is_stale for gpu in nvml.get_gpu_status()] == [False, True]
+    # The first poll of GPU 1 finishes while the second one waits, its result is not this poll's
+    simulation.hung_gpus.clear()
+    second = nvml.get_gpu_status()
+    assert [gpu.is_stale for gpu in second] == [False, True]
+    assert {process.gpu_id for process in nvml.get_process_status_running_on_gpus()} == {0}
@@ -0,0 +1,123 @@
+import time
+
+import pytest
+
+from check_cuda import codec
+from check_cuda.fleet import FleetAgent, FleetAggregator, FleetClient
+from check_cuda.models import CpuStatus, GpuStatus, SystemStatus
+
+
+def get_system_status(utilization_gpu=30):
+    return SystemStatus(cpu=CpuStatus(cpu_percent=12.5, cpu_memory_usage_percent=40.0),
+                        gpus=[
+                            GpuStatus(index=0,
+                                      uuid="GPU-0",
+                                      name="Sim",
+                                      utilization_gpu=utilization_gpu,
+                                      memory_used=1000,
+                                      memory_total=16000)
+                        ])
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def get_agent(port, node="node-a", **kwargs):
+    return FleetAgent("127.0.0.1", port, node, retry_min_sec=0.05, retry_max_sec=0.1, timeout_sec=1.0, **kwargs)
+
+
+@pytest.fixture
+def aggregator():
+    a = FleetAggregator("127.0.0.1", 0, stale_after_sec=0.5)
+    a.start()
+    yield a
+    a.stop()
+
+
+def get_utilization(aggregator, node):
+    status = aggregator.get_latest(node)
+    return status.gpus[0].utilization_gpu if status is not None else None
+
+
+def test_hello_full_then_delta(aggregator):
+    agent = get_agent(aggregator.port)
+    try:
+        agent.on_sample(1000, get_system_status(30))
+        assert wait_for(lambda: get_utilization(aggregator, "node-a") == 30)
+        agent.on_sample(2000, get_system_status(80))
+        assert wait_for(lambda: get_utilization(aggregator, "node-a") == 80)
+        assert agent.sent_messages == 2
+        latest = aggregator.get_latest("node-a")
+        assert isinstance(latest, codec.SystemStatusRecord)
+        assert latest.cpu.cpu_percent == 12.5
+        assert latest.gpus[0].memory_total == 16000
+        assert aggregator.get_nodes()[0]["connected"]
+    finally:
+        agent.close()
+    assert wait_for(lambda: not aggregator.get_nodes()[0]["connected"])
+
+
+def test_idle_node_stays_fresh(aggregator):
+    agent = get_agent(aggregator.port, heartbeat_sec=0.1)
+    try:
+        agent.on_sample(1000, get_system_status(30))
+        assert wait_for(lambda: aggregator.get_least_loaded_gpus())
+        # Nothing changes beyond the deadbands for longer than stale_after_sec
+        for timestamp in range(2000, 12000, 1000):
+            agent.on_sample(timestamp, get_system_status(30))
+            time.sleep(0.1)
+        assert [gpu.node for gpu in aggregator.get_least_loaded_gpus()] == ["node-a"]
+        assert aggregator.get_nodes()[0]["ageSec"] < aggregator.stale_after_sec
+        # Heartbeats are not samples
+        assert len(aggregator.get_store("node-a").get_arrays("cpu.cpu_percent")[0]) == 1
+    finally:
+        agent.close()
+
+
+def test_agent_reconnects_to_restarted_aggregator(aggregator):
+    port = aggregator.port
+    agent = get_agent(port)
+    restarted = None
+    try:
+        agent.on_sample(1000, get_system_status(30))
+        assert wait_for(lambda: get_utilization(aggregator, "node-a") == 30)
+        aggregator.stop()
+        restarted = FleetAggregator("127.0.0.1", port)
+        restarted.start()
+
+        def is_resumed():
+            agent.on_sample(int(time.time() * 1000), get_system_status(30))
+            return get_utilization(restarted, "node-a") == 30
+
+        # The restarted aggregator has no state, only a full snapshot can resume the stream
+        assert wait_for(is_resumed)
+    finally:
+        agent.close()
+        if restarted is not None:
+            restarted.stop()
+
+
+def test_least_loaded_query(aggregator):
+    agents = [get_agent(aggregator.port, "node-a"), get_agent(aggregator.port, "node-b")]
+    client = FleetClient("127.0.0.1", aggregator.port, timeout_sec=1.0)
+    try:
+        agents[0].on_sample(1000, get_system_status(70))
+        agents[1].on_sample(1000, get_system_status(20))
+        assert wait_for(lambda: len(aggregator.get_least_loaded_gpus(count=2)) == 2)
+        gpus = client.get_least_loaded_gpus(count=2)
+        assert [gpu.node for gpu in gpus] == ["node-b", "node-a"]
+        assert gpus[0].load == pytest.approx(0.2)
+        assert gpus[0].memory_free_mib == 15000
+        assert sorted(node["node"] for node in client.get_nodes()) == ["node-a", "node-b"]
+        with pytest.raises(ValueError):
+            client.query("unknown")
+    finally:
+        client.close()
+        for agent in agents:
+            agent.close()
@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from check_cuda.influx_exporter import InfluxExporter, format_event_line, format_line_protocol
+from check_cuda.models import CpuStatus, GpuEvent, GpuStatus, InfluxExporterConfig, SystemStatus
+
+
+class LineProtocolServer:
+    """
+    Stand-in for the InfluxDB 1.x HTTP API: records the written lines and answers with ``statuses`` in turn,
+    204 once they are used up
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.queries = []
+        self.statuses = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                url = urllib.parse.urlsplit(self.path)
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+                with server.lock:
+                    status = server.statuses.pop(0) if server.statuses else 204
+                    if status == 204:
+                        if url.path == "/write":
+                            server.lines.extend(body.splitlines())
+                        else:
+                            server.queries.append(urllib.parse.parse_qs(url.query)["q"][0])
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def get_lines(self):
+        with self.lock:
+            return list(self.lines)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    s = LineProtocolServer()
+    yield s
+    s.close()
+
+
+def get_config(url, **kwargs):
+    return InfluxExporterConfig(enabled=True,
+                                url=url,
+                                batch_size=kwargs.pop("batch_size", 10),
+                                flush_interval_sec=kwargs.pop("flush_interval_sec", 0.05),
+                                timeout_sec=1.0,
+                                retry_min_sec=0.05,
+                                retry_max_sec=0.1,
+                                **kwargs)
+
+
+def get_system_status(uuid="GPU-1"):
+    return SystemStatus(cpu=CpuStatus(cpu_percent=12.5, cpu_memory_usage_percent=40.0),
+                        gpus=[GpuStatus(index=0, uuid=uuid, name="Sim", utilization_gpu=30, memory_total=16000)])
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def get_spool_files(folder):
+    return [name for name in os.listdir(folder) if name.endswith(".lp")]
+
+
+def test_format_omits_missing_uuid():
+    lines = format_line_protocol("cpu_gpu", "host a", 1000, get_system_status(uuid=None))
+    assert lines[0] == "cpu_gpu,host=host\\ a cpu_percent=12.5,cpu_memory_usage_percent=40.0 1000"
+    assert lines[1] == "cpu_gpu_gpu,host=host\\ a,gpu=0 utilization_gpu=30.0,memory_total=16000.0 1000"
+    event = GpuEvent(timestamp=1000, gpu_index=0, event_type="xid", data=79)
+    line = format_event_line("cpu_gpu", "h", event)
+    assert line == 'cpu_gpu_event,host=h,gpu=0,type=xid data=79i,description="" 1000'
+
+
+def test_points_are_written_in_batches(server, tmp_path):
+    exporter = InfluxExporter(get_config(server.url), "node1", str(tmp_path))
+    for timestamp in range(5):
+        exporter.on_sample(timestamp, get_system_status())
+    exporter.close()
+    lines = server.get_lines()
+    assert len(lines) == 10
+    assert lines[1] == "cpu_gpu_gpu,host=node1,gpu=0,uuid=GPU-1 utilization_gpu=30.0,memory_total=16000.0 0"
+    assert server.queries == ['CREATE DATABASE "check_cuda"']
+    assert exporter.sent_points == 10
+    assert not get_spool_files(tmp_path)
+
+
+def test_client_error_drops_the_batch(server, tmp_path):
+    server.statuses = [204, 400]    # CREATE DATABASE, first write
+    exporter = InfluxExporter(get_config(server.url, batch_size=2), "node1", str(tmp_path))
+    exporter.on_sample(0, get_system_status())
+    assert wait_for(lambda: exporter.rejected_points == 2)
+    exporter.on_sample(1, get_system_status())
+    exporter.close()
+    assert exporter.rejected_points == 2
+    assert [line.rsplit(" ", 1)[1] for line in server.get_lines()] == ["1", "1"]
+    assert not get_spool_files(tmp_path)
+
+
+def test_server_error_is_spooled_and_resent(server, tmp_path):
+    server.statuses = [204, 503, 503]
+    exporter = InfluxExporter(get_config(server.url, batch_size=2), "node1", str(tmp_path))
+    exporter.on_sample(0, get_system_status())
+    # The spool is drained before the next batch is sent
+    timestamp = 0
+    while timestamp < 100 and "0" not in [line.rsplit(" ", 1)[1] for line in server.get_lines()]:
+        timestamp += 1
+        exporter.on_sample(timestamp, get_system_status())
+        time.sleep(0.05)
+    exporter.close()
+    timestamps = [int(line.rsplit(" ", 1)[1]) for line in server.get_lines()]
+    assert timestamps == sorted(timestamps)
+    assert timestamps == [t for t in range(timestamp + 1) for _ in range(2)]
+    assert exporter.rejected_points == 0
+    assert not get_spool_files(tmp_path)
+
+
+def test_unreachable_server_is_spooled(tmp_path):
+    s = LineProtocolServer()
+    url = s.url
+    s.close()
+    exporter = InfluxExporter(get_config(url, batch_size=2), "node1", str(tmp_path))
+    exporter.on_sample(0, get_system_status())
+    exporter.close()
+    assert exporter.sent_points == 0
+    assert len(get_spool_files(tmp_path)) == 1
@@ -0,0 +1,68 @@
+from check_cuda.models import GpuStatus, NnModelInfo, NnModelMaxChannelInfo
+from check_cuda.placement import PlacementEngine, PlacementPolicy
+
+MODEL = NnModelInfo(75, 416, 416)
+
+
+def get_engine(policy, number_of_gpus=2, max_channel=4):
+    gpus = [GpuStatus(index=i, memory_total=16000, memory_used=1000) for i in range(number_of_gpus)]
+    limits = [NnModelMaxChannelInfo(key=MODEL, max_channel=max_channel, max_memory=8000)]
+    return PlacementEngine(gpus, limits, policy)
+
+
+def place(engine, count):
+    cost = engine.get_cost(MODEL)
+    return [engine.place(cost) for _ in range(count)]
+
+
+def test_least_loaded_alternates():
+    assert place(get_engine(PlacementPolicy.LEAST_LOADED), 4) == [0, 1, 0, 1]
+
+
+def test_best_fit_fills_a_gpu_first():
+    assert place(get_engine(PlacementPolicy.BEST_FIT), 5) == [0, 0, 0, 0, 1]
+
+
+def test_spread_balances_channel_counts():
+    engine = get_engine(PlacementPolicy.SPREAD, number_of_gpus=3)
+    assert sorted(place(engine, 3)) == [0, 1, 2]
+    assert [engine.budgets[i].channels for i in range(3)] == [1, 1, 1]
+
+
+def test_overcommit_and_release():
+    engine = get_engine(PlacementPolicy.LEAST_LOADED, max_channel=1)
+    cost = engine.get_cost(MODEL)
+    assert place(engine, 2) == [0, 1]
+    assert engine.select(cost) is None
+    # Every GPU is full, the least loaded one is overcommitted
+    assert engine.place(cost) == 0
+    assert engine.budgets[0].channels == 2
+    assert engine.place(cost, exclude={0, 1}) == -1
+    engine.release(1, cost)
+    assert engine.select(cost) == 1
+    assert engine.place(cost) == 1
+
+
+def test_exclude():
+    engine = get_engine(PlacementPolicy.LEAST_LOADED, number_of_gpus=3)
+    assert place(engine, 1) == [0]
+    assert engine.place(engine.get_cost(MODEL), exclude={1}) == 2
+
+
+def test_live_utilization_and_memory():
+    engine = get_engine(PlacementPolicy.LEAST_LOADED)
+    cost = engine.get_cost(MODEL)
+    engine.update_gpus([GpuStatus(index=0, utilization_gpu=90, memory_used=1000, memory_total=16000)])
+    assert engine.place(cost) == 1
+    # 90% busy leaves no room for a quarter of the GPU
+    assert engine.select(cost, exclude={1}) is None
+    engine.update_gpus([
+        GpuStatus(index=0, utilization_gpu=10, memory_used=1000, memory_total=16000),
+        GpuStatus(index=1, utilization_gpu=10, memory_used=15000, memory_total=16000)
+    ])
+    # Memory which the channel on GPU 1 did not reserve is in use there
+    assert engine.select(cost, exclude={0}) is None
+    assert engine.place(cost) == 0
+    # A stale GPU keeps its last values
+    engine.update_gpus([GpuStatus(index=1, utilization_gpu=0, memory_used=0, memory_total=16000, is_stale=True)])
+    assert engine.budgets[1].memory_used == 15000
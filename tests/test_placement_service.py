@@ -0,0 +1,95 @@
+import os
+
+from check_cuda import main
+from check_cuda.controllers import ChannelGpuManager
+from check_cuda.models import (CheckCudaConfig, CpuInfo, CpuStatus, GpuStatus, NnModelInfo, PlacementRequest,
+                               SystemInfo, SystemStatus)
+from check_cuda.placement_service import ClusterPlacer
+
+
+class FleetStandIn:
+    """
+    The parts of fleet.FleetAggregator which ClusterPlacer.sync_from_fleet reads, nodes are set by the test
+    """
+
+    def __init__(self, stale_after_sec=15.0):
+        self.stale_after_sec = stale_after_sec
+        self.nodes = {}
+
+    def set_node(self, node, age_sec, connected=True):
+        self.nodes[node] = (age_sec, connected)
+
+    def get_nodes(self):
+        return [{
+            "node": node,
+            "connected": connected,
+            "timestamp": 0,
+            "ageSec": age_sec,
+            "gpus": 1
+        } for node, (age_sec, connected) in self.nodes.items()]
+
+    def get_latest(self, node):
+        return SystemStatus(cpu=CpuStatus(cpu_percent=0.0, cpu_memory_usage_percent=0.0),
+                            gpus=[GpuStatus(index=0, memory_total=16000, memory_used=0)])
+
+
+def get_request(channel_id):
+    return PlacementRequest(channel_id=channel_id, model=NnModelInfo(75, 416, 416), fps=10.0)
+
+
+def test_stale_node_is_suspended_and_keeps_its_channels():
+    fleet = FleetStandIn()
+    placer = ClusterPlacer([])
+    fleet.set_node("node-a", 1.0)
+    fleet.set_node("node-b", 1.0)
+    placer.sync_from_fleet(fleet, remove_after_sec=60.0)
+    placed = {result.channel_id: result.node for result in placer.place([get_request(1), get_request(2)])}
+    assert sorted(placed.values()) == ["node-a", "node-b"]
+
+    stale_node = placed[1]
+    fleet.set_node(stale_node, 20.0)
+    placer.sync_from_fleet(fleet, remove_after_sec=60.0)
+    assert placer.get_nodes() == {"node-a": 1, "node-b": 1}
+    assert {result.channel_id for result in placer.get_assignments()} == {1, 2}
+    # Nothing new goes to the stale node, the placed channel stays where it is
+    assert all(result.node != stale_node for result in placer.place([get_request(c) for c in range(3, 6)]))
+    assert placer.place([get_request(1)])[0].node == stale_node
+
+    fleet.set_node(stale_node, 1.0)
+    placer.sync_from_fleet(fleet, remove_after_sec=60.0)
+    assert placer.place([get_request(6)])[0].node == stale_node
+
+
+def test_disconnected_node_is_suspended_then_removed():
+    fleet = FleetStandIn()
+    placer = ClusterPlacer([])
+    fleet.set_node("node-a", 1.0)
+    fleet.set_node("node-b", 1.0)
+    placer.sync_from_fleet(fleet, remove_after_sec=60.0)
+    placed = {result.channel_id: result.node for result in placer.place([get_request(c) for c in range(4)])}
+
+    fleet.set_node("node-b", 2.0, connected=False)
+    placer.sync_from_fleet(fleet, remove_after_sec=60.0)
+    assert placer.get_nodes() == {"node-a": 1, "node-b": 1}
+    assert all(result.node == "node-a" for result in placer.place([get_request(c) for c in range(4, 6)]))
+    # Reconnected within the grace period, its channels are still there
+    fleet.set_node("node-b", 1.0)
+    placer.sync_from_fleet(fleet, remove_after_sec=60.0)
+    assert {result.channel_id: result.node for result in placer.get_assignments() if result.channel_id < 4} == placed
+
+    fleet.set_node("node-a", 61.0, connected=False)
+    placer.sync_from_fleet(fleet, remove_after_sec=60.0)
+    assert placer.get_nodes() == {"node-b": 1}
+    assert all(result.node == "node-b" for result in placer.get_assignments())
+
+
+def test_servers_do_not_create_the_channel_manager(tmp_path, monkeypatch):
+    # The manager polls the GPUs and writes its model list to the working directory
+    monkeypatch.chdir(tmp_path)
+    config = CheckCudaConfig()
+    aggregator = main.create_fleet_aggregator(config)
+    server = main.create_placement_server(config, SystemInfo(host_name="node-a", os="Linux", cpu=CpuInfo()), aggregator)
+    assert ChannelGpuManager._instance is None
+    assert os.listdir(tmp_path) == []
+    # The default limits of the manager
+    assert [server.placer.engine.get_limit(NnModelInfo(p, 416, 416)).max_channel for p in (75, 76)] == [2, 3]
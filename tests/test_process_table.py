@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+import psutil
+
+from check_cuda.process_table import ProcessTable
+
+
+def get_table():
+    table = ProcessTable.__wrapped__()
+    table.SCAN_INTERVAL_SEC = 3600.0
+    return table
+
+
+def get_name():
+    return ProcessTable.__wrapped__().get_entry(psutil.Process(os.getpid())).name
+
+
+def test_find_reuses_the_last_scan(monkeypatch):
+    table = get_table()
+    assert os.getpid() in [process.pid for process in table.find(get_name())]
+    calls = []
+    monkeypatch.setattr(psutil, "pids", lambda: calls.append(1) or [])
+    for _ in range(3):
+        assert os.getpid() in [process.pid for process in table.find(get_name())]
+    assert calls == []
+
+
+def test_scan_finds_new_and_evicts_dead_processes():
+    table = get_table()
+    name = get_name()
+    table.find(name)
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        # Not before the next scan
+        assert child.pid not in [process.pid for process in table.find(name)]
+        table.scan()
+        assert child.pid in [process.pid for process in table.find(name)]
+    finally:
+        child.kill()
+        child.wait()
+    assert table.evict_dead_if_due() == 0
+    table.scan()
+    assert child.pid not in [process.pid for process in table.find(name)]
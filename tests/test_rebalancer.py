@@ -0,0 +1,50 @@
+import pytest
+
+from check_cuda import backends
+from check_cuda.controllers import ChannelGpuManager
+from check_cuda.models import ChannelAndNnModel, GpuStatus, NnModelInfo, RebalancerConfig
+from check_cuda.rebalancer import REBALANCE, ChannelRebalancer
+
+CHANNEL = ChannelAndNnModel(1, NnModelInfo(75, 416, 416))
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    # The manager writes its default model list to the working directory
+    monkeypatch.chdir(tmp_path)
+    backends.use_simulation(backends.Simulation(number_of_gpus=2, seed=1, processes_per_gpu=0))
+    m = ChannelGpuManager.__wrapped__()
+    assert m.assign(CHANNEL).gpu_id == 0
+    return m
+
+
+def get_gpu_status():
+    return [
+        GpuStatus(index=0, utilization_gpu=100, memory_used=1000, memory_total=16000),
+        GpuStatus(index=1, utilization_gpu=0, memory_used=1000, memory_total=16000)
+    ]
+
+
+def get_rebalancer(manager, **kwargs):
+    config = RebalancerConfig(enabled=True, sustain_intervals=1)
+    return ChannelRebalancer(manager, config, get_gpu_status, **kwargs)
+
+
+def test_without_on_migrate_only_reports(manager):
+    events = []
+    rebalancer = get_rebalancer(manager, on_event=events.append)
+    assert rebalancer.rebalance_once() == 1
+    assert manager.channel_to_gpu_map[CHANNEL].gpu_id == 0
+    assert manager.placement_engine.budgets[1].channels == 0
+    assert [(e.event_type, e.gpu_index, e.data) for e in events] == [(REBALANCE, 0, 1)]
+    # The suggestion is not repeated during the cooldown
+    assert rebalancer.rebalance_once() == 0
+
+
+def test_on_migrate_moves_the_channel(manager):
+    migrations = []
+    rebalancer = get_rebalancer(manager, on_migrate=lambda *args: migrations.append(args))
+    assert rebalancer.rebalance_once() == 1
+    assert migrations == [(CHANNEL, 0, 1)]
+    assert manager.channel_to_gpu_map[CHANNEL].gpu_id == 1
+    assert manager.placement_engine.budgets[1].channels == 1
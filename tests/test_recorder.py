@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+
+from check_cuda.models import CpuStatus, GpuEvent, GpuStatus, SystemStatus
+from check_cuda.recorder import (BinaryRecorder, get_events_paths, get_record_dtype, get_segment_paths, load_events,
+                                 load_history)
+
+
+def get_system_status(number_of_gpus=1, utilization_gpu=30):
+    return SystemStatus(cpu=CpuStatus(cpu_percent=12.5, cpu_memory_usage_percent=40.0),
+                        gpus=[
+                            GpuStatus(index=i, utilization_gpu=utilization_gpu, memory_used=1000, memory_total=16000)
+                            for i in range(number_of_gpus)
+                        ])
+
+
+def record(recorder, timestamps, number_of_gpus=1):
+    for timestamp in timestamps:
+        recorder.append(timestamp, get_system_status(number_of_gpus, utilization_gpu=timestamp % 100))
+
+
+def test_segments_roll_over_and_load_back(tmp_path):
+    recorder = BinaryRecorder(str(tmp_path), records_per_segment=3, flush_every=1)
+    record(recorder, range(1000, 8000, 1000))
+    recorder.close()
+    assert [os.path.basename(p) for p in get_segment_paths(str(tmp_path))] == [
+        "samples_1000.bin", "samples_4000.bin", "samples_7000.bin"
+    ]
+    history = load_history(str(tmp_path))
+    assert history["timestamp"].tolist() == list(range(1000, 8000, 1000))
+    assert history["cpu.cpu_percent"].tolist() == [12.5] * 7
+    assert history["gpu0.memory_used"].tolist() == [1000.0] * 7
+
+
+def test_load_history_window_and_new_gpus(tmp_path):
+    recorder = BinaryRecorder(str(tmp_path), flush_every=1)
+    record(recorder, (1000, 2000))
+    # A GPU more starts a new segment, the earlier records have no values for it
+    record(recorder, (3000, 4000), number_of_gpus=2)
+    recorder.close()
+    assert len(get_segment_paths(str(tmp_path))) == 2
+    history = load_history(str(tmp_path), since=2000, until=4000)
+    assert history["timestamp"].tolist() == [2000, 3000]
+    assert np.isnan(history["gpu1.memory_used"][0])
+    assert history["gpu1.memory_used"][1] == 1000.0
+
+
+def test_partial_last_record_is_ignored(tmp_path):
+    recorder = BinaryRecorder(str(tmp_path), flush_every=1)
+    record(recorder, (1000, 2000))
+    recorder.close()
+    with open(get_segment_paths(str(tmp_path))[0], "ab") as outfile:
+        outfile.write(b"\0" * 5)
+    assert load_history(str(tmp_path))["timestamp"].tolist() == [1000, 2000]
+
+
+def test_max_segments(tmp_path):
+    recorder = BinaryRecorder(str(tmp_path), records_per_segment=2, max_segments=2, flush_every=1)
+    record(recorder, range(1000, 11000, 1000))
+    recorder.close()
+    assert [os.path.basename(p) for p in get_segment_paths(str(tmp_path))] == ["samples_7000.bin", "samples_9000.bin"]
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".json")) == [
+        "samples_7000.json", "samples_9000.json"
+    ]
+    assert load_history(str(tmp_path))["timestamp"].tolist() == list(range(7000, 11000, 1000))
+
+
+def test_max_bytes_keeps_the_newest_segment(tmp_path):
+    record_size = get_record_dtype(1).itemsize
+    recorder = BinaryRecorder(str(tmp_path), records_per_segment=2, max_bytes=3 * record_size, flush_every=1)
+    record(recorder, range(1000, 7000, 1000))
+    recorder.close()
+    # Pruned when a segment is started, the full segments before 5000 were over the limit
+    assert [os.path.basename(p) for p in get_segment_paths(str(tmp_path))] == ["samples_3000.bin", "samples_5000.bin"]
+    # The newest segment is kept whatever its size
+    recorder = BinaryRecorder(str(tmp_path), records_per_segment=10, max_bytes=1, flush_every=1)
+    record(recorder, (8000, 9000))
+    recorder.close()
+    assert load_history(str(tmp_path))["timestamp"].tolist() == [8000, 9000]
+
+
+def test_min_interval_skips_fast_samples(tmp_path):
+    recorder = BinaryRecorder(str(tmp_path), min_interval_sec=1.0, flush_every=1)
+    record(recorder, (1000, 1100, 1900, 2000, 2500, 3100))
+    recorder.close()
+    assert load_history(str(tmp_path))["timestamp"].tolist() == [1000, 2000, 3100]
+
+
+def test_events_rotate_with_the_segment_limits(tmp_path):
+    recorder = BinaryRecorder(str(tmp_path), records_per_segment=2, max_segments=2)
+    for timestamp in range(1000, 8000, 1000):
+        recorder.on_event(GpuEvent(timestamp=timestamp, gpu_index=0, event_type="xid", data=timestamp))
+    # Written through without closing the recorder
+    assert [event.timestamp for event in load_events(str(tmp_path), since=5000)] == [5000, 6000, 7000]
+    recorder.close()
+    assert [os.path.basename(p) for p in get_events_paths(str(tmp_path))] == ["events_5000.jsonl", "events_7000.jsonl"]
+    assert get_segment_paths(str(tmp_path)) == []
@@ -0,0 +1,45 @@
+from check_cuda.models import CpuStatus, GpuStatus, SamplingConfig, SystemStatus
+from check_cuda.sampling import AdaptiveInterval
+
+HOT = SystemStatus(cpu=CpuStatus(), gpus=[GpuStatus(index=0, utilization_gpu=95.0, memory_used=1000,
+                                                    memory_total=16000)])
+
+
+def run(config, full_cost_sec, fast_cost_sec, seconds=60.0):
+    """
+    The schedule of LogCpuGpuUsage with adaptive sampling, returns the full and fast sample counts and the share of
+    the wall time spent sampling
+    """
+    interval = AdaptiveInterval(config)
+    interval.update(HOT, full_cost_sec)
+    now = last_full = spent = 0.0
+    full = fast = 0
+    while now < seconds:
+        now += interval.get_next_interval(now - last_full)
+        is_full = interval.is_full_due(now - last_full)
+        cost_sec = full_cost_sec if is_full else fast_cost_sec
+        if is_full:
+            full += 1
+            last_full = now
+        else:
+            fast += 1
+        interval.update(HOT, cost_sec, is_full)
+        now += cost_sec
+        spent += cost_sec
+    return full, fast, spent / now
+
+
+def test_fast_samples_get_what_the_full_ones_leave():
+    config = SamplingConfig(adaptive=True, interval_sec=1.0, min_interval_sec=0.1, overhead_budget=0.02)
+    full, fast, overhead = run(config, full_cost_sec=0.009, fast_cost_sec=0.0015)
+    assert overhead <= 0.02
+    assert full >= 59
+    # Flooring each kind of sample with the whole budget would spend 2.25 % here
+    assert fast > 5 * full
+
+
+def test_no_fast_samples_when_full_ones_use_the_budget():
+    config = SamplingConfig(adaptive=True, interval_sec=1.0, min_interval_sec=0.1, overhead_budget=0.02)
+    full, fast, overhead = run(config, full_cost_sec=0.03, fast_cost_sec=0.0015)
+    assert fast == 0
+    assert overhead <= 0.02
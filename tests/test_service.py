@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from check_cuda import backends, log_cpu_gpu_usage
+from check_cuda.log_cpu_gpu_usage import LogCpuGpuUsage
+from check_cuda.models import CpuInfo, SamplingConfig, SystemInfo
+from check_cuda.pipeline import SampleSink
+from check_cuda.service import CheckCudaService
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class SinkStandIn(SampleSink):
+
+    def __init__(self):
+        self.timestamps = []
+        self.is_closed = False
+
+    def on_sample(self, timestamp, system_status):
+        self.timestamps.append(timestamp)
+
+    def close(self):
+        self.is_closed = True
+
+
+@pytest.fixture
+def service(monkeypatch):
+    backends.use_simulation(backends.Simulation(number_of_gpus=2, seed=1, processes_per_gpu=0))
+    # The cached system info lives in the session folder
+    monkeypatch.setattr(log_cpu_gpu_usage.system_info_cache, "get_system_info",
+                        lambda: SystemInfo(host_name="node-a", os="Linux", cpu=CpuInfo()))
+    return CheckCudaService(LogCpuGpuUsage(sampling=SamplingConfig(interval_sec=0.05)))
+
+
+def test_run_until_stopped(service):
+    sink = SinkStandIn()
+    service.add_sink(sink)
+    cancelled = threading.Event()
+
+    async def task():
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    service.add_task(task)
+    thread = threading.Thread(target=asyncio.run, args=(service.run(), ))
+    thread.start()
+    try:
+        assert wait_for(lambda: len(sink.timestamps) >= 3)
+        assert not sink.is_closed
+    finally:
+        service.stop()
+        thread.join(5.0)
+    assert not thread.is_alive()
+    assert cancelled.is_set()
+    assert sink.is_closed
+    assert sink.timestamps == sorted(sink.timestamps)
+
+
+def test_stop_before_run(service):
+    sink = SinkStandIn()
+    service.add_sink(sink)
+    service.stop()
+    asyncio.run(asyncio.wait_for(service.run(), 5.0))
+    # The first sample is taken before the stop is seen
+    assert len(sink.timestamps) == 1
+    assert sink.is_closed
@@ -0,0 +1,76 @@
+import pytest
+
+from check_cuda.models import CpuStatus, GpuStatus, ProcessStatus, SystemStatus
+from check_cuda.streaming import DeltaDecoder, DeltaEncoder, is_heartbeat
+
+
+def get_system_status(utilization_gpu=30.0, cpu_percent=12.5, pids=(1234, )):
+    return SystemStatus(cpu=CpuStatus(cpu_percent=cpu_percent, cpu_memory_usage_percent=40.0),
+                        gpus=[
+                            GpuStatus(index=i, utilization_gpu=utilization_gpu, memory_used=1000, memory_total=16000)
+                            for i in range(2)
+                        ],
+                        processes=[ProcessStatus(pid=pid, command="python", gpu_id=0, cpu_percent=3.0) for pid in pids])
+
+
+def test_full_then_deltas_rebuild_the_status():
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    first = encoder.encode(1000, get_system_status())
+    assert first["type"] == "full"
+    assert decoder.apply(first) == get_system_status()
+    message = encoder.encode(2000, get_system_status(utilization_gpu=80.0))
+    assert message == {"type": "delta", "seq": 1, "timestamp": 2000, "gpus": {"0": {"utilizationGpu": 80.0},
+                                                                            "1": {"utilizationGpu": 80.0}}}
+    assert decoder.apply(message) == get_system_status(utilization_gpu=80.0)
+
+
+def test_changes_under_the_deadband_add_up():
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    decoder.apply(encoder.encode(1000, get_system_status(cpu_percent=10.0)))
+    assert encoder.encode(2000, get_system_status(cpu_percent=10.6)) is None
+    # 0.6 + 0.6 is past the 1.0 deadband of the value last sent
+    message = encoder.encode(3000, get_system_status(cpu_percent=11.2))
+    assert message["cpu"] == {"cpuPercent": 11.2}
+    assert decoder.apply(message).cpu.cpu_percent == 11.2
+
+
+def test_process_added_and_removed():
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    decoder.apply(encoder.encode(1000, get_system_status(pids=(1234, ))))
+    message = encoder.encode(2000, get_system_status(pids=(1234, 4321)))
+    assert list(message["processes"]) == ["4321:0"]
+    assert decoder.apply(message) == get_system_status(pids=(1234, 4321))
+    message = encoder.encode(3000, get_system_status(pids=(4321, )))
+    assert message["removedProcesses"] == ["1234:0"]
+    assert decoder.apply(message) == get_system_status(pids=(4321, ))
+
+
+def test_seq_gap_needs_a_full_snapshot():
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    decoder.apply(encoder.encode(1000, get_system_status()))
+    encoder.encode(2000, get_system_status(utilization_gpu=50.0))
+    with pytest.raises(ValueError):
+        decoder.apply(encoder.encode(3000, get_system_status(utilization_gpu=70.0)))
+    encoder.reset()
+    message = encoder.encode(4000, get_system_status(utilization_gpu=90.0))
+    assert message["type"] == "full"
+    assert decoder.apply(message) == get_system_status(utilization_gpu=90.0)
+    message = encoder.encode(5000, get_system_status(utilization_gpu=20.0))
+    assert decoder.apply(message) == get_system_status(utilization_gpu=20.0)
+
+
+def test_heartbeat():
+    encoder, decoder, missed = DeltaEncoder(), DeltaDecoder(), DeltaDecoder()
+    assert encoder.heartbeat(500) is None
+    first = encoder.encode(1000, get_system_status())
+    decoder.apply(first)
+    missed.apply(first)
+    message = encoder.heartbeat(2000)
+    assert is_heartbeat(message)
+    assert decoder.apply(message) == get_system_status()
+    message = encoder.encode(3000, get_system_status(utilization_gpu=80.0))
+    assert not is_heartbeat(message)
+    assert decoder.apply(message) == get_system_status(utilization_gpu=80.0)
+    # The heartbeat takes a seq like any delta
+    with pytest.raises(ValueError):
+        missed.apply(message)